@@ -0,0 +1,143 @@
+# bounded_cache.py
+# Ограниченный кэш в памяти для инвентарей и профилей: лимит по числу записей
+# и по оценке занимаемой памяти, вытеснение LRU и устаревание по TTL.
+# После вытеснения значение просто перечитывается из S3 при следующем промахе.
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Optional
+
+
+class BoundedCache(MutableMapping):
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizer: Callable[[object], int] = lambda value: 1,
+        is_pinned: Callable[[str], bool] = lambda key: False,
+    ):
+        # is_pinned(key) — запись нельзя вытеснять (например, ещё не записана в S3)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._sizer = sizer
+        self._is_pinned = is_pinned
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _expired(self, entry) -> bool:
+        return entry[2] is not None and entry[2] <= time.monotonic()
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+    def _lookup(self, key):
+        # Запись или None; устаревшая запись удаляется, если её можно удалить
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry) and not self._is_pinned(key):
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                raise KeyError(key)
+            return entry[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def __setitem__(self, key, value):
+        size = self._sizer(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, size, expires_at)
+            self.bytes += size
+            self._evict(keep=key)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def _over_budget(self) -> bool:
+        if len(self._data) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    def _evict(self, keep):
+        # Самые давние записи — первыми; закреплённые переносим в конец очереди.
+        # Только что записанный ключ не трогаем, даже если он один больше бюджета.
+        checked = 0
+        while self._over_budget() and checked < len(self._data):
+            key = next(iter(self._data))
+            checked += 1
+            if key == keep or self._is_pinned(key):
+                self._data.move_to_end(key)
+                continue
+            self._drop(key)
+            self.evictions += 1
+
+    def invalidate(self, key) -> bool:
+        # Сброс по сообщению от другого воркера; закреплённую запись не трогаем
+        with self._lock:
+            if key not in self._data or self._is_pinned(key):
+                return False
+            self._drop(key)
+            self.invalidations += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
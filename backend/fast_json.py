@@ -0,0 +1,54 @@
+# fast_json.py
+# Быстрая сериализация JSON через orjson (если установлен, иначе — стандартный json)
+# и класс ответа для всего приложения. Результат — сразу bytes в UTF-8,
+# без промежуточной строки.
+import hashlib
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # без orjson работаем на стандартном json
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def content_etag(body: bytes) -> str:
+    # Сильный ETag по содержимому: у всех воркеров для одних данных он одинаковый
+    return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+def join_array(bodies) -> bytes:
+    # Массив из уже сериализованных элементов — без повторного разбора
+    return b"[" + b",".join(bodies) + b"]"
+
+
+async def ndjson_chunks(lines, chunk_bytes: int = 64 * 1024):
+    # Строки NDJSON (bytes без перевода строки) → куски примерно по chunk_bytes:
+    # меньше вызовов send, а в памяти не больше одного куска
+    buffer = bytearray()
+    async for line in lines:
+        buffer += line
+        buffer += b"\n"
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
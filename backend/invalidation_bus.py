@@ -0,0 +1,199 @@
+# invalidation_bus.py
+# Канал инвалидации для нескольких воркеров/узлов: после записи в S3 воркер
+# публикует (kind, key), остальные сбрасывают свою копию из кэша в памяти.
+# Источник правды — по-прежнему S3 (условные записи), канал лишь сокращает
+# время, в течение которого другой воркер отдаёт устаревшие данные.
+#
+#   SHARED_STATE_BUS=            — один процесс, ничего не рассылаем
+#   SHARED_STATE_BUS=unix:///dir — воркеры одного узла, датаграммы через UNIX-сокеты
+#   SHARED_STATE_BUS=redis://... — несколько узлов, Redis PUBLISH/SUBSCRIBE
+import json
+import os
+import socket
+import threading
+import uuid
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+
+class InvalidationBus:
+    # Без канала: публикация ничего не делает (один воркер)
+    kind = "local"
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self._handler: Optional[Callable] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, handler: Callable[[str, object], None]):
+        # handler(kind, key) вызывается в потоке приёма
+        self._handler = handler
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def publish(self, kind: str, key=None):
+        if self._handler is None:
+            return
+        data = json.dumps({"origin": self.origin, "kind": kind, "key": key}).encode("utf-8")
+        try:
+            self._send(data)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Ошибка рассылки инвалидации {kind} {key}: {e}")
+
+    def _send(self, data: bytes):
+        pass
+
+    def _listen(self, receive: Callable[[], Optional[bytes]]):
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.is_set():
+                try:
+                    data = receive()
+                except Exception as e:
+                    if self._stopped.is_set():
+                        break
+                    self.errors += 1
+                    print(f"❌ Ошибка приёма инвалидации: {e}")
+                    continue
+                if data:
+                    self._deliver(data)
+
+        self._thread = threading.Thread(target=run, name=f"invalidation-{self.kind}", daemon=True)
+        self._thread.start()
+
+    def _deliver(self, data: bytes):
+        try:
+            message = json.loads(data)
+            if message["origin"] == self.origin:
+                return  # своё сообщение (Redis рассылает и отправителю)
+            self.received += 1
+            self._handler(message["kind"], message["key"])
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ Ошибка обработки инвалидации: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "bus": self.kind,
+            "origin": self.origin,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+class UnixSocketBus(InvalidationBus):
+    # Каждый воркер слушает свой сокет {dir}/{origin}.sock; рассылка — по всем
+    # сокетам каталога. Сокеты умерших воркеров удаляются при первой же рассылке.
+    kind = "unix"
+
+    def __init__(self, directory: str, send_timeout: float = 1.0):
+        super().__init__()
+        self.directory = directory
+        self.send_timeout = send_timeout
+        self.path = os.path.join(directory, f"{self.origin}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+
+    def start(self, handler):
+        super().start(handler)
+        os.makedirs(self.directory, exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.settimeout(0.5)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(self.send_timeout)
+
+        def receive():
+            try:
+                return self._sock.recv(65536)
+            except socket.timeout:
+                return None
+
+        self._listen(receive)
+
+    def stop(self):
+        super().stop()
+        for sock in (self._sock, self._sender):
+            if sock is not None:
+                sock.close()
+        self._sock = self._sender = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _send(self, data: bytes):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or path == self.path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Воркер завершился, не убрав сокет
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except socket.timeout:
+                # Очередь получателя переполнена: его копия устареет не дольше USER_CACHE_TTL
+                self.dropped += 1
+
+
+class RedisBus(InvalidationBus):
+    kind = "redis"
+
+    def __init__(self, url: str, channel: str = "gamegems:invalidate"):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Для SHARED_STATE_BUS=redis://... нужен пакет redis")
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+
+    def start(self, handler):
+        super().start(handler)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+        def receive():
+            message = self._pubsub.get_message(timeout=0.5)
+            return message["data"] if message else None
+
+        self._listen(receive)
+
+    def stop(self):
+        super().stop()
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _send(self, data: bytes):
+        self._client.publish(self.channel, data)
+
+
+def make_bus(url: Optional[str]) -> InvalidationBus:
+    if not url or url == "local":
+        return InvalidationBus()
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return UnixSocketBus(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBus(url)
+    raise ValueError(f"Неизвестный SHARED_STATE_BUS: {url}")
@@ -0,0 +1,189 @@
+# inventory_log.py
+# Инвентарь игрока с индексом по id и журналом изменений.
+# Каждое изменение — одна операция в открытом сегменте журнала
+# (inventory_log/{address}/{номер}.json), то есть O(1) работы и O(предмет) байт.
+# Время от времени журнал сворачивается в снимок inventories/{address}.json.
+#
+# Несколько воркеров: сегмент создаётся условной записью (If-None-Match: *).
+# Если номер уже занят, чужие операции применяются раньше наших, а наши
+# незаписанные сегменты сдвигаются на следующие свободные номера.
+import json
+import threading
+from typing import Callable, Iterable, List, Optional
+
+try:
+    from .fast_json import content_etag, join_array
+except ImportError:  # запуск из папки backend/
+    from fast_json import content_etag, join_array
+
+
+class LogSegment:
+    __slots__ = ("number", "ops", "closed", "written", "_owner")
+
+    def __init__(self, number: int, owner: "Inventory"):
+        self.number = number
+        self.ops = []
+        self.closed = False
+        self.written = False
+        self._owner = owner
+
+    def serialize(self) -> str:
+        # Вызывается при записи в S3: после этого новые операции идут в следующий сегмент
+        with self._owner.lock:
+            self.closed = True
+            return json.dumps(self.ops, ensure_ascii=False)
+
+
+class Inventory:
+    def __init__(self, items: Iterable = (), snapshot_seq: int = 0, snapshot_etag: Optional[str] = None):
+        self.items = {item.id: item for item in items}  # порядок добавления сохраняется
+        self.lock = threading.Lock()
+        # Сегменты одного игрока пишутся строго по порядку, по одному
+        self.write_lock = threading.Lock()
+        self.snapshot_seq = snapshot_seq  # последний сегмент, вошедший в снимок
+        self.snapshot_etag = snapshot_etag
+        self.next_segment = snapshot_seq + 1
+        self.segments_since_snapshot = 0
+        self.ops_since_snapshot = 0
+        self._open: Optional[LogSegment] = None
+        self._unwritten: List[LogSegment] = []
+        self._body: Optional[bytes] = None  # готовый JSON списка предметов
+        self._etag: Optional[str] = None
+        self._encoded = {}  # id -> (предмет, его JSON)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def to_list(self) -> list:
+        with self.lock:
+            return list(self.items.values())
+
+    def to_json(self) -> bytes:
+        return self.json_with_etag()[1]
+
+    def json_with_etag(self):
+        # (ETag, тело) GET /inventory: собираем один раз до следующего изменения,
+        # из JSON отдельных предметов — сериализуются только новые
+        with self.lock:
+            if self._body is None:
+                encoded = {}
+                for item_id, item in self.items.items():
+                    cached = self._encoded.get(item_id)
+                    if cached is None or cached[0] is not item:
+                        cached = (item, item.model_dump_json().encode("utf-8"))
+                    encoded[item_id] = cached
+                self._encoded = encoded
+                self._body = join_array(body for _, body in encoded.values())
+                self._etag = content_etag(self._body)
+            return self._etag, self._body
+
+    # === Изменения ===
+    def add(self, item) -> LogSegment:
+        with self.lock:
+            self.items[item.id] = item
+            return self._record({"op": "add", "item": item.model_dump()})
+
+    def remove(self, item_id: str) -> Optional[LogSegment]:
+        # None — предмета нет, журнал не меняется
+        with self.lock:
+            if self.items.pop(item_id, None) is None:
+                return None
+            return self._record({"op": "remove", "id": item_id})
+
+    def apply_changes(self, adds: list, removes: List[str]) -> Optional[LogSegment]:
+        # Пакет изменений — все операции в одном сегменте журнала (одна запись в S3)
+        with self.lock:
+            segment = None
+            for item_id in removes:
+                del self.items[item_id]
+                segment = self._record({"op": "remove", "id": item_id})
+            for item in adds:
+                self.items[item.id] = item
+                segment = self._record({"op": "add", "item": item.model_dump()})
+            return segment
+
+    def _record(self, op: dict) -> LogSegment:
+        self._body = None
+        segment = self._open
+        if segment is None or segment.closed:
+            segment = self._open = LogSegment(self.next_segment, self)
+            self._unwritten.append(segment)
+            self.next_segment += 1
+            self.segments_since_snapshot += 1
+        segment.ops.append(op)
+        self.ops_since_snapshot += 1
+        return segment
+
+    def apply(self, ops: List[dict], item_factory: Callable):
+        # Повтор журнала идемпотентен: побеждает последняя операция по каждому id
+        self._body = None
+        for op in ops:
+            if op["op"] == "add":
+                item = item_factory(op["item"])
+                self.items[item.id] = item
+            elif op["op"] == "remove":
+                self.items.pop(op["id"], None)
+
+    # === Запись журнала ===
+    def pending_through(self, segment: LogSegment) -> List[LogSegment]:
+        # Незаписанные сегменты до segment включительно — в порядке записи
+        with self.lock:
+            return [s for s in self._unwritten if s.number <= segment.number]
+
+    def mark_written(self, segment: LogSegment):
+        with self.lock:
+            segment.written = True
+            self._unwritten.remove(segment)
+
+    def rebase(self, foreign: List[List[dict]], item_factory: Callable):
+        # Номера заняты другими воркерами: их операции идут раньше наших
+        # незаписанных, которые переносим на следующие свободные номера
+        with self.lock:
+            for ops in foreign:
+                self.apply(ops, item_factory)
+                self.ops_since_snapshot += len(ops)
+            for segment in self._unwritten:
+                self.apply(segment.ops, item_factory)
+                segment.number += len(foreign)
+            self.next_segment += len(foreign)
+            self.segments_since_snapshot += len(foreign)
+
+    # === Свёртка журнала ===
+    def start_compaction(self, seq: int):
+        # Счётчики — только по сегментам, которые в снимок seq не входят
+        with self.lock:
+            self.segments_since_snapshot = sum(1 for s in self._unwritten if s.number > seq)
+            self.ops_since_snapshot = sum(len(s.ops) for s in self._unwritten if s.number > seq)
+
+    def serialize_snapshot(self, seq: int) -> str:
+        # Снимок может включать и более поздние операции: при загрузке
+        # их повтор поверх снимка ничего не меняет
+        with self.lock:
+            items = [item.model_dump() for item in self.items.values()]
+        return json.dumps({"seq": seq, "items": items}, ensure_ascii=False)
+
+
+def parse_snapshot(data: Optional[bytes]):
+    # (предметы, seq); старый формат — просто список предметов
+    if data is None:
+        return [], 0
+    snapshot = json.loads(data)
+    if isinstance(snapshot, list):
+        return snapshot, 0
+    return snapshot["items"], snapshot["seq"]
+
+
+def segment_number(key: str) -> Optional[int]:
+    name = key.rsplit("/", 1)[-1]
+    if not name.endswith(".json"):
+        return None
+    try:
+        return int(name[:-5])
+    except ValueError:
+        return None
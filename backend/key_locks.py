@@ -0,0 +1,21 @@
+# key_locks.py
+# Блокировки по ключу (адресу игрока) с разбиением на полосы: фиксированный
+# набор asyncio.Lock, ключ попадает в полосу по хэшу. Память не растёт с числом
+# игроков; два адреса в одной полосе просто ждут друг друга.
+import asyncio
+import zlib
+
+
+class KeyLocks:
+    def __init__(self, stripes: int = 1024):
+        self.stripes = stripes
+        self._locks = None
+        self._loop = None
+
+    def __call__(self, key: str) -> asyncio.Lock:
+        # Блокировки привязаны к циклу событий: в новом цикле — новый набор
+        loop = asyncio.get_running_loop()
+        if self._locks is None or self._loop is not loop:
+            self._locks = [asyncio.Lock() for _ in range(self.stripes)]
+            self._loop = loop
+        return self._locks[zlib.crc32(key.lower().encode("utf-8")) % self.stripes]
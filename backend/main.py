@@ -1,46 +1,228 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing import List, Optional
-import boto3
-import requests
+from botocore.exceptions import ClientError
 import os
-import pandas as pd
+import asyncio
+import itertools
+import time
+from collections import Counter, deque
+import threading
 import uuid
 import json
-import joblib
 from dotenv import load_dotenv
 
+try:
+    from .price_cache import PredictionCache
+    from .model_registry import ModelRegistry, ModelVersion
+    from .write_back import WriteBackBuffer
+    from .bounded_cache import BoundedCache
+    from .storage import WriteConflict, conflict_backoff, is_conflict
+    from .tiered_storage import make_storage
+    from .fast_json import FastJSONResponse, content_etag, dumps, join_array, loads, ndjson_chunks
+    from .invalidation_bus import make_bus
+    from .key_locks import KeyLocks
+    from .nft_catalog import NFTCatalog
+    from .sell_price_config import SellPriceConfig
+    from .single_flight import SingleFlight
+    from .inventory_log import Inventory, parse_snapshot, segment_number
+    from .metadata_proxy import MetadataProxy, MetadataProxyError
+    from .metrics import MetricsMiddleware, MetricsRegistry, S3Metrics, record_section
+except ImportError:  # запуск из папки backend/: uvicorn main:app
+    from price_cache import PredictionCache
+    from model_registry import ModelRegistry, ModelVersion
+    from write_back import WriteBackBuffer
+    from bounded_cache import BoundedCache
+    from storage import WriteConflict, conflict_backoff, is_conflict
+    from tiered_storage import make_storage
+    from fast_json import FastJSONResponse, content_etag, dumps, join_array, loads, ndjson_chunks
+    from invalidation_bus import make_bus
+    from key_locks import KeyLocks
+    from nft_catalog import NFTCatalog
+    from sell_price_config import SellPriceConfig
+    from single_flight import SingleFlight
+    from inventory_log import Inventory, parse_snapshot, segment_number
+    from metadata_proxy import MetadataProxy, MetadataProxyError
+    from metrics import MetricsMiddleware, MetricsRegistry, S3Metrics, record_section
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Строим путь к модели и словарю
 MODEL_PATH = os.path.join(BASE_DIR, "..", "ml_model", "nft_price_regressor.pkl")
+# Экспорт модели в NumPy-массивы (ml_model/export_model.py)
+ARRAY_MODEL_PATH = os.path.join(BASE_DIR, "..", "ml_model", "nft_price_regressor.npz")
+# "array" — скорер на NumPy, "sklearn" — исходный пайплайн через pandas
+PRICE_MODEL_BACKEND = os.getenv("PRICE_MODEL_BACKEND", "array")
+
+
+# === Метрики (GET /metrics, формат Prometheus) ===
+metrics_registry = MetricsRegistry()
+s3_metrics = S3Metrics(metrics_registry)
+request_duration = metrics_registry.histogram(
+    "gamegems_http_request_duration_seconds", "Задержка запросов по маршруту", ("method", "route", "status"),
+)
+model_inference = metrics_registry.histogram(
+    "gamegems_model_inference_seconds", "Время вызова модели цены на промахах кэша", ("backend",),
+)
+model_inference_rows = metrics_registry.counter(
+    "gamegems_model_inference_rows_total", "Строки, посчитанные моделью цены", ("backend",),
+)
+# SERVER_TIMING=1 — заголовок Server-Timing с разбивкой времени запроса (s3, model, app)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Кэш предсказаний: ключ (версия модели, itemType, rarity, bonusValue)
+prediction_cache = PredictionCache(maxsize=int(os.getenv("PRICE_CACHE_SIZE", "4096")))
+
+# Известные типы и редкости предметов (как в src/utils/itemGenerator.js)
+KNOWN_ITEM_TYPES = ["Boots", "Gloves", "Lamp", "Pickaxe", "Vest"]
+KNOWN_RARITIES = ["Common", "Rare", "Epic", "Legendary"]
+MAX_KNOWN_BONUS = 35  # максимум flatPowerBonus у Legendary Pickaxe
+
+def read_price_model() -> ModelVersion:
+    # Скорер (и NumPy) импортируются с первой загрузкой модели, а не с импортом main
+    try:
+        from .price_scorer import ArrayPriceModel, SklearnPriceModel, file_sha256
+    except ImportError:  # запуск из папки backend/
+        from price_scorer import ArrayPriceModel, SklearnPriceModel, file_sha256
+    # Версия — хэш исходного .pkl, общий для NumPy-экспорта и sklearn-пайплайна
+    version = file_sha256(MODEL_PATH)[:12]
+    if PRICE_MODEL_BACKEND == "array" and os.path.exists(ARRAY_MODEL_PATH):
+        model = ArrayPriceModel.load(ARRAY_MODEL_PATH)
+        if model.source_sha256[:12] == version:
+            return ModelVersion(version, model, ARRAY_MODEL_PATH)
+        print("⚠️ nft_price_regressor.npz устарел, запусти ml_model/export_model.py")
+    return ModelVersion(version, SklearnPriceModel.load(MODEL_PATH), MODEL_PATH)
+
+def on_model_swap(active: ModelVersion):
+    # Записи старой версии уже не совпадут по ключу — просто освобождаем память
+    prediction_cache.clear()
+    print(f"🧠 Активная модель цены: {active.version} ({os.path.basename(active.source)})")
+
+model_registry = ModelRegistry(read_price_model, on_swap=on_model_swap)
+
+# Интервал проверки файла модели на диске (0 — только ручная перезагрузка)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "0"))
+
+def load_price_model():
+    return model_registry.load(force=True).model
+
+# Модель не грузится при импорте: воркер стартует быстро, а загрузку ведёт lifespan.
+#   MODEL_WARMUP=background — модель и кэш предсказаний в фоновом потоке, /ready ждёт конца прогрева
+#   MODEL_WARMUP=sync       — до приёма запросов, как раньше
+#   MODEL_WARMUP=lazy       — при первом запросе цены
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+warmup_done = threading.Event()
+startup_state = {"lifespan": False}
+warmup_state = {"started_at": None, "seconds": None, "error": None}
+
+def warm_up_price_model():
+    warmup_state["started_at"] = time.time()
+    started = time.perf_counter()
+    try:
+        model_registry.ensure()
+        if os.getenv("PRICE_CACHE_PREWARM", "1") == "1":
+            prewarm_prediction_cache()
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        print(f"❌ Ошибка прогрева модели: {e}")
+        return
+    warmup_state["seconds"] = round(time.perf_counter() - started, 3)
+    warmup_done.set()
+
+async def ensure_price_model():
+    # Первый запрос цены до конца прогрева ждёт загрузку в потоке, не блокируя цикл событий
+    if model_registry.active is not None:
+        return
+    try:
+        await asyncio.to_thread(model_registry.ensure)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Модель цены не загружена: {e}")
 
+def model_files_mtime() -> float:
+    paths = [p for p in (MODEL_PATH, ARRAY_MODEL_PATH) if os.path.exists(p)]
+    return max(os.path.getmtime(p) for p in paths)
 
-# Загружаем модель
-price_model = joblib.load(MODEL_PATH)
+async def watch_model_files():
+    # Новая версия на диске → фоновая загрузка и атомарная подмена
+    last_mtime = model_files_mtime()
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_INTERVAL)
+        try:
+            mtime = model_files_mtime()
+        except (OSError, ValueError):
+            continue
+        if mtime != last_mtime:
+            last_mtime = mtime
+            model_registry.load_in_background()
 
 
 # === Загрузка переменных окружения ===
 load_dotenv()
 
+# Размер пула соединений botocore и пула потоков ввода-вывода S3
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "64"))
+
 # === Инициализация S3 клиента ===
-s3 = boto3.client(
-    service_name='s3',
-    endpoint_url=os.getenv("S3_ENDPOINT_URL"),
-    aws_access_key_id=os.getenv("S3_KEY"),
-    aws_secret_access_key=os.getenv("S3_SECRET"),
-)
+# boto3 импортируется и клиент создаётся при первом обращении к бакету (в тестах s3 подменяют)
+s3 = None
+_s3_lock = threading.Lock()
+
+def get_s3_client():
+    global s3
+    if s3 is None:
+        with _s3_lock:
+            if s3 is None:
+                import boto3
+                from botocore.config import Config
+                s3 = boto3.client(
+                    service_name='s3',
+                    endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                    aws_access_key_id=os.getenv("S3_KEY"),
+                    aws_secret_access_key=os.getenv("S3_SECRET"),
+                    config=Config(max_pool_connections=S3_MAX_CONNECTIONS),
+                )
+    return s3
 
 # === Константы путей в бакете ===
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+
+# Все обращения к бакету — через storage; клиент берём из s3 в момент вызова.
+# TIERED_STORAGE_PATH — файл SQLite горячего уровня для инвентарей, профилей и цен
+# (tiered_storage.py); TIERED_WRITE_MODE=through|back, TIERED_TTL — сколько секунд
+# доверять локальной копии в режиме through без проверки в S3;
+# TIERED_MAX_BYTES / TIERED_MAX_ROWS — лимиты файла в режиме through (0 — без лимита)
+storage = make_storage(
+    get_s3_client,
+    BUCKET_NAME,
+    local_path=os.getenv("TIERED_STORAGE_PATH"),
+    write_mode=os.getenv("TIERED_WRITE_MODE", "through"),
+    ttl=float(os.getenv("TIERED_TTL", "60")),
+    max_rows=int(os.getenv("TIERED_MAX_ROWS", "0")),
+    max_bytes=int(os.getenv("TIERED_MAX_BYTES", str(512 * 1024 * 1024))),
+    max_workers=S3_MAX_CONNECTIONS,
+    metrics=s3_metrics,
+)
+# Сколько объектов читаем параллельно при листинге /nft и /profiles
+S3_FETCH_CONCURRENCY = int(os.getenv("S3_FETCH_CONCURRENCY", "32"))
 INVENTORY_PREFIX = "inventories/"
+INVENTORY_LOG_PREFIX = "inventory_log/"
+# Журнал сворачивается в снимок, когда в нём набралось операций на половину
+# инвентаря (не меньше INVENTORY_COMPACT_MIN_OPS) — тогда на изменение в среднем
+# O(предмет) байт, — или INVENTORY_COMPACT_SEGMENTS сегментов (ограничивает чтение при загрузке)
+INVENTORY_COMPACT_MIN_OPS = int(os.getenv("INVENTORY_COMPACT_MIN_OPS", "32"))
+INVENTORY_COMPACT_SEGMENTS = int(os.getenv("INVENTORY_COMPACT_SEGMENTS", "256"))
+# Повторы условной записи при конфликте с другим воркером
+WRITE_CONFLICT_RETRIES = int(os.getenv("WRITE_CONFLICT_RETRIES", "16"))
 PROFILE_PREFIX = "profiles/"
 SELL_PRICES_KEY = "config/sell_prices.json"
 MARKETPLACE_PREFIX = 'marketplace/'
+NFT_PREFIX = "NFT/"
+NFT_CATALOG_KEY = "catalog/nft_catalog.json"
 USER_NFT_PREFIX = 'nft_data/'
 
 
@@ -74,81 +256,462 @@ class Item(BaseModel):
     image: str
     attributes: dict
 
+class MetadataBatchRequest(BaseModel):
+    urls: List[str]
+
+class InventoryBatchRequest(BaseModel):
+    add: List[Item] = []
+    remove: List[str] = []
+
+class MarketplaceListing(BaseModel):
+    tokenId: Optional[int] = None
+    uri: Optional[str] = None
+    price: Optional[float] = None
+    owner: Optional[str] = None
+
+class MarketplaceViewRequest(BaseModel):
+    listings: List[MarketplaceListing]
+
 class Profile(BaseModel):
     address: str
     created_at: Optional[str] = None
     nickname: Optional[str] = None
     local_gems: Optional[int] = 0  # 💎 Добавляем
 
-# === Локальные хранилища в памяти ===
-user_inventory = {}
-user_profiles = {}
-sell_prices = {}
-
-# === Работа с инвентарём ===
-def save_inventory_to_s3(address: str):
-    key = f"{INVENTORY_PREFIX}{address.lower()}.json"
-    data = json.dumps([item.model_dump() for item in user_inventory[address]])
-    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=data)
+    # Синхронизация с S3, в ответы API не попадает: ETag прочитанной версии
+    # и поля, изменённые здесь и ещё не записанные (поле → номер изменения)
+    _etag: Optional[str] = PrivateAttr(default=None)
+    _changes: dict = PrivateAttr(default_factory=dict)
+    _sent: dict = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # Готовое тело GET /profile и его ETag; сбрасываются при изменении полей
+    _body: Optional[bytes] = PrivateAttr(default=None)
+    _body_etag: Optional[str] = PrivateAttr(default=None)
+
+# === Отложенная запись инвентарей и профилей ===
+# Изменения одного ключа за WRITE_BACK_DELAY секунд (или WRITE_BACK_MAX_UPDATES штук)
+# сливаются в одну запись в S3. WRITE_BACK_DELAY=0 — запись сразу.
+write_back = WriteBackBuffer(
+    storage.put_bytes,
+    delay=float(os.getenv("WRITE_BACK_DELAY", "2.0")),
+    max_updates=int(os.getenv("WRITE_BACK_MAX_UPDATES", "20")),
+    flush_workers=int(os.getenv("WRITE_BACK_FLUSH_WORKERS", "8")),
+)
 
-def load_inventory_from_s3(address: str):
-    key = f"{INVENTORY_PREFIX}{address.lower()}.json"
+async def persist(key: str, body, writer=None):
+    if not write_back.mark_dirty(key, body, writer):
+        return
     try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        items = json.loads(response["Body"].read().decode("utf-8"))
-        user_inventory[address.lower()] = [Item(**item) for item in items]
-    except s3.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
-            user_inventory[address.lower()] = []
-        else:
+        await storage.run(write_back.flush, key)
+    except Exception as e:
+        if write_back.delay <= 0:
             raise
+        # Данные остались в буфере — фоновый поток повторит запись
+        print(f"❌ Ошибка записи {key}: {e}")
+
+# Каталог всех NFT в памяти; контрольная точка пишется через тот же буфер записи,
+# раз в NFT_CATALOG_CHECKPOINT_EVERY изменений и при остановке
+nft_catalog = NFTCatalog(
+    storage, NFT_PREFIX, NFT_CATALOG_KEY, persist, S3_FETCH_CONCURRENCY,
+    checkpoint_every=int(os.getenv("NFT_CATALOG_CHECKPOINT_EVERY", "100")),
+)
 
-# === Работа с профилем ===
-def save_profile_to_s3(profile: Profile):
-    key = f"{PROFILE_PREFIX}{profile.address.lower()}.json"
-    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=profile.model_dump_json())
+# === Прокси метаданных NFT ===
+# Общий пул соединений и кэш ответов; TTL берём из Cache-Control, иначе METADATA_CACHE_TTL
+METADATA_FETCH_CONCURRENCY = int(os.getenv("METADATA_FETCH_CONCURRENCY", "32"))
+MAX_METADATA_BATCH = 200
+metadata_proxy = MetadataProxy(
+    max_entries=int(os.getenv("METADATA_CACHE_SIZE", "2048")),
+    default_ttl=float(os.getenv("METADATA_CACHE_TTL", "300")),
+    timeout=float(os.getenv("METADATA_TIMEOUT", "5")),
+    max_response_bytes=int(os.getenv("METADATA_MAX_BYTES", str(1024 * 1024))),
+    max_connections=int(os.getenv("METADATA_MAX_CONNECTIONS", "64")),
+)
+
+def inventory_key(address: str) -> str:
+    return f"{INVENTORY_PREFIX}{address.lower()}.json"
+
+def inventory_log_prefix(address: str) -> str:
+    return f"{INVENTORY_LOG_PREFIX}{address.lower()}/"
 
-def load_profile_from_s3(address: str):
-    key = f"{PROFILE_PREFIX}{address.lower()}.json"
+def inventory_log_key(address: str, segment: int) -> str:
+    return f"{inventory_log_prefix(address)}{segment:012d}.json"
+
+def inventory_dirty(address: str) -> bool:
+    return write_back.is_dirty(inventory_key(address)) or write_back.is_dirty_prefix(inventory_log_prefix(address))
+
+def profile_key(address: str) -> str:
+    return f"{PROFILE_PREFIX}{address.lower()}.json"
+
+# === Локальные хранилища в памяти ===
+# Оценка памяти на один предмет / профиль (см. test_user_cache_memory_is_bounded)
+INVENTORY_ITEM_SIZE = 1280
+PROFILE_SIZE = 768
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_MAX_BYTES = int(os.getenv("USER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "600"))
+
+# Вытесненные записи перечитываются из S3; несохранённые (в буфере записи) не вытесняются
+user_inventory = BoundedCache(
+    max_entries=USER_CACHE_MAX_ENTRIES,
+    max_bytes=USER_CACHE_MAX_BYTES,
+    ttl=USER_CACHE_TTL,
+    sizer=lambda items: INVENTORY_ITEM_SIZE * (len(items) + 1),
+    is_pinned=inventory_dirty,
+)
+user_profiles = BoundedCache(
+    max_entries=USER_CACHE_MAX_ENTRIES,
+    max_bytes=USER_CACHE_MAX_BYTES,
+    ttl=USER_CACHE_TTL,
+    sizer=lambda profile: PROFILE_SIZE,
+    is_pinned=lambda address: write_back.is_dirty(profile_key(address)),
+)
+
+# Изменения одного адреса выполняются по очереди (в пределах процесса)
+address_locks = KeyLocks(stripes=int(os.getenv("ADDRESS_LOCK_STRIPES", "1024")))
+
+# Одна загрузка из S3 на адрес; отсутствующий профиль помним NEGATIVE_CACHE_TTL секунд
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "5"))
+inventory_loads = SingleFlight(negative_ttl=0)
+profile_loads = SingleFlight(negative_ttl=NEGATIVE_CACHE_TTL, max_negative=USER_CACHE_MAX_ENTRIES)
+
+# === Общее состояние нескольких воркеров ===
+# После записи в S3 воркер рассылает (kind, key), остальные сбрасывают свою копию.
+# Несохранённую копию не сбрасываем: её условная запись всё равно упрётся
+# в чужую версию и перечитает её (см. write_inventory_segment, profile_writer).
+invalidation_bus = make_bus(os.getenv("SHARED_STATE_BUS"))
+
+async def apply_invalidation(kind: str, key):
     try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        profile_data = json.loads(response["Body"].read().decode("utf-8"))
-        user_profiles[address.lower()] = Profile(**profile_data)
-    except s3.exceptions.ClientError as e:
-        if e.response['Error']['Code'] != 'NoSuchKey':
-            raise
+        if kind == "inventory":
+            # Под блокировкой адреса: загрузка, начатая до чужой записи, не вернётся в кэш после сброса
+            async with address_locks(key):
+                user_inventory.invalidate(key)
+                inventory_loads.forget(key)
+                storage.evict(inventory_key(key))
+                storage.evict(inventory_log_prefix(key))
+        elif kind == "profile":
+            async with address_locks(key):
+                user_profiles.invalidate(key)
+                profile_loads.forget(key)
+                storage.evict(profile_key(key))
+        elif kind == "sell_prices":
+            await storage.run(sell_price_config.refresh)
+        elif kind == "nft" and nft_catalog.loaded:
+            data, etag = await storage.get_versioned(f"{NFT_PREFIX}{key}.json")
+            if data is not None:
+                nft_catalog.refresh(loads(data), etag)
+    except Exception as e:
+        print(f"❌ Ошибка инвалидации {kind} {key}: {e}")
 
-# === Работа с глобальными ценами продажи ===
-def load_sell_prices():
-    global sell_prices
+# === Работа с инвентарём ===
+# Изменение пишет одну операцию в журнал inventory_log/{address}/,
+# время от времени журнал сворачивается в снимок inventories/{address}.json.
+# Сегменты и снимок пишутся условно, поэтому воркеры не теряют чужие изменения.
+def inventory_item(data: dict) -> Item:
+    return Item(**data)
+
+async def append_inventory_op(address: str, inventory: Inventory, segment):
+    await persist(
+        inventory_log_key(address, segment.number),
+        segment.serialize,
+        inventory_writer(address, inventory, segment),
+    )
+
+def inventory_writer(address: str, inventory: Inventory, segment):
+    # Выполняется в потоке записи: все более ранние сегменты, затем этот, затем свёртка
+    def write(key: str, data):
+        with inventory.write_lock:
+            for pending in inventory.pending_through(segment):
+                body = data if pending is segment else pending.serialize()
+                write_inventory_segment(address, inventory, pending, body)
+            if (
+                inventory.segments_since_snapshot >= INVENTORY_COMPACT_SEGMENTS
+                or inventory.ops_since_snapshot >= max(INVENTORY_COMPACT_MIN_OPS, len(inventory) // 2)
+            ):
+                compact_inventory(address, inventory, segment.number)
+        invalidation_bus.publish("inventory", address.lower())
+    return write
+
+def write_inventory_segment(address: str, inventory: Inventory, segment, body):
+    for attempt in range(WRITE_CONFLICT_RETRIES):
+        try:
+            storage.put_bytes(inventory_log_key(address, segment.number), body, IfNoneMatch="*")
+            inventory.mark_written(segment)
+            return
+        except ClientError as e:
+            if not is_conflict(e):
+                raise
+        if attempt:
+            conflict_backoff(attempt)
+        # Номер занят другим воркером: дочитываем его сегменты и сдвигаем свои
+        keys = storage.list_keys(
+            inventory_log_prefix(address), start_after=inventory_log_key(address, segment.number - 1)
+        )
+        foreign = [
+            json.loads(storage.get_bytes(key) or b"[]")
+            for key in sorted(keys) if segment_number(key) is not None
+        ]
+        inventory.rebase(foreign, inventory_item)
+    raise WriteConflict(f"Не удалось записать журнал инвентаря {address}")
+
+def compact_inventory(address: str, inventory: Inventory, seq: int):
+    # Все сегменты до seq включительно уже записаны и применены
+    inventory.start_compaction(seq)
+
+    def rebase(data, etag):
+        _, remote_seq = parse_snapshot(data)
+        if remote_seq >= seq:
+            return None  # другой воркер уже свернул журнал дальше
+        return inventory.serialize_snapshot(seq)
+
+    previous = inventory.snapshot_seq
+    etag = storage.put_conditional(
+        inventory_key(address), inventory.serialize_snapshot(seq), inventory.snapshot_etag, rebase
+    )
+    inventory.snapshot_seq = max(inventory.snapshot_seq, seq)
+    inventory.snapshot_etag = etag
+    prune_inventory_log(address, previous)
+
+def prune_inventory_log(address: str, through: int):
+    # Удаляем сегменты, вошедшие в предыдущий снимок (отставание на одну свёртку).
+    # Сегменты последнего снимка остаются: воркер с устаревшей копией инвентаря
+    # пишет сегмент с уже занятым номером и получает конфликт, а не запись под снимком.
+    if through <= 0:
+        return
     try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=SELL_PRICES_KEY)
-        sell_prices = json.loads(response["Body"].read().decode("utf-8"))
-    except s3.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
-            sell_prices = {
-                "common": 5,
-                "rare": 20,
-                "epic": 50,
-                "legendary": 100
-            }
-            save_sell_prices()
-        else:
-            raise
+        keys = [
+            key for key in storage.list_keys(inventory_log_prefix(address))
+            if (n := segment_number(key)) is not None and n <= through
+        ]
+        if keys:
+            storage.delete_keys(keys)
+    except Exception as e:
+        # Не страшно: удалим при следующей свёртке
+        print(f"❌ Ошибка удаления журнала инвентаря {address}: {e}")
+
+async def load_inventory_from_s3(address: str) -> Inventory:
+    for attempt in range(WRITE_CONFLICT_RETRIES):
+        inventory = await read_inventory_from_s3(address)
+        if inventory is not None:
+            user_inventory[address.lower()] = inventory
+            return inventory
+    raise WriteConflict(f"Журнал инвентаря {address} сворачивается быстрее, чем читается")
+
+async def read_inventory_from_s3(address: str) -> Optional[Inventory]:
+    # None — пока читали, журнал свернули дважды и часть прочитанного хвоста удалена
+    data, etag = await storage.get_versioned(inventory_key(address))
+    items, seq = parse_snapshot(data)
+    inventory = Inventory((Item(**item) for item in items), snapshot_seq=seq, snapshot_etag=etag)
+
+    # Досчитываем сегменты журнала после снимка, по порядку; номера идут подряд с seq + 1
+    log_keys = await storage.list(inventory_log_prefix(address), start_after=inventory_log_key(address, seq))
+    segments = sorted((n, key) for key in log_keys if (n := segment_number(key)) is not None and n > seq)
+    if segments and segments[0][0] != seq + 1:
+        return None
+    for key, data in await storage.get_many([key for _, key in segments], S3_FETCH_CONCURRENCY):
+        if isinstance(data, Exception):
+            raise data
+        if data is None:
+            return None
+        ops = json.loads(data)
+        inventory.apply(ops, inventory_item)
+        inventory.ops_since_snapshot += len(ops)
+    if segments:
+        inventory.next_segment = segments[-1][0] + 1
+        inventory.segments_since_snapshot = len(segments)
+    return inventory
+
+async def get_user_inventory(address: str) -> Inventory:
+    # Из кэша, при промахе — из S3
+    inventory = user_inventory.get(address)
+    if inventory is None:
+        inventory = await inventory_loads.load(address, lambda: load_inventory_from_s3(address))
+    return inventory
+
+# === Работа с профилем ===
+# Запись профиля условная (If-Match по ETag): если другой воркер успел записать
+# свою версию, перечитываем её и накладываем только поля, изменённые здесь.
+profile_change_seq = itertools.count(1)
+
+def update_profile(profile: Profile, updates: dict) -> dict:
+    applied = {}
+    with profile._lock:
+        for key, value in updates.items():
+            if key in Profile.model_fields:
+                setattr(profile, key, value)
+                profile._changes[key] = next(profile_change_seq)
+                applied[key] = value
+        if applied:
+            profile._body = None
+    return applied
+
+def profile_body(profile: Profile):
+    def body():
+        with profile._lock:
+            profile._sent = dict(profile._changes)
+            return profile.model_dump_json()
+    return body
+
+def profile_json(profile: Profile):
+    # (ETag, тело) — то же, что записываем в S3: одна сериализация до следующего изменения
+    with profile._lock:
+        if profile._body is None:
+            profile._body = profile.model_dump_json().encode("utf-8")
+            profile._body_etag = content_etag(profile._body)
+        return profile._body_etag, profile._body
+
+def profile_writer(profile: Profile):
+    def write(key: str, data):
+        def rebase(remote, etag):
+            with profile._lock:
+                if remote is not None:
+                    current = json.loads(remote)
+                    for field in Profile.model_fields:
+                        if field not in profile._changes and field in current:
+                            setattr(profile, field, current[field])
+                    profile._body = None
+                profile._sent = dict(profile._changes)
+                return profile.model_dump_json()
+
+        etag = storage.put_conditional(key, data, profile._etag, rebase, retries=WRITE_CONFLICT_RETRIES)
+        with profile._lock:
+            profile._etag = etag
+            # Записанные поля больше не «наши»: при следующем конфликте берём чужие значения
+            for field, seq in profile._sent.items():
+                if profile._changes.get(field) == seq:
+                    del profile._changes[field]
+        invalidation_bus.publish("profile", profile.address.lower())
+    return write
+
+async def save_profile_to_s3(profile: Profile):
+    await persist(profile_key(profile.address), profile_body(profile), profile_writer(profile))
+
+async def load_profile_from_s3(address: str) -> Optional[Profile]:
+    data, etag = await storage.get_versioned(profile_key(address))
+    if data is None:
+        return None
+    profile = Profile(**loads(data))
+    profile._etag = etag
+    user_profiles[address.lower()] = profile
+    return profile
 
-def save_sell_prices():
-    s3.put_object(Bucket=BUCKET_NAME, Key=SELL_PRICES_KEY, Body=json.dumps(sell_prices))
+async def get_user_profile(address: str) -> Optional[Profile]:
+    profile = user_profiles.get(address)
+    if profile is None:
+        profile = await profile_loads.load(address, lambda: load_profile_from_s3(address))
+    return profile
+
+# === Работа с глобальными ценами продажи ===
+# Цены в памяти; раз в SELL_PRICES_REFRESH_INTERVAL секунд — условный GET конфига
+# (при совпадении ETag S3 тело не передаёт), сразу — по сообщению другого воркера.
+SELL_PRICES_REFRESH_INTERVAL = float(os.getenv("SELL_PRICES_REFRESH_INTERVAL", "30"))
+sell_price_config = SellPriceConfig(storage, SELL_PRICES_KEY)
+
+async def refresh_sell_prices_periodically():
+    while True:
+        await asyncio.sleep(SELL_PRICES_REFRESH_INTERVAL)
+        try:
+            if await storage.run(sell_price_config.refresh):
+                print(f"💰 Цены продажи обновлены: версия {sell_price_config.current.version}")
+        except Exception as e:
+            print(f"❌ Ошибка обновления цен продажи: {e}")
+
+# === Потоковые ответы (NDJSON) ===
+# Accept: application/x-ndjson или ?stream=1 — записи уходят по мере чтения,
+# по одной JSON-строке, без сборки всего списка в памяти
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_ndjson(request: Request, stream: Optional[str]) -> bool:
+    if stream is not None:
+        return stream.lower() in ("1", "true", "yes")
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def ndjson_response(lines) -> StreamingResponse:
+    return StreamingResponse(ndjson_chunks(lines), media_type=NDJSON_MEDIA_TYPE)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # If-None-Match может содержать несколько ETag, слабые (W/) и «*»
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in (value.removeprefix("W/") for value in candidates)
+
+# === Условные GET ===
+# Сильные ETag по содержимому (одинаковые у всех воркеров). Клиент, приславший
+# If-None-Match с актуальным ETag, получает 304 без тела; no-cache — браузер
+# всегда переспрашивает, но тело качает только после изменения.
+conditional_gets = Counter()  # (маршрут, "not_modified" | "full") -> число ответов
+
+def conditional_response(request: Request, route: str, etag: str, body) -> Response:
+    # body — bytes или функция, которая соберёт их только для ответа 200
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        conditional_gets[(route, "not_modified")] += 1
+        return Response(status_code=304, headers=headers)
+    conditional_gets[(route, "full")] += 1
+    content = body() if callable(body) else body
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def conditional_stats() -> dict:
+    stats = {}
+    for (route, outcome), count in conditional_gets.items():
+        stats.setdefault(route, {"not_modified": 0, "full": 0})[outcome] = count
+    for route_stats in stats.values():
+        total = route_stats["not_modified"] + route_stats["full"]
+        route_stats["hit_rate"] = round(route_stats["not_modified"] / total, 4) if total else 0.0
+    return stats
 
 # === API ===
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🔁 Lifespan init: запуск сервера")
-    load_sell_prices()  # 👈 если раньше это было в startup_event, добавь сюда
+    # Горячий уровень хранилища: перечитать из S3 на холодном старте, запустить выгрузку
+    await storage.run(storage.start)
+    await storage.run(sell_price_config.refresh)  # 👈 если раньше это было в startup_event, добавь сюда
+    try:
+        await nft_catalog.ensure_loaded(rebuild=os.getenv("NFT_CATALOG_REBUILD_ON_START") == "1")
+    except Exception as e:
+        # Не блокируем запуск: каталог загрузится при первом GET /nft
+        print(f"❌ Ошибка загрузки каталога NFT: {e}")
+    warmup = None
+    if MODEL_WARMUP == "sync":
+        warm_up_price_model()
+    elif MODEL_WARMUP == "background":
+        warmup = threading.Thread(target=warm_up_price_model, name="model-warmup", daemon=True)
+        warmup.start()
+    startup_state["lifespan"] = True
+    watcher = None
+    if MODEL_RELOAD_INTERVAL > 0:
+        watcher = asyncio.create_task(watch_model_files())
+    price_refresher = None
+    if SELL_PRICES_REFRESH_INTERVAL > 0:
+        price_refresher = asyncio.create_task(refresh_sell_prices_periodically())
+    write_back.start()
+    loop = asyncio.get_running_loop()
+    invalidation_bus.start(
+        lambda kind, key: asyncio.run_coroutine_threadsafe(apply_invalidation(kind, key), loop)
+    )
     yield
+    if watcher:
+        watcher.cancel()
+    if price_refresher:
+        price_refresher.cancel()
+    await metadata_proxy.close()
+    await nft_catalog.flush()
+    flushed = await storage.run(write_back.stop)
+    print(f"💾 Отложенная запись: дописано {flushed} объектов в S3")
+    uploaded = await storage.run(storage.stop)
+    if uploaded:
+        print(f"🧊 Горячий уровень: выгружено в S3 {uploaded} объектов")
+    invalidation_bus.stop()
+    startup_state["lifespan"] = False
     print("⛔ Lifespan shutdown: сервер остановлен")
 
-app = FastAPI(lifespan=lifespan)
+# Ответы-словари сериализуем через orjson (fast_json), готовые тела отдаём как есть
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # === CORS ===
 app.add_middleware(
@@ -158,127 +721,241 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Снаружи CORS: в задержку входит всё, что видит клиент
+app.add_middleware(MetricsMiddleware, duration=request_duration, server_timing=SERVER_TIMING)
 
 @app.get("/")
-def root():
+async def root():
     return {"status": "GameGems backend is running 🚀"}
 
+@app.get("/health")
+async def health():
+    # Живость процесса: не трогает ни S3, ни модель
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    # Готовность принимать трафик: lifespan отработал и (кроме MODEL_WARMUP=lazy) модель прогрета
+    # После неудачного прогрева готовность вернёт успешная ручная перезагрузка модели
+    model_ready = MODEL_WARMUP == "lazy" or warmup_done.is_set() or (
+        warmup_state["error"] is not None and model_registry.active is not None
+    )
+    is_ready = startup_state["lifespan"] and model_ready
+    content = {
+        "status": "ready" if is_ready else "starting",
+        "warmup": MODEL_WARMUP,
+        "model": model_registry.active.version if model_registry.active else None,
+        "warmup_seconds": warmup_state["seconds"],
+        "error": warmup_state["error"] or model_registry.last_error,
+    }
+    return FastJSONResponse(content, status_code=200 if is_ready else 503)
+
 @app.get("/inventory/{address}", response_model=List[Item])
-def get_inventory(address: str):
+async def get_inventory(address: str, request: Request):
     address = address.lower()
-    if address not in user_inventory:
-        load_inventory_from_s3(address)
-    return user_inventory.get(address, [])
+    async with address_locks(address):
+        inventory = await get_user_inventory(address)
+    etag, body = inventory.json_with_etag()
+    return conditional_response(request, "inventory", etag, body)
 
 @app.post("/inventory/{address}")
-def add_item(address: str, item: Item):
+async def add_item(address: str, item: Item):
     address = address.lower()
-    if address not in user_inventory:
-        load_inventory_from_s3(address)
+    async with address_locks(address):
+        inventory = await get_user_inventory(address)
 
-    if any(existing.id == item.id for existing in user_inventory[address]):
-        raise HTTPException(status_code=400, detail="Предмет с таким ID уже существует.")
+        if item.id in inventory:
+            raise HTTPException(status_code=400, detail="Предмет с таким ID уже существует.")
 
-    user_inventory[address].append(item)
-    save_inventory_to_s3(address)
+        segment = inventory.add(item)
+        # Повторная запись в кэш пересчитывает занимаемую память
+        user_inventory[address] = inventory
+        await append_inventory_op(address, inventory, segment)
     return {"status": "ok", "item_id": item.id}
 
+# Максимум изменений в одном пакетном запросе к инвентарю
+MAX_INVENTORY_BATCH = 1000
+
+@app.post("/inventory/{address}/batch")
+async def batch_update_inventory(address: str, changes: InventoryBatchRequest):
+    address = address.lower()
+    if len(changes.add) + len(changes.remove) > MAX_INVENTORY_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много изменений в запросе (максимум {MAX_INVENTORY_BATCH})"
+        )
+    async with address_locks(address):
+        inventory = await get_user_inventory(address)
+
+        # Одна проверка на весь пакет: сначала удаления, затем добавления
+        results = []
+        removed = set()
+        for item_id in changes.remove:
+            if item_id in removed or item_id not in inventory:
+                results.append({"id": item_id, "op": "remove", "status": "error", "error": "Предмет не найден"})
+            else:
+                removed.add(item_id)
+                results.append({"id": item_id, "op": "remove", "status": "ok"})
+        added = set()
+        for item in changes.add:
+            if item.id in added or (item.id in inventory and item.id not in removed):
+                results.append({"id": item.id, "op": "add", "status": "error", "error": "Предмет с таким ID уже существует."})
+            else:
+                added.add(item.id)
+                results.append({"id": item.id, "op": "add", "status": "ok"})
+
+        # Атомарно: при любой ошибке ничего не применяем
+        if any(result["status"] == "error" for result in results):
+            raise HTTPException(status_code=400, detail={"message": "Пакет отклонён", "results": results})
+
+        segment = inventory.apply_changes(changes.add, changes.remove)
+        if segment is not None:
+            user_inventory[address] = inventory
+            await append_inventory_op(address, inventory, segment)
+    return {"status": "ok", "added": len(changes.add), "removed": len(changes.remove), "results": results}
+
 @app.get("/profile/{address}", response_model=Profile)
-def get_profile(address: str):
+async def get_profile(address: str, request: Request):
     address = address.lower()
-    if address not in user_profiles:
-        load_profile_from_s3(address)
-    profile = user_profiles.get(address)
+    async with address_locks(address):
+        profile = await get_user_profile(address)
     if profile is None:
         raise HTTPException(status_code=404, detail="Профиль не найден")
-    return profile
+    etag, body = profile_json(profile)
+    return conditional_response(request, "profile", etag, body)
 @app.patch("/profile/{address}")
-def patch_profile(address: str, updates: dict = Body(...)):
+async def patch_profile(address: str, updates: dict = Body(...)):
     address = address.lower()
-    if address not in user_profiles:
-        load_profile_from_s3(address)
+    async with address_locks(address):
+        profile = await get_user_profile(address)
+        if not profile:
+            raise HTTPException(status_code=404, detail="Профиль не найден")
 
-    profile = user_profiles.get(address)
-    if not profile:
-        raise HTTPException(status_code=404, detail="Профиль не найден")
+        # Применяем обновления
+        update_profile(profile, updates)
 
-    # Применяем обновления
-    for key, value in updates.items():
-        if hasattr(profile, key):
-            setattr(profile, key, value)
-
-    user_profiles[address] = profile
-    save_profile_to_s3(profile)
+        user_profiles[address] = profile
+        await save_profile_to_s3(profile)
     return {"status": "ok", "updated": updates}
 
 @app.post("/profile/")
-def create_or_update_profile(profile: Profile):
+async def create_or_update_profile(profile: Profile):
     address = profile.address.lower()
-    user_profiles[address] = profile
-    save_profile_to_s3(profile)
+    async with address_locks(address):
+        # Полная перезапись: все поля считаются изменёнными здесь
+        existing = user_profiles.get(address)
+        if existing is not None:
+            profile._etag = existing._etag
+        update_profile(profile, profile.model_dump())
+        user_profiles[address] = profile
+        profile_loads.forget(address)
+        await save_profile_to_s3(profile)
     return {"status": "ok", "address": profile.address}
 
 @app.get("/sell-prices")
-def get_sell_prices():
-    return sell_prices
+async def get_sell_prices(request: Request):
+    # Готовое тело текущей версии; no-cache — браузер переспрашивает с If-None-Match и получает 304
+    snapshot = sell_price_config.current
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "X-Config-Version": str(snapshot.version)}
+    if etag_matches(request, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 @app.post("/sell-prices")
-def update_sell_prices(new_prices: dict):
-    global sell_prices
-    for rarity in ["common", "rare", "epic", "legendary"]:
-        if rarity in new_prices:
-            sell_prices[rarity] = new_prices[rarity]
-    save_sell_prices()
-    return {"status": "ok", "updated": sell_prices}
+async def update_sell_prices(new_prices: dict):
+    snapshot = await storage.run(sell_price_config.update, new_prices)
+    invalidation_bus.publish("sell_prices")
+    return {"status": "ok", "updated": snapshot.prices, "version": snapshot.version}
+
+@app.get("/sell-prices/stats")
+async def get_sell_prices_stats():
+    return sell_price_config.stats()
 
 @app.delete("/inventory/{address}/{item_id}")
-def delete_item(address: str, item_id: str):
+async def delete_item(address: str, item_id: str):
     address = address.lower()
-    if address not in user_inventory:
-        load_inventory_from_s3(address)
+    async with address_locks(address):
+        inventory = await get_user_inventory(address)
 
-    before_count = len(user_inventory[address])
-    user_inventory[address] = [
-        item for item in user_inventory[address] if item.id != item_id
-    ]
-    after_count = len(user_inventory[address])
+        segment = inventory.remove(item_id)
+        if segment is None:
+            raise HTTPException(status_code=404, detail="Предмет не найден")
 
-    save_inventory_to_s3(address)
-
-    if before_count == after_count:
-        raise HTTPException(status_code=404, detail="Предмет не найден")
+        user_inventory[address] = inventory
+        await append_inventory_op(address, inventory, segment)
 
     return {"status": "ok", "deleted": 1}
 
 
-@app.get("/profiles", response_model=List[Profile])
-def get_all_profiles():
-    keys = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=PROFILE_PREFIX)
-    results = []
+# Проверенные тела профилей по ETag из листинга: неизменённые объекты не читаем
+profile_listing_cache = BoundedCache(
+    max_entries=USER_CACHE_MAX_ENTRIES,
+    max_bytes=USER_CACHE_MAX_BYTES,
+    sizer=lambda entry: len(entry[1]) + 128,
+)
 
-    for obj in keys.get("Contents", []):
-        key = obj["Key"]
-        if not key.endswith(".json"):
-            continue
-        try:
-            response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-            data = json.loads(response["Body"].read().decode("utf-8"))
-            results.append(Profile(**data))
-        except Exception as e:
-            print(f"❌ Ошибка чтения профиля {key}: {e}")
-    return results
+async def read_profile_body(key: str, etag: Optional[str], remember: bool) -> Optional[bytes]:
+    # JSON профиля в виде ответа; None — удалён между листингом и чтением или битый
+    cached = profile_listing_cache.get(key)
+    if etag is not None and cached is not None and cached[0] == etag:
+        return cached[1]
+    try:
+        data = await storage.get(key)
+        if data is None:
+            return None
+        # Проверяем и приводим к виду ответа один раз на версию объекта
+        body = Profile(**loads(data)).model_dump_json().encode("utf-8")
+    except Exception as e:
+        print(f"❌ Ошибка чтения профиля {key}: {e}")
+        return None
+    if remember and etag is not None:
+        profile_listing_cache[key] = (etag, body)
+    return body
+
+async def iter_profile_bodies(remember: bool = True):
+    # Конвейер: страница листинга → не больше S3_FETCH_CONCURRENCY чтений в полёте →
+    # тела в порядке ключей. Следующее чтение начинается, только когда потребитель
+    # забрал готовое тело, так что медленный клиент притормаживает и чтение из S3.
+    # Неудачная отложенная запись одного профиля не роняет листинг: ошибка печатается,
+    # профиль отдаётся в том виде, в каком он лежит в S3, и будет записан позже
+    await storage.run(write_back.flush_prefix, PROFILE_PREFIX, raise_errors=False)
+    window = deque()
+    try:
+        async for page in storage.list_pages(PROFILE_PREFIX):
+            for key, etag in page:
+                if not key.endswith(".json"):
+                    continue
+                window.append(asyncio.ensure_future(read_profile_body(key, etag, remember)))
+                if len(window) >= S3_FETCH_CONCURRENCY:
+                    body = await window.popleft()
+                    if body is not None:
+                        yield body
+        while window:
+            body = await window.popleft()
+            if body is not None:
+                yield body
+    finally:
+        for task in window:
+            task.cancel()
+
+@app.get("/profiles", response_model=List[Profile])
+async def get_all_profiles(request: Request, stream: Optional[str] = None):
+    if wants_ndjson(request, stream):
+        # Поток не заполняет кэш листинга: иначе он вырос бы до размера бакета
+        return ndjson_response(iter_profile_bodies(remember=False))
+    bodies = [body async for body in iter_profile_bodies()]
+    return Response(content=join_array(bodies), media_type="application/json")
 
 
 @app.post("/nft/create-json")
-def create_nft_json(payload: NFTWrapRequest):
+async def create_nft_json(payload: NFTWrapRequest):
     filename = f"nft_data/{payload.account}_{payload.itemId}_{uuid.uuid4()}.json"
     content = json.dumps(payload.json, ensure_ascii=False)
 
     try:
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=filename,
-            Body=content,
+        await storage.put(
+            filename,
+            content,
             ContentType="application/json",
             ACL="public-read"
         )
@@ -290,96 +967,455 @@ def create_nft_json(payload: NFTWrapRequest):
 
 
 @app.post("/nft/save")
-def save_final_nft(data: FinalNFT):
+async def save_final_nft(data: FinalNFT):
     print("📥 Получено тело запроса:", data)
     # Ключ с одним уровнем вложенности: NFT/{tokenId}.json
-    key = f"NFT/{data.tokenId}.json"
+    key = f"{NFT_PREFIX}{data.tokenId}.json"
 
     try:
         # Сохраняем полный JSON с актуальным владельцем
-        s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=key,
-            Body=json.dumps(data.model_dump(), ensure_ascii=False),
+        etag = await storage.put(
+            key,
+            json.dumps(data.model_dump(), ensure_ascii=False),
             ContentType="application/json",
             ACL="public-read"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки в S3: {str(e)}")
 
+    await nft_catalog.upsert(data.model_dump(), etag)
+    invalidation_bus.publish("nft", data.tokenId)
     return {"status": "ok", "saved": key}
 
+# Размер страницы GET /nft с фильтрами
+NFT_PAGE_DEFAULT = 50
+NFT_PAGE_MAX = 500
+
+async def iter_nft_lines(filters: dict, page):
+    items, cursor = page
+    while True:
+        for record in items:
+            yield dumps(record)
+        if cursor is None:
+            return
+        items, cursor = nft_catalog.query(**filters, cursor=cursor, limit=NFT_PAGE_MAX)
+
 @app.get("/nft")
-def get_all_nfts():
-    # Возвращаем все NFT из папки NFT/
-    prefix = "NFT/"
+async def get_all_nfts(
+    request: Request,
+    owner: Optional[str] = None,
+    itemType: Optional[str] = None,
+    rarity: Optional[int] = None,
+    min_bonus: Optional[float] = None,
+    max_bonus: Optional[float] = None,
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    stream: Optional[str] = None,
+):
+    # Возвращаем все NFT из каталога в памяти — без обхода папки NFT/
     try:
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        contents = response.get("Contents", [])
-        nft_list = []
-
-        for obj in contents:
-            key = obj["Key"]
-            if not key.endswith(".json"):
-                continue
-            s3_object = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-            data = json.loads(s3_object["Body"].read().decode("utf-8"))
-            nft_list.append(data)
-
-        return nft_list
+        await nft_catalog.ensure_loaded()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки NFT: {str(e)}")
+
+    if wants_ndjson(request, stream):
+        # Все подходящие записи страницами по индексу каталога; limit не действует
+        filters = dict(
+            owner=owner, item_type=itemType, rarity=rarity,
+            min_bonus=min_bonus, max_bonus=max_bonus, sort=sort or "tokenId",
+        )
+        try:
+            first_page = nft_catalog.query(**filters, cursor=cursor, limit=NFT_PAGE_MAX)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return ndjson_response(iter_nft_lines(filters, first_page))
+
+    params = (owner, itemType, rarity, min_bonus, max_bonus, sort, cursor, limit)
+    if any(p is not None for p in params):
+        # Маркетплейс: фильтры, сортировка и курсорная пагинация по индексам каталога
+        limit = NFT_PAGE_DEFAULT if limit is None else limit
+        if not 1 <= limit <= NFT_PAGE_MAX:
+            raise HTTPException(status_code=422, detail=f"limit должен быть от 1 до {NFT_PAGE_MAX}")
+        filters = dict(
+            owner=owner, item_type=itemType, rarity=rarity,
+            min_bonus=min_bonus, max_bonus=max_bonus,
+            sort=sort or "tokenId", cursor=cursor, limit=limit,
+        )
+        # Каталог не менялся — страница та же, выборку не выполняем
+        query_key = dumps(filters).decode("utf-8")
+        etag = nft_catalog.query_etag(query_key)
+        if etag_matches(request, etag):
+            return conditional_response(request, "nft_query", etag, b"")
+        try:
+            items, next_cursor, etag = nft_catalog.query_with_etag(query_key, **filters)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return conditional_response(
+            request, "nft_query", etag, lambda: dumps({"items": items, "next_cursor": next_cursor})
+        )
+
+    etag, body = nft_catalog.snapshot()
+    return conditional_response(request, "nft", etag, body)
+
+@app.get("/nft/catalog")
+async def get_nft_catalog_status():
+    return nft_catalog.status()
+
+@app.post("/nft/catalog/rebuild")
+async def rebuild_nft_catalog():
+    # Полное перечитывание папки NFT/ (например, после ручных правок в бакете)
+    await nft_catalog.ensure_loaded(rebuild=True)
+    return {"status": "ok", **nft_catalog.status()}
     
 @app.get("/nft/{tokenId}")
-def get_nft_by_id(tokenId: int):
-    key = f"NFT/{tokenId}.json"
+async def get_nft_by_id(tokenId: int, request: Request):
+    if nft_catalog.loaded:
+        record, etag = nft_catalog.get_with_etag(tokenId)
+        if record is not None:
+            return conditional_response(request, "nft_token", etag, lambda: dumps(record))
+
+    key = f"{NFT_PREFIX}{tokenId}.json"
     try:
-        s3_object = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        data = json.loads(s3_object["Body"].read().decode("utf-8"))
-        return data
+        data, etag = await storage.get_versioned(key)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"NFT с tokenId {tokenId} не найден: {str(e)}")
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"NFT с tokenId {tokenId} не найден")
+    # Байты из S3 уходят клиенту без разбора; ETag — объекта в S3, как и из каталога
+    return conditional_response(request, "nft_token", etag or content_etag(data), data)
     
 @app.get("/metadata-proxy/")
-def proxy_metadata(url: str):
+async def proxy_metadata(url: str):
     try:
-        response = requests.get(url)  # ← response — это просто результат запроса
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка загрузки: {str(e)}")
+        return await metadata_proxy.get(url)
+    except MetadataProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.post("/metadata-proxy/batch")
+async def proxy_metadata_batch(payload: MetadataBatchRequest):
+    if len(payload.urls) > MAX_METADATA_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много URL в пакете: {len(payload.urls)} > {MAX_METADATA_BATCH}"
+        )
+    results = []
+    for url, data in await metadata_proxy.get_many(payload.urls, METADATA_FETCH_CONCURRENCY):
+        if isinstance(data, MetadataProxyError):
+            results.append({"url": url, "status": "error", "error": str(data)})
+        else:
+            results.append({"url": url, "status": "ok", "data": data})
+    return {"results": results}
+
+@app.get("/metadata-proxy/stats")
+async def metadata_proxy_stats():
+    return metadata_proxy.stats()
     
 
+# Максимальное число NFT в одном пакетном запросе на оценку цены
+MAX_PREDICT_BATCH = 1000
+
+def build_price_features(nfts: List[NFTPriceRequest]) -> List[dict]:
+    # Одна строка признаков на каждый NFT — модель обрабатывает их за один вызов
+    return [{
+        "itemType": nft.itemType,
+        "rarity": nft.rarity,
+        "bonusValue": nft.bonusValue
+    } for nft in nfts]
+
+def build_price_result(nft: NFTPriceRequest, predicted_price: float, model_version: str) -> dict:
+    result = {
+        "status": "ok",
+        "recommended_price": round(predicted_price, 2),
+        "model_version": model_version
+    }
+
+    # Если пользователь передал цену, рассчитать отклонение
+    if nft.price is not None:
+        deviation = round((nft.price - predicted_price) / predicted_price * 100, 2)
+        result["deviation"] = deviation
+
+        if deviation < -10:
+            result["price_status"] = "занижена"
+        elif deviation > 10:
+            result["price_status"] = "завышена"
+        else:
+            result["price_status"] = "нормальная"
+
+    return result
+
+def price_cache_key(version: str, nft: NFTPriceRequest):
+    return (version, nft.itemType, nft.rarity, nft.bonusValue)
+
+def predict_prices(nfts: List[NFTPriceRequest]):
+    # Снимок активной версии: подмена модели посреди запроса его не затронет
+    active = model_registry.active or model_registry.ensure()
+
+    # Берём из кэша всё, что уже считали; модель вызываем один раз на промахи
+    prices = [prediction_cache.get(price_cache_key(active.version, nft)) for nft in nfts]
+    missing = [i for i, price in enumerate(prices) if price is None]
+
+    if missing:
+        started = time.perf_counter()
+        predictions = active.model.predict(build_price_features([nfts[i] for i in missing]))
+        elapsed = time.perf_counter() - started
+        backend = type(active.model).__name__
+        model_inference.observe(elapsed, backend)
+        model_inference_rows.inc(backend, amount=len(missing))
+        record_section("model", elapsed)
+        for i, predicted in zip(missing, predictions):
+            prices[i] = round(predicted)
+            prediction_cache.put(price_cache_key(active.version, nfts[i]), prices[i])
+
+    return prices, active.version
+
+def prewarm_prediction_cache():
+    # Все известные комбинации признаков — одним вызовом модели
+    nfts = [
+        NFTPriceRequest(itemType=item_type, rarity=rarity, bonusValue=bonus)
+        for item_type in KNOWN_ITEM_TYPES
+        for rarity in KNOWN_RARITIES
+        for bonus in range(MAX_KNOWN_BONUS + 1)
+    ]
+    predict_prices(nfts)
+    print(f"🔥 Кэш предсказаний прогрет: {len(prediction_cache)} комбинаций")
+
 @app.post("/predict-price")
-def predict_nft_price(nft: NFTPriceRequest):
+async def predict_nft_price(nft: NFTPriceRequest):
+    await ensure_price_model()
     try:
-        # Подготовка данных для модели
-        df = pd.DataFrame([{
-            "itemType": nft.itemType,
-            "rarity": nft.rarity,
-            "bonusValue": nft.bonusValue
-        }])
-
         # Получение рекомендованной цены
-        predicted_price = round(price_model.predict(df)[0])
-        result = {
-            "status": "ok",
-            "recommended_price": round(predicted_price, 2)
-        }
-
-        # Если пользователь передал цену, рассчитать отклонение
-        if nft.price is not None:
-            deviation = round((nft.price - predicted_price) / predicted_price * 100, 2)
-            result["deviation"] = deviation
-
-            if deviation < -10:
-                result["price_status"] = "занижена"
-            elif deviation > 10:
-                result["price_status"] = "завышена"
-            else:
-                result["price_status"] = "нормальная"
+        prices, version = predict_prices([nft])
+        return build_price_result(nft, prices[0], version)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка при предсказании цены: {str(e)}")
+
+@app.post("/predict-price/batch")
+async def predict_nft_price_batch(nfts: List[NFTPriceRequest]):
+    if len(nfts) > MAX_PREDICT_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много NFT в запросе (максимум {MAX_PREDICT_BATCH})"
+        )
+
+    await ensure_price_model()
+    try:
+        # Один векторизованный вызов модели на весь пакет
+        prices, version = predict_prices(nfts)
+        results = [
+            build_price_result(nft, predicted, version)
+            for nft, predicted in zip(nfts, prices)
+        ]
+        return {"status": "ok", "model_version": version, "results": results}
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка при предсказании цены: {str(e)}")
+
+# === Маркетплейс: листинги с метаданными и оценкой цены одним ответом ===
+def listing_rarity(value) -> str:
+    # Как rarityMap в MarketplacePage.jsx: ключи объекта — строки, так что 2 и "2" — обе "Rare";
+    # названия редкостей принимаем как есть, всё остальное — "Common"
+    if isinstance(value, bool):
+        return "Common"
+    key = str(value or 1).strip()
+    if key in ("1", "2", "3", "4"):
+        return KNOWN_RARITIES[int(key) - 1]
+    return next((rarity for rarity in KNOWN_RARITIES if rarity.lower() == key.lower()), "Common")
+
+def listing_price_request(metadata: dict, price: Optional[float]) -> NFTPriceRequest:
+    # Те же значения по умолчанию, что и в MarketplacePage.jsx
+    rarity = listing_rarity(metadata.get("rarity"))
+    bonus = metadata.get("bonus") if isinstance(metadata.get("bonus"), dict) else {}
+    return NFTPriceRequest(
+        itemType=metadata.get("itemType") or "Unknown",
+        rarity=rarity,
+        bonusValue=int(bonus.get("value") or 0),
+        price=price,
+    )
+
+@app.post("/marketplace/view")
+async def marketplace_view(payload: MarketplaceViewRequest):
+    listings = payload.listings
+    if len(listings) > MAX_PREDICT_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много листингов в запросе (максимум {MAX_PREDICT_BATCH})"
+        )
 
-        return result
+    # 1) Метаданные из каталога NFT в памяти
+    try:
+        await nft_catalog.ensure_loaded()
+    except Exception as e:
+        print(f"❌ Каталог NFT недоступен, метаданные берём по URI: {e}")
+    metadata = [
+        nft_catalog.get(listing.tokenId) if nft_catalog.loaded and listing.tokenId is not None else None
+        for listing in listings
+    ]
+    errors = [None] * len(listings)
+
+    # 2) Чего нет в каталоге — через прокси метаданных, параллельно
+    missing = [i for i, m in enumerate(metadata) if m is None and listings[i].uri]
+    fetched = await metadata_proxy.get_many([listings[i].uri for i in missing], METADATA_FETCH_CONCURRENCY)
+    for i, (_, data) in zip(missing, fetched):
+        if isinstance(data, MetadataProxyError):
+            errors[i] = str(data)
+        elif isinstance(data, dict):
+            metadata[i] = data
+        else:
+            errors[i] = "Метаданные не являются JSON-объектом"
 
+    # 3) Одна векторизованная оценка цены на все найденные листинги
+    # Битые метаданные (например, bonus.value не число) — ошибка только этого листинга
+    resolved, price_requests = [], []
+    for i, m in enumerate(metadata):
+        if m is None:
+            continue
+        try:
+            price_requests.append(listing_price_request(m, listings[i].price))
+        except Exception as e:
+            errors[i] = f"Некорректные метаданные: {e}"
+            continue
+        resolved.append(i)
+    await ensure_price_model()
+    try:
+        prices, version = predict_prices(price_requests) if price_requests else ([], model_registry.active.version)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка при предсказании цены: {str(e)}")
+    estimates = {
+        i: build_price_result(nft, predicted, version)
+        for i, nft, predicted in zip(resolved, price_requests, prices)
+    }
+
+    results = []
+    for i, listing in enumerate(listings):
+        if i not in estimates:
+            results.append({
+                "tokenId": listing.tokenId,
+                "uri": listing.uri,
+                "status": "error",
+                "error": errors[i] or "NFT не найден",
+            })
+            continue
+        nft, estimate = metadata[i], estimates[i]
+        results.append({
+            "tokenId": listing.tokenId if listing.tokenId is not None else nft.get("tokenId"),
+            "uri": listing.uri or nft.get("uri"),
+            "status": "ok",
+            "price": listing.price,
+            "owner": listing.owner or nft.get("owner"),
+            "itemType": nft.get("itemType") or "Unknown",
+            "rarity": nft.get("rarity") or 1,
+            "bonus": nft.get("bonus") or {},
+            "image": nft.get("image") or "",
+            "recommended_price": estimate["recommended_price"],
+            "price_status": estimate.get("price_status"),
+            "deviation": estimate.get("deviation"),
+        })
+    return {"status": "ok", "model_version": version, "listings": results}
+
+@app.get("/predict-price/cache")
+async def get_prediction_cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/write-back/stats")
+async def get_write_back_stats():
+    return write_back.stats()
+
+@app.get("/cache/stats")
+async def get_user_cache_stats():
+    return {
+        "inventory": user_inventory.stats(),
+        "profiles": user_profiles.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "conditional": conditional_stats(),
+        "loads": {"inventory": inventory_loads.stats(), "profiles": profile_loads.stats()},
+        "storage": storage.stats(),
+    }
+
+# Кэши и очереди — снимаем их собственную статистику в момент выдачи /metrics
+def cache_stats() -> dict:
+    return {
+        "inventory": user_inventory.stats(),
+        "profiles": user_profiles.stats(),
+        "profile_listing": profile_listing_cache.stats(),
+        "predictions": {**prediction_cache.stats(), "entries": len(prediction_cache)},
+        "metadata": metadata_proxy.cache.stats(),
+    }
+
+def cache_metric(field: str):
+    return lambda: [((name,), stats[field]) for name, stats in cache_stats().items() if field in stats]
+
+def loads_metric(field: str):
+    return lambda: [(("inventory",), inventory_loads.stats()[field]), (("profiles",), profile_loads.stats()[field])]
+
+metrics_registry.callback("gamegems_cache_hits_total", "Попадания в кэш", "counter", ("cache",), cache_metric("hits"))
+metrics_registry.callback("gamegems_cache_misses_total", "Промахи кэша", "counter", ("cache",), cache_metric("misses"))
+metrics_registry.callback("gamegems_cache_hit_ratio", "Доля попаданий в кэш", "gauge", ("cache",), cache_metric("hit_rate"))
+metrics_registry.callback("gamegems_cache_entries", "Записей в кэше", "gauge", ("cache",), cache_metric("entries"))
+metrics_registry.callback("gamegems_cache_bytes", "Оценка памяти кэша", "gauge", ("cache",), cache_metric("bytes"))
+metrics_registry.callback("gamegems_s3_loads_total", "Загрузки из S3 при промахе", "counter", ("kind",), loads_metric("loads"))
+metrics_registry.callback(
+    "gamegems_s3_loads_coalesced_total", "Промахи, дождавшиеся чужой загрузки", "counter", ("kind",), loads_metric("coalesced"),
+)
+metrics_registry.callback(
+    "gamegems_conditional_responses_total", "Ответы условных GET (not_modified — 304)", "counter", ("route", "outcome"),
+    lambda: [(key, count) for key, count in conditional_gets.items()],
+)
+def storage_metric(field: str):
+    def collect():
+        stats = storage.stats()
+        return [((), stats[field])] if field in stats else []
+    return collect
+
+metrics_registry.callback(
+    "gamegems_storage_hot_hits_total", "Чтения, обслуженные горячим уровнем (SQLite)", "counter", (), storage_metric("hits"),
+)
+metrics_registry.callback(
+    "gamegems_storage_hot_misses_total", "Чтения, ушедшие в S3 мимо горячего уровня", "counter", (), storage_metric("misses"),
+)
+metrics_registry.callback(
+    "gamegems_storage_hot_evicted_total", "Строки, вытесненные из горячего уровня по лимиту", "counter", (),
+    storage_metric("evicted"),
+)
+metrics_registry.callback(
+    "gamegems_storage_hot_dirty", "Объекты горячего уровня, ещё не выгруженные в S3", "gauge", (), storage_metric("dirty"),
+)
+metrics_registry.callback(
+    "gamegems_write_back_dirty_keys", "Изменения, ещё не записанные в S3", "gauge", (),
+    lambda: [((), write_back.stats()["dirty_keys"])],
+)
+metrics_registry.callback(
+    "gamegems_write_back_flushes_total", "Записи отложенного буфера в S3", "counter", (),
+    lambda: [((), write_back.stats()["flushes"])],
+)
+metrics_registry.callback(
+    "gamegems_model_info", "Активная версия модели цены", "gauge", ("version",),
+    lambda: [((model_registry.active.version,), 1)] if model_registry.active else [],
+)
+metrics_registry.callback(
+    "gamegems_model_warmup_seconds", "Время загрузки и прогрева модели", "gauge", (),
+    lambda: [((), warmup_state["seconds"])] if warmup_state["seconds"] is not None else [],
+)
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/predict-price/model")
+async def get_price_model_status():
+    return model_registry.status()
+
+@app.post("/predict-price/model/reload")
+async def reload_price_model():
+    # Загрузка в фоне: запросы продолжают обслуживаться текущей версией
+    started = model_registry.load_in_background()
+    return {"status": "loading" if started else "already_loading", **model_registry.status()}
+
+@app.post("/predict-price/model/rollback")
+async def rollback_price_model():
+    try:
+        active = model_registry.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "ok", "active": active.info()}
@@ -0,0 +1,202 @@
+# metadata_proxy.py
+# Прокси метаданных NFT: общий пул соединений httpx, кэш LRU+TTL
+# с учётом Cache-Control/ETag, склейка одновременных запросов одного URL,
+# лимиты на размер ответа и общее время загрузки.
+import asyncio
+import json
+import re
+import time
+from typing import List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+try:
+    from .bounded_cache import BoundedCache
+except ImportError:  # запуск из папки backend/
+    from bounded_cache import BoundedCache
+
+
+class MetadataProxyError(Exception):
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_cache_control(header: Optional[str]) -> dict:
+    directives = {}
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+class MetadataProxy:
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        max_bytes: int = 32 * 1024 * 1024,
+        default_ttl: float = 300.0,
+        max_ttl: float = 3600.0,
+        timeout: float = 5.0,
+        max_response_bytes: int = 1024 * 1024,
+        max_connections: int = 64,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self.timeout = timeout
+        self.max_response_bytes = max_response_bytes
+        self.max_connections = max_connections
+        self.transport = transport
+        # url -> {"data", "size", "cache_control", "etag", "last_modified", "expires_at"}
+        self.cache = BoundedCache(max_entries=max_entries, max_bytes=max_bytes, sizer=lambda e: e["size"])
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._inflight = {}
+        self.fetches = 0
+        self.revalidations = 0
+        self.not_modified = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Пул привязан к циклу событий: в новом цикле создаём новый клиент
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                follow_redirects=True,
+            )
+            self._loop = loop
+            self._inflight = {}
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def clear(self):
+        self.cache.clear()
+        self._client = None
+        self._loop = None
+        self._inflight = {}
+
+    async def get(self, url: str):
+        scheme = urlparse(url).scheme
+        if scheme not in ("http", "https"):
+            raise MetadataProxyError(f"Поддерживаются только http(s) URL: {url}", status_code=400)
+
+        entry = self.cache.get(url)
+        if entry is not None and entry["expires_at"] > time.monotonic():
+            return entry["data"]
+
+        client = self._get_client()
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, url, entry))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    async def get_many(self, urls: List[str], concurrency: int = 32) -> list:
+        # [(url, данные | MetadataProxyError)] в исходном порядке
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(url):
+            async with semaphore:
+                try:
+                    return url, await self.get(url)
+                except MetadataProxyError as e:
+                    return url, e
+
+        return await asyncio.gather(*(one(url) for url in urls))
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, stale: Optional[dict]):
+        headers = {}
+        if stale is not None:
+            # Условный запрос: сервер ответит 304, если метаданные не менялись
+            if stale["etag"]:
+                headers["If-None-Match"] = stale["etag"]
+            if stale["last_modified"]:
+                headers["If-Modified-Since"] = stale["last_modified"]
+            self.revalidations += 1
+        self.fetches += 1
+
+        try:
+            # httpx.Timeout ограничивает каждую фазу (соединение, каждое чтение) отдельно;
+            # wait_for — вся загрузка вместе с телом, чтобы медленный шлюз не держал
+            # соединение пула и всех склеенных ожидающих
+            return await asyncio.wait_for(self._download(client, url, headers, stale), self.timeout)
+        except MetadataProxyError:
+            self.errors += 1
+            raise
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            self.errors += 1
+            raise MetadataProxyError(f"Таймаут загрузки {url}", status_code=504)
+        except Exception as e:
+            self.errors += 1
+            raise MetadataProxyError(f"Ошибка загрузки: {str(e)}")
+
+    async def _download(self, client: httpx.AsyncClient, url: str, headers: dict, stale: Optional[dict]):
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and stale is not None:
+                self.not_modified += 1
+                self._store(url, stale["data"], stale["size"], response, stale)
+                return stale["data"]
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > self.max_response_bytes:
+                raise MetadataProxyError(f"Ответ больше {self.max_response_bytes} байт", status_code=502)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > self.max_response_bytes:
+                    raise MetadataProxyError(f"Ответ больше {self.max_response_bytes} байт", status_code=502)
+            data = json.loads(body)
+            self._store(url, data, len(body), response, None)
+            return data
+
+    def _store(self, url: str, data, size: int, response: httpx.Response, stale: Optional[dict]):
+        # 304 обновляет заголовки сохранённого ответа только если прислал свои
+        header = response.headers.get("cache-control") or (stale or {}).get("cache_control")
+        cache_control = parse_cache_control(header)
+        if "no-store" in cache_control:
+            self.cache.pop(url, None)
+            return
+        ttl = self.default_ttl
+        max_age = cache_control.get("s-maxage") or cache_control.get("max-age")
+        if max_age and re.fullmatch(r"\d+", max_age):
+            ttl = min(int(max_age), self.max_ttl)
+        if "no-cache" in cache_control:
+            ttl = 0  # храним, но каждый раз ревалидируем
+        self.cache[url] = {
+            "data": data,
+            "size": size,
+            "cache_control": header,
+            "etag": response.headers.get("etag") or (stale or {}).get("etag"),
+            "last_modified": response.headers.get("last-modified") or (stale or {}).get("last_modified"),
+            "expires_at": time.monotonic() + ttl,
+        }
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "fetches": self.fetches,
+            "revalidations": self.revalidations,
+            "not_modified": self.not_modified,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+        }
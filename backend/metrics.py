@@ -0,0 +1,236 @@
+# metrics.py
+# Метрики в текстовом формате Prometheus (GET /metrics) без внешних зависимостей:
+# счётчики и гистограммы с метками, метрики-функции (значения снимаются при
+# выдаче — кэши, очереди), middleware с гистограммой задержки по маршрутам и
+# необязательный заголовок Server-Timing с разбивкой времени запроса (S3, модель).
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # метки -> [счётчики по корзинам..., сумма, число]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, *labels) -> int:
+        state = self._values.get(labels)
+        return state[-1] if state else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(labels, list(state)) for labels, state in self._values.items()]
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                bucket = format_labels(self.labelnames, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket} {cumulative}"
+            bucket = format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{bucket} {state[-1]}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(state[-2])}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {state[-1]}"
+
+
+class CallbackMetric:
+    # Значения снимаются при выдаче: fn() -> [(значения меток, число)]
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...], fn: Callable):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._fn():
+            yield f"{self.name}{format_labels(self.labelnames, tuple(labels))} {format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...], fn: Callable) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, kind, labelnames, fn))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # Метрика-функция не должна ронять всю выдачу
+                print(f"❌ Ошибка метрики {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# === Разбивка времени одного запроса (Server-Timing) ===
+class RequestTiming:
+    def __init__(self):
+        self.sections: Dict[str, list] = {}  # раздел -> [секунды, число вызовов]
+        self._lock = threading.Lock()  # S3-вызовы одного запроса идут из разных потоков
+
+    def add(self, section: str, seconds: float):
+        with self._lock:
+            entry = self.sections.setdefault(section, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total: float) -> str:
+        parts = [f'{name};dur={seconds * 1000:.2f};desc="{count}"' for name, (seconds, count) in self.sections.items()]
+        parts.append(f"app;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# Разбивка текущего запроса; None — заголовок выключен или вызов вне запроса.
+# В пул потоков S3 контекст переносит S3Storage.run.
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+
+def record_section(section: str, seconds: float):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(section, seconds)
+
+
+# === Обращения к S3 ===
+def key_prefix(key: str) -> str:
+    # Метка по первому сегменту ключа (inventories/, profiles/, NFT/, config/ ...)
+    head, sep, _ = key.partition("/")
+    return head + sep if sep else "(root)"
+
+
+class S3Metrics:
+    def __init__(self, registry: MetricsRegistry):
+        self.operations = registry.counter(
+            "gamegems_s3_operations_total", "Вызовы S3 по операции, префиксу ключа и исходу",
+            ("operation", "prefix", "outcome"),
+        )
+        self.duration = registry.histogram(
+            "gamegems_s3_operation_duration_seconds", "Длительность вызовов S3", ("operation", "prefix"),
+        )
+        self.bytes = registry.counter(
+            "gamegems_s3_bytes_total", "Байты, прочитанные из S3 и записанные в S3", ("direction", "prefix"),
+        )
+
+    def call(self, operation: str, key: str, seconds: float, outcome: str):
+        prefix = key_prefix(key)
+        self.operations.inc(operation, prefix, outcome)
+        self.duration.observe(seconds, operation, prefix)
+        record_section("s3", seconds)
+
+    def transferred(self, direction: str, key: str, size: int):
+        self.bytes.inc(direction, key_prefix(key), amount=size)
+
+
+# === Middleware задержки ===
+class MetricsMiddleware:
+    # Чистый ASGI: потоковые ответы не буферизуются, время считается до последнего куска тела
+    def __init__(self, app, duration: Histogram, server_timing: bool = False):
+        self.app = app
+        self.duration = duration
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+        token = None
+        timing = None
+        if self.server_timing:
+            timing = RequestTiming()
+            token = current_timing.set(timing)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if timing is not None:
+                    # Для потоковых ответов app — время до заголовков
+                    value = timing.header(time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if token is not None:
+                current_timing.reset(token)
+            # Шаблон маршрута (/inventory/{address}), а не путь — число меток ограничено
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.duration.observe(time.perf_counter() - started, scope["method"], path, str(status[0]))
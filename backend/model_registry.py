@@ -0,0 +1,96 @@
+# model_registry.py
+# Версионированный реестр модели цены: новая версия грузится в фоне и
+# атомарно подменяет активную, предыдущая остаётся для отката.
+import threading
+import time
+from typing import Callable, Optional
+
+
+class ModelVersion:
+    def __init__(self, version: str, model, source: str):
+        self.version = version
+        self.model = model
+        self.source = source
+        self.loaded_at = time.time()
+
+    def info(self) -> dict:
+        return {"version": self.version, "source": self.source, "loaded_at": self.loaded_at}
+
+
+class ModelRegistry:
+    def __init__(self, loader: Callable[[], ModelVersion], on_swap: Optional[Callable] = None):
+        # loader() читает модель с диска и возвращает ModelVersion
+        self._loader = loader
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        self.active: Optional[ModelVersion] = None
+        self.previous: Optional[ModelVersion] = None
+        self.last_error: Optional[str] = None
+
+    def _swap(self, new: ModelVersion):
+        with self._lock:
+            self.previous, self.active = self.active, new
+        if self._on_swap:
+            self._on_swap(new)
+
+    def load(self, force: bool = False) -> ModelVersion:
+        # Синхронная загрузка; одинаковую версию повторно не подменяем
+        try:
+            new = self._loader()
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        self.last_error = None
+        if force or self.active is None or new.version != self.active.version:
+            self._swap(new)
+        return self.active
+
+    def ensure(self) -> ModelVersion:
+        # Первая загрузка по требованию: одновременные вызовы ждут одну загрузку
+        if self.active is None:
+            with self._first_load:
+                if self.active is None:
+                    self.load()
+        return self.active
+
+    def load_in_background(self, force: bool = False) -> bool:
+        # Возвращает False, если загрузка уже идёт
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return False
+
+            def run():
+                try:
+                    self.load(force=force)
+                except Exception as e:
+                    print(f"❌ Ошибка загрузки модели: {e}")
+
+            self._loading = threading.Thread(target=run, name="model-reload", daemon=True)
+            self._loading.start()
+            return True
+
+    def wait(self, timeout: Optional[float] = None):
+        loading = self._loading
+        if loading is not None:
+            loading.join(timeout)
+
+    def rollback(self) -> ModelVersion:
+        with self._lock:
+            if self.previous is None:
+                raise RuntimeError("Нет предыдущей версии модели")
+            self.active, self.previous = self.previous, self.active
+            active = self.active
+        if self._on_swap:
+            self._on_swap(active)
+        return active
+
+    def status(self) -> dict:
+        loading = self._loading
+        return {
+            "active": self.active.info() if self.active else None,
+            "previous": self.previous.info() if self.previous else None,
+            "loading": loading is not None and loading.is_alive(),
+            "last_error": self.last_error,
+        }
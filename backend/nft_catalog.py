@@ -0,0 +1,244 @@
+# nft_catalog.py
+# Материализованный каталог NFT: все записи NFT/{tokenId}.json в памяти,
+# контрольная точка — один объект в S3. GET /nft больше не читает бакет.
+# В контрольной точке хранится ETag каждого объекта: при загрузке она сверяется
+# с листингом бакета, и дочитываются только новые и изменённые записи — поэтому
+# устаревшая (или потерянная) контрольная точка лишь замедляет загрузку.
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Callable, Optional
+
+try:
+    from .fast_json import dumps, loads
+    from .nft_index import NFTIndex
+except ImportError:  # запуск из папки backend/
+    from fast_json import dumps, loads
+    from nft_index import NFTIndex
+
+
+def record_hash(record: dict) -> int:
+    return int.from_bytes(hashlib.sha256(dumps(record)).digest()[:8], "big")
+
+
+class NFTCatalog:
+    def __init__(
+        self,
+        storage,
+        prefix: str,
+        checkpoint_key: str,
+        persist: Callable,
+        fetch_concurrency: int = 32,
+        checkpoint_every: int = 100,
+    ):
+        # persist(key, body, writer) — отложенная запись контрольной точки (write-back);
+        # checkpoint_every — через сколько изменений переписывать контрольную точку
+        self._storage = storage
+        self.fetch_concurrency = fetch_concurrency
+        self.prefix = prefix
+        self.checkpoint_key = checkpoint_key
+        self._persist = persist
+        self.checkpoint_every = checkpoint_every
+        self._records = {}
+        self._etags = {}  # tokenId -> ETag объекта в S3 (None — неизвестен, при загрузке перечитаем)
+        self._unsaved = 0  # изменений после последней контрольной точки
+        self._checkpoint_etag: Optional[str] = None
+        # Хэш каждой записи и XOR всех хэшей — отпечаток содержимого каталога
+        # для ETag выборок; обновляется за O(1) при изменении записи
+        self._hashes = {}
+        self.digest = 0
+        self.index = NFTIndex()
+        self._lock = threading.Lock()
+        self._load_lock: Optional[asyncio.Lock] = None
+        self.loaded = False
+        self.version = 0
+        self._snapshot = None  # (version, etag, body)
+
+    def reset(self):
+        with self._lock:
+            self._records = {}
+            self._etags = {}
+            self._unsaved = 0
+            self._checkpoint_etag = None
+            self._hashes = {}
+            self.digest = 0
+            self.index.clear()
+            self.loaded = False
+            self.version = 0
+            self._snapshot = None
+
+    def _token_key(self, token_id) -> str:
+        return f"{self.prefix}{token_id}.json"
+
+    async def _fetch(self, keys) -> dict:
+        records = {}
+        for key, data in await self._storage.get_many(keys, self.fetch_concurrency):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                if data is None:
+                    continue
+                record = loads(data)
+                records[record["tokenId"]] = record
+            except Exception as e:
+                print(f"❌ Ошибка чтения NFT {key}: {e}")
+        return records
+
+    async def ensure_loaded(self, rebuild: bool = False):
+        if self.loaded and not rebuild:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self.loaded and not rebuild:
+                return
+            await self._load(rebuild)
+
+    async def _load(self, rebuild: bool):
+        listing = {k: etag for k, etag in await self._storage.list_versioned(self.prefix) if k.endswith(".json")}
+        records, etags, version = {}, {}, 0
+
+        data, checkpoint_etag = await self._storage.get_versioned(self.checkpoint_key)
+        if data is not None:
+            checkpoint = loads(data)
+            version = checkpoint["version"]
+            known_etags = checkpoint.get("etags", {})
+            for nft in checkpoint["nfts"] if not rebuild else ():
+                records[nft["tokenId"]] = nft
+                etags[nft["tokenId"]] = known_etags.get(self._token_key(nft["tokenId"]))
+
+        # Сверяем контрольную точку с бакетом по ETag: удалённые убираем,
+        # новые и изменённые (другой ETag или неизвестный) дочитываем
+        from_checkpoint = len(records)
+        records = {
+            t: r for t, r in records.items()
+            if etags[t] is not None and etags[t] == listing.get(self._token_key(t))
+        }
+        known = {self._token_key(t) for t in records}
+        missing = [k for k in listing if k not in known]
+        fetched = await self._fetch(missing)
+        records.update(fetched)
+        etags = {t: listing.get(self._token_key(t)) for t in records}
+
+        changed = rebuild or bool(missing) or len(records) != from_checkpoint or version == 0
+        hashes = {t: record_hash(r) for t, r in records.items()}
+        digest = 0
+        for h in hashes.values():
+            digest ^= h
+        with self._lock:
+            self._records = records
+            self._etags = etags
+            self._checkpoint_etag = checkpoint_etag
+            self._hashes = hashes
+            self.digest = digest
+            self.index.rebuild(records)
+            self.version = version + 1 if changed else version
+            self._snapshot = None
+            self.loaded = True
+        if changed:
+            await self._checkpoint()
+        print(f"📚 Каталог NFT: {len(records)} записей, версия {self.version}, дочитано {len(missing)}")
+
+    async def upsert(self, record: dict, etag: Optional[str] = None):
+        # etag — ETag только что записанного NFT/{tokenId}.json
+        await self.ensure_loaded()
+        self.refresh(record, etag)
+        self._unsaved += 1
+        # Контрольную точку переписываем не на каждое изменение: несохранённые в ней
+        # записи при загрузке найдутся по листингу (новый ключ или другой ETag)
+        if self._unsaved >= self.checkpoint_every:
+            await self._checkpoint()
+
+    async def flush(self):
+        # Остановка воркера: сохранить изменения после последней контрольной точки
+        if self.loaded and self._unsaved:
+            await self._checkpoint()
+
+    def refresh(self, record: dict, etag: Optional[str] = None):
+        # Запись, уже сохранённая в S3 (например, другим воркером): только память
+        with self._lock:
+            token_id = record["tokenId"]
+            self._etags[token_id] = etag
+            previous = self._records.get(token_id)
+            if previous is not None:
+                self.index.remove(previous)
+                self.digest ^= self._hashes[token_id]
+            self._records[token_id] = record
+            self._hashes[token_id] = record_hash(record)
+            self.digest ^= self._hashes[token_id]
+            self.index.add(record)
+            self.version += 1
+
+    async def _checkpoint(self):
+        self._unsaved = 0
+        await self._persist(self.checkpoint_key, self._serialize_checkpoint, self._write_checkpoint)
+
+    def _serialize_checkpoint(self) -> str:
+        with self._lock:
+            nfts = list(self._records.values())
+            etags = {self._token_key(t): etag for t, etag in self._etags.items() if etag is not None}
+            version = self.version
+        return json.dumps({"version": version, "nfts": nfts, "etags": etags}, ensure_ascii=False)
+
+    def _write_checkpoint(self, key: str, body):
+        # Условная запись: не затираем вслепую контрольную точку другого воркера.
+        # Если та новее (версия больше) — оставляем её; наши изменения при загрузке
+        # всё равно найдутся по ETag
+        def rebase(data, etag):
+            if data is not None and loads(data)["version"] > self.version:
+                return None
+            return self._serialize_checkpoint()
+
+        self._checkpoint_etag = self._storage.put_conditional(key, body, self._checkpoint_etag, rebase)
+
+    def get(self, token_id) -> Optional[dict]:
+        return self._records.get(token_id)
+
+    def get_with_etag(self, token_id):
+        # (запись, ETag) или (None, None). ETag — тот же, что у объекта в S3, чтобы
+        # GET /nft/{tokenId} из каталога и напрямую из бакета давал один и тот же
+        # ETag (пересборка каталога или вытеснение записи не сбрасывают If-None-Match);
+        # хэш записи — только если ETag объекта неизвестен
+        with self._lock:
+            record = self._records.get(token_id)
+            if record is None:
+                return None, None
+            return record, self._etags.get(token_id) or f'"{self._hashes[token_id]:016x}"'
+
+    def query(self, **filters):
+        # Страница по фильтрам/сортировке: (записи, next_cursor)
+        with self._lock:
+            return self.index.query(self._records, **filters)
+
+    def query_etag(self, params: str) -> str:
+        # Страница — функция содержимого каталога и параметров запроса
+        with self._lock:
+            return self._query_etag(params)
+
+    def _query_etag(self, params: str) -> str:
+        return f'"q{self.digest:016x}-{hashlib.sha256(params.encode("utf-8")).hexdigest()[:12]}"'
+
+    def query_with_etag(self, params: str, **filters):
+        # (записи, next_cursor, ETag) — ETag той версии каталога, по которой собрана страница
+        with self._lock:
+            items, next_cursor = self.index.query(self._records, **filters)
+            return items, next_cursor, self._query_etag(params)
+
+    def snapshot(self):
+        # (etag, тело ответа) для GET /nft; сериализуем один раз на версию
+        with self._lock:
+            if self._snapshot is None or self._snapshot[0] != self.version:
+                records = [self._records[t] for t in sorted(self._records)]
+                body = dumps(records)
+                digest = hashlib.sha256(body).hexdigest()[:16]
+                self._snapshot = (self.version, f'"{digest}"', body)
+            return self._snapshot[1], self._snapshot[2]
+
+    def status(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "version": self.version,
+            "count": len(self._records),
+            "etag": self.snapshot()[0] if self.loaded else None,
+        }
@@ -0,0 +1,173 @@
+# nft_index.py
+# Вторичные индексы каталога NFT: равенство по owner / itemType / rarity
+# и отсортированные списки для сортировки и курсорной пагинации.
+# Страница стоит O(размер страницы), а не O(размер каталога).
+import base64
+import bisect
+import json
+from typing import Optional
+
+# Поле сортировки → функция ключа записи
+SORT_FIELDS = {
+    "tokenId": lambda record: record["tokenId"],
+    "bonus": lambda record: bonus_value(record),
+    "rarity": lambda record: record.get("rarity") or 0,
+}
+
+# Если после фильтров по равенству кандидатов меньше — сортируем их напрямую
+SMALL_CANDIDATE_SET = 2048
+
+
+def bonus_value(record: dict):
+    bonus = record.get("bonus")
+    if isinstance(bonus, dict):
+        value = bonus.get("value")
+        if isinstance(value, (int, float)):
+            return value
+    return 0
+
+
+def encode_cursor(position) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor: str, field: str = "tokenId"):
+    # Курсор — [значение поля сортировки, tokenId]; чужой или подделанный курсор —
+    # ValueError (400), а не TypeError при сравнении с записями индекса
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Некорректный курсор")
+    if not isinstance(position, list) or len(position) != 2:
+        raise ValueError("Некорректный курсор")
+    value, token_id = position
+    valid_value = isinstance(value, int) and not isinstance(value, bool) if field == "tokenId" else is_number(value)
+    if not valid_value or not isinstance(token_id, int) or isinstance(token_id, bool):
+        raise ValueError("Некорректный курсор")
+    return value, token_id
+
+
+class NFTIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.by_owner = {}
+        self.by_item_type = {}
+        self.by_rarity = {}
+        # (ключ сортировки, tokenId) по возрастанию
+        self.sorted = {field: [] for field in SORT_FIELDS}
+
+    def _equality_keys(self, record: dict):
+        return (
+            (self.by_owner, str(record.get("owner", "")).lower()),
+            (self.by_item_type, record.get("itemType")),
+            (self.by_rarity, record.get("rarity")),
+        )
+
+    def rebuild(self, records: dict):
+        self.clear()
+        for token_id, record in records.items():
+            for index, value in self._equality_keys(record):
+                index.setdefault(value, set()).add(token_id)
+        for field, key in SORT_FIELDS.items():
+            self.sorted[field] = sorted((key(r), t) for t, r in records.items())
+
+    def add(self, record: dict):
+        token_id = record["tokenId"]
+        for index, value in self._equality_keys(record):
+            index.setdefault(value, set()).add(token_id)
+        for field, key in SORT_FIELDS.items():
+            bisect.insort(self.sorted[field], (key(record), token_id))
+
+    def remove(self, record: dict):
+        token_id = record["tokenId"]
+        for index, value in self._equality_keys(record):
+            tokens = index.get(value)
+            if tokens is not None:
+                tokens.discard(token_id)
+                if not tokens:
+                    del index[value]
+        for field, key in SORT_FIELDS.items():
+            entries = self.sorted[field]
+            i = bisect.bisect_left(entries, (key(record), token_id))
+            if i < len(entries) and entries[i] == (key(record), token_id):
+                del entries[i]
+
+    def query(
+        self,
+        records: dict,
+        owner: Optional[str] = None,
+        item_type: Optional[str] = None,
+        rarity: Optional[int] = None,
+        min_bonus: Optional[float] = None,
+        max_bonus: Optional[float] = None,
+        sort: str = "tokenId",
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ):
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Неизвестное поле сортировки: {field}")
+        after = decode_cursor(cursor, field) if cursor else None
+
+        # Пересечение индексов по равенству, начиная с самого маленького
+        filters = []
+        if owner is not None:
+            filters.append(self.by_owner.get(owner.lower(), set()))
+        if item_type is not None:
+            filters.append(self.by_item_type.get(item_type, set()))
+        if rarity is not None:
+            filters.append(self.by_rarity.get(rarity, set()))
+        candidates = None
+        if filters:
+            filters.sort(key=len)
+            candidates = filters[0]
+            for other in filters[1:]:
+                candidates = candidates & other
+
+        def matches(token_id) -> bool:
+            if candidates is not None and token_id not in candidates:
+                return False
+            if min_bonus is None and max_bonus is None:
+                return True
+            bonus = bonus_value(records[token_id])
+            return (min_bonus is None or bonus >= min_bonus) and (max_bonus is None or bonus <= max_bonus)
+
+        key = SORT_FIELDS[field]
+        if candidates is not None and len(candidates) <= SMALL_CANDIDATE_SET:
+            entries = sorted((key(records[t]), t) for t in candidates)
+        else:
+            entries = self.sorted[field]
+
+        # При сортировке по бонусу диапазон сразу сужает окно индекса
+        low, high = 0, len(entries)
+        if field == "bonus":
+            if min_bonus is not None:
+                low = bisect.bisect_left(entries, (min_bonus,))
+            if max_bonus is not None:
+                high = bisect.bisect_left(entries, (max_bonus, float("inf")))
+
+        # Стартовая позиция — сразу после курсора в выбранном порядке
+        if descending:
+            start = min(bisect.bisect_left(entries, after), high) if after else high
+            positions = range(start - 1, low - 1, -1)
+        else:
+            start = max(bisect.bisect_right(entries, after), low) if after else low
+            positions = range(start, high)
+
+        page = []
+        last = None
+        for i in positions:
+            entry = entries[i]
+            if matches(entry[1]):
+                if len(page) == limit:
+                    return page, encode_cursor(last)
+                page.append(records[entry[1]])
+                last = entry
+        return page, None
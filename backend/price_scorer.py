@@ -0,0 +1,130 @@
+# price_scorer.py
+# Лёгкий скорер модели цены NFT: только NumPy, без pandas и sklearn.
+# Массивы готовит ml_model/export_model.py из nft_price_regressor.pkl.
+import hashlib
+import numpy as np
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ArrayPriceModel:
+    # Случайный лес, развёрнутый в плоские массивы узлов всех деревьев.
+    # Листья ссылаются сами на себя, поэтому обход — фиксированное число шагов.
+    def __init__(self, arrays):
+        self.categorical_columns = [str(c) for c in arrays["categorical_columns"]]
+        self.passthrough_columns = [str(c) for c in arrays["passthrough_columns"]]
+        self.n_features = int(arrays["n_features"])
+        self.source_sha256 = str(arrays["source_sha256"])
+
+        # {колонка: {категория: позиция внутри колонки}}
+        self.categories = {}
+        self.category_offset = {}
+        offset = 0
+        for i, column in enumerate(self.categorical_columns):
+            categories = [str(c) for c in arrays[f"categories_{i}"]]
+            self.categories[column] = {c: j for j, c in enumerate(categories)}
+            self.category_offset[column] = offset
+            offset += len(categories)
+        self.passthrough_index = {c: offset + j for j, c in enumerate(self.passthrough_columns)}
+
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.max_depth = int(arrays["max_depth"])
+
+        self.lookup = None
+        if len(self.passthrough_columns) == 1:
+            self._build_lookup()
+
+    @classmethod
+    def load(cls, path: str) -> "ArrayPriceModel":
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls({key: arrays[key] for key in arrays.files})
+
+    def _build_lookup(self):
+        # Один числовой признак: при фиксированных категориях лес — ступенчатая
+        # функция от него с порогами из деревьев. Считаем значение на каждой
+        # ступеньке для всех комбинаций категорий (включая неизвестную).
+        numeric = self.passthrough_index[self.passthrough_columns[0]]
+        self.breakpoints = np.unique(self.threshold[self.feature == numeric])
+        # x <= t для всех порогов t >= B[i], поэтому B[i] представляет ступеньку i
+        representatives = np.append(self.breakpoints, np.inf)
+
+        sizes = [len(self.categories[c]) + 1 for c in self.categorical_columns]
+        n_combos = int(np.prod(sizes))
+        X = np.zeros((n_combos, len(representatives), self.n_features))
+        for combo in range(n_combos):
+            codes = np.unravel_index(combo, sizes)
+            for column, code in zip(self.categorical_columns, codes):
+                if code < len(self.categories[column]):
+                    X[combo, :, self.category_offset[column] + code] = 1.0
+        X[:, :, numeric] = representatives
+
+        flat = X.reshape(-1, self.n_features)
+        self.lookup = self._predict_trees(flat).reshape(n_combos, len(representatives))
+        self.category_sizes = sizes
+
+    def encode(self, rows) -> np.ndarray:
+        # Повторяет ColumnTransformer(OneHotEncoder(handle_unknown='ignore') + passthrough)
+        X = np.zeros((len(rows), self.n_features), dtype=np.float64)
+        for i, row in enumerate(rows):
+            for column, index in self.categories.items():
+                j = index.get(row[column])
+                if j is not None:
+                    X[i, self.category_offset[column] + j] = 1.0
+            for column, j in self.passthrough_index.items():
+                X[i, j] = row[column]
+        # Деревья sklearn сравнивают признаки во float32
+        return X.astype(np.float32).astype(np.float64)
+
+    def _predict_trees(self, X: np.ndarray) -> np.ndarray:
+        row_index = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[row_index, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # sklearn суммирует деревья последовательно — cumsum даёт тот же порядок сложения
+        leaf_values = self.value[nodes]
+        return np.cumsum(leaf_values, axis=1)[:, -1] / len(self.roots)
+
+    def _predict_lookup(self, rows) -> np.ndarray:
+        combos = np.zeros(len(rows), dtype=np.int64)
+        numeric = np.empty(len(rows), dtype=np.float32)
+        column = self.passthrough_columns[0]
+        for i, row in enumerate(rows):
+            combo = 0
+            for name, size in zip(self.categorical_columns, self.category_sizes):
+                combo = combo * size + self.categories[name].get(row[name], size - 1)
+            combos[i] = combo
+            numeric[i] = row[column]
+        steps = np.searchsorted(self.breakpoints, numeric.astype(np.float64), side="left")
+        return self.lookup[combos, steps]
+
+    def predict(self, rows) -> np.ndarray:
+        if len(rows) == 0:
+            return np.zeros(0)
+        if self.lookup is not None:
+            return self._predict_lookup(rows)
+        return self._predict_trees(self.encode(rows))
+
+
+class SklearnPriceModel:
+    # Исходный пайплайн из .pkl с тем же интерфейсом predict(rows)
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    @classmethod
+    def load(cls, path: str) -> "SklearnPriceModel":
+        import joblib
+        return cls(joblib.load(path))
+
+    def predict(self, rows) -> np.ndarray:
+        import pandas as pd
+        return self.pipeline.predict(pd.DataFrame(list(rows)))
@@ -1,31 +1,44 @@
 # s3_utils.py
-import boto3
 import os
 from dotenv import load_dotenv
 import uuid
 import json
 
-load_dotenv()
+try:
+    from .tiered_storage import make_storage
+except ImportError:  # запуск из папки backend/
+    from tiered_storage import make_storage
 
-s3 = boto3.client(
-    service_name='s3',
-    endpoint_url=os.getenv("S3_ENDPOINT_URL"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+load_dotenv()
 
 BUCKET = os.getenv("S3_BUCKET_NAME")
 
+# boto3 импортируется и клиент создаётся при первом сохранении, а не при импорте модуля
+s3 = None
+
+
+def get_client():
+    global s3
+    if s3 is None:
+        import boto3
+        s3 = boto3.client(
+            service_name='s3',
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+        )
+    return s3
+
+
+# Тот же интерфейс хранилища, что и в main.py. Ключи inventory/ не входят в горячие
+# префиксы, поэтому локальный уровень здесь не нужен — пишем сразу в S3
+storage = make_storage(get_client, BUCKET, max_workers=4)
+
 
 def save_item_to_s3(user_address: str, item_data: dict):
     folder = f"inventory/{user_address.lower()}"
     file_name = f"{uuid.uuid4()}.json"
     key = f"{folder}/{file_name}"
 
-    s3.put_object(
-        Bucket=BUCKET,
-        Key=key,
-        Body=json.dumps(item_data),
-        ContentType='application/json'
-    )
+    storage.put_bytes(key, json.dumps(item_data), ContentType='application/json')
     return key  # можно вернуть URL или путь
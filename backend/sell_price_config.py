@@ -0,0 +1,115 @@
+# sell_price_config.py
+# Цены продажи по редкости: текущая версия в памяти, источник правды —
+# config/sell_prices.json в S3 ({"version": n, "prices": {...}}).
+# Обновление с диска идёт условным GET (If-None-Match по ETag объекта), новая
+# версия подменяется целиком одним присваиванием — читатели видят либо старый,
+# либо новый снимок. Тело ответа и его ETag считаются один раз на версию.
+import hashlib
+import json
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+try:
+    from .storage import is_conflict
+except ImportError:  # запуск из папки backend/
+    from storage import is_conflict
+
+DEFAULT_SELL_PRICES = {"common": 5, "rare": 20, "epic": 50, "legendary": 100}
+SELL_PRICE_RARITIES = tuple(DEFAULT_SELL_PRICES)
+
+
+class SellPriceSnapshot:
+    __slots__ = ("prices", "version", "s3_etag", "body", "etag")
+
+    def __init__(self, prices: dict, version: int, s3_etag: Optional[str]):
+        self.prices = prices
+        self.version = version
+        self.s3_etag = s3_etag  # ETag объекта в S3, для условных GET/PUT
+        self.body = json.dumps(prices, ensure_ascii=False).encode("utf-8")
+        # ETag ответа зависит только от содержимого: у всех воркеров он одинаковый
+        self.etag = f'"v{version}-{hashlib.sha256(self.body).hexdigest()[:16]}"'
+
+
+def parse_sell_prices(data: bytes):
+    # (цены, версия); старый формат — просто словарь цен, версия 0
+    config = json.loads(data)
+    if "prices" in config and "version" in config:
+        return config["prices"], config["version"]
+    return config, 0
+
+
+def serialize_sell_prices(prices: dict, version: int) -> str:
+    return json.dumps({"version": version, "prices": prices}, ensure_ascii=False)
+
+
+class SellPriceConfig:
+    def __init__(self, storage, key: str):
+        self._storage = storage
+        self.key = key
+        self.current = SellPriceSnapshot(dict(DEFAULT_SELL_PRICES), 0, None)
+        self.refreshes = 0
+        self.not_modified = 0
+        self.swaps = 0
+
+    def reset(self):
+        self.current = SellPriceSnapshot(dict(DEFAULT_SELL_PRICES), 0, None)
+
+    def _swap(self, prices: dict, version: int, s3_etag: Optional[str]) -> SellPriceSnapshot:
+        snapshot = SellPriceSnapshot(prices, version, s3_etag)
+        self.current = snapshot
+        self.swaps += 1
+        return snapshot
+
+    def refresh(self) -> bool:
+        # Синхронно, в потоке ввода-вывода. True — подменили версию
+        self.refreshes += 1
+        changed, data, etag = self._storage.get_if_changed(self.key, self.current.s3_etag)
+        if not changed:
+            self.not_modified += 1
+            return False
+        if data is None:
+            # Конфига ещё нет: записываем цены по умолчанию, если нас никто не опередил
+            prices = dict(DEFAULT_SELL_PRICES)
+            try:
+                etag = self._storage.put_bytes(self.key, serialize_sell_prices(prices, 1), IfNoneMatch="*")
+            except ClientError as e:
+                if not is_conflict(e):
+                    raise
+                return self.refresh()
+            self._swap(prices, 1, etag)
+            return True
+        prices, version = parse_sell_prices(data)
+        self._swap(prices, version, etag)
+        return True
+
+    def update(self, new_prices: dict) -> SellPriceSnapshot:
+        # Меняем только известные редкости; если другой воркер успел записать
+        # свою версию, накладываем наши значения поверх неё
+        changes = {rarity: new_prices[rarity] for rarity in SELL_PRICE_RARITIES if rarity in new_prices}
+        written = {}
+
+        def build(prices: dict, version: int) -> str:
+            written["prices"] = {**prices, **changes}
+            written["version"] = version + 1
+            return serialize_sell_prices(written["prices"], written["version"])
+
+        def rebase(data, etag):
+            if data is None:
+                return build(dict(DEFAULT_SELL_PRICES), 0)
+            return build(*parse_sell_prices(data))
+
+        current = self.current
+        etag = self._storage.put_conditional(
+            self.key, build(current.prices, current.version), current.s3_etag, rebase
+        )
+        return self._swap(written["prices"], written["version"], etag)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.current.version,
+            "etag": self.current.etag,
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified,
+            "swaps": self.swaps,
+        }
@@ -0,0 +1,73 @@
+# single_flight.py
+# Одна загрузка на ключ: одновременные промахи по одному адресу ждут общий
+# результат, а не читают S3 каждый сам. Результат None («объекта нет», NoSuchKey)
+# запоминается на negative_ttl секунд, чтобы шторм запросов нового игрока
+# не превращался в шторм GET к S3.
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+try:
+    from .bounded_cache import BoundedCache
+except ImportError:  # запуск из папки backend/
+    from bounded_cache import BoundedCache
+
+
+class SingleFlight:
+    def __init__(self, negative_ttl: float = 5.0, max_negative: int = 10000):
+        self.negative: Optional[BoundedCache] = None
+        if negative_ttl > 0:
+            self.negative = BoundedCache(max_entries=max_negative, ttl=negative_ttl)
+        self._inflight = {}
+        self._loop = None
+        self.loads = 0
+        self.coalesced = 0
+        self.negative_hits = 0
+
+    async def load(self, key: str, loader: Callable[[], Awaitable]):
+        if self.negative is not None and key in self.negative:
+            self.negative_hits += 1
+            return None
+        # Задачи привязаны к циклу событий: в новом цикле начинаем с чистого листа
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._inflight = {}
+            self._loop = loop
+        task = self._inflight.get(key)
+        if task is None:
+            self.loads += 1
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is not task:
+            return  # ключ сброшен через forget, пока шла загрузка: результат не запоминаем
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result() is None and self.negative is not None:
+            self.negative[key] = True
+
+    def forget(self, key: str):
+        # Объект создан или изменён: запомненный промах и начатая загрузка больше не верны
+        if self.negative is not None:
+            self.negative.invalidate(key)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        if self.negative is not None:
+            self.negative.clear()
+        self._inflight = {}
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "negative_hits": self.negative_hits,
+            "negative_entries": len(self.negative) if self.negative is not None else 0,
+            "inflight": len(self._inflight),
+        }
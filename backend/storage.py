@@ -0,0 +1,245 @@
+# storage.py
+# Небольшой интерфейс к S3 поверх boto3: синхронные методы для фоновых потоков
+# и async-обёртки для эндпойнтов. Блокирующие вызовы boto3 идут в отдельный
+# ограниченный пул потоков, размер которого совпадает с пулом соединений botocore.
+import asyncio
+import contextvars
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, Union
+
+from botocore.exceptions import ClientError
+
+
+def is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound")
+
+
+def is_not_modified(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("304", "NotModified")
+
+
+def is_conflict(error: ClientError) -> bool:
+    # 412 — не выполнено условие If-Match/If-None-Match,
+    # 409 — S3 отклонил одновременную условную запись того же ключа
+    code = error.response.get("Error", {}).get("Code")
+    return code in ("PreconditionFailed", "412", "ConditionalRequestConflict", "409")
+
+
+class WriteConflict(Exception):
+    pass
+
+
+def conflict_backoff(attempt: int, base: float = 0.005):
+    # Случайная пауза перед повтором, чтобы воркеры не сталкивались снова и снова
+    time.sleep(random.uniform(0, base * (2 ** min(attempt, 6))))
+
+
+def error_outcome(error: ClientError) -> str:
+    # Исход вызова для метрик
+    if is_not_found(error):
+        return "not_found"
+    if is_not_modified(error):
+        return "not_modified"
+    if is_conflict(error):
+        return "conflict"
+    return "error"
+
+
+class S3Storage:
+    def __init__(self, client: Callable[[], object], bucket: Optional[str], max_workers: int = 64, metrics=None):
+        # client() возвращает текущий boto3-клиент (в тестах его подменяют);
+        # metrics — S3Metrics: call(операция, ключ, секунды, исход), transferred(направление, ключ, байт)
+        self._client = client
+        self.bucket = bucket
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-io")
+
+    def _call(self, operation: str, key: str, **kwargs):
+        # Все вызовы boto3 идут отсюда: учёт операций, исходов и времени по префиксу ключа
+        if self.metrics is None:
+            return getattr(self._client(), operation)(Bucket=self.bucket, **kwargs)
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return getattr(self._client(), operation)(Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            outcome = error_outcome(e)
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.metrics.call(operation, key, time.perf_counter() - started, outcome)
+
+    def _read_body(self, key: str, response) -> bytes:
+        data = response["Body"].read()
+        if self.metrics is not None:
+            self.metrics.transferred("read", key, len(data))
+        return data
+
+    # === Синхронный API ===
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        # None — объекта нет
+        try:
+            response = self._call("get_object", key, Key=key)
+        except ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+        return self._read_body(key, response)
+
+    def get_bytes_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        # (данные, ETag); (None, None) — объекта нет
+        try:
+            response = self._call("get_object", key, Key=key)
+        except ClientError as e:
+            if is_not_found(e):
+                return None, None
+            raise
+        return self._read_body(key, response), response.get("ETag")
+
+    def get_if_changed(self, key: str, etag: Optional[str]) -> Tuple[bool, Optional[bytes], Optional[str]]:
+        # Условный GET (If-None-Match): (изменился ли, данные, ETag);
+        # (False, None, etag) — объект тот же, тело не передавалось; (True, None, None) — объекта нет
+        extra = {"IfNoneMatch": etag} if etag else {}
+        try:
+            response = self._call("get_object", key, Key=key, **extra)
+        except ClientError as e:
+            if is_not_modified(e):
+                return False, None, etag
+            if is_not_found(e):
+                return True, None, None
+            raise
+        return True, self._read_body(key, response), response.get("ETag")
+
+    def put_bytes(self, key: str, body, **extra) -> Optional[str]:
+        if isinstance(body, str):
+            body = body.encode("utf-8")  # boto3 всё равно кодирует строку; так знаем размер
+        response = self._call("put_object", key, Key=key, Body=body, **extra)
+        if self.metrics is not None and isinstance(body, (bytes, bytearray)):
+            self.metrics.transferred("write", key, len(body))
+        return (response or {}).get("ETag")
+
+    def put_conditional(
+        self,
+        key: str,
+        body,
+        etag: Optional[str],
+        rebase: Callable[[Optional[bytes], Optional[str]], object],
+        retries: int = 8,
+    ) -> Optional[str]:
+        # Оптимистичная запись: If-Match по ETag, с которого читали (None — объекта
+        # не было, If-None-Match: *). При конфликте перечитываем объект,
+        # rebase(данные, etag) накладывает наши изменения и возвращает новое тело.
+        for attempt in range(retries):
+            condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+            try:
+                return self.put_bytes(key, body, **condition)
+            except ClientError as e:
+                if not is_conflict(e):
+                    raise
+            if attempt:
+                conflict_backoff(attempt)
+            data, etag = self.get_bytes_versioned(key)
+            body = rebase(data, etag)
+            if body is None:
+                return etag  # после перечтения записывать нечего
+        raise WriteConflict(f"Не удалось записать {key}: конфликт после {retries} попыток")
+
+    def delete_keys(self, keys: List[str]) -> int:
+        # delete_objects — до 1000 ключей за вызов; отсутствующий ключ не ошибка
+        deleted = 0
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            response = self._call(
+                "delete_objects", batch[0], Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+            errors = (response or {}).get("Errors") or []
+            for error in errors:
+                print(f"❌ Не удалось удалить {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+            deleted += len(batch) - len(errors)
+        return deleted
+
+    def list_page(self, prefix: str, page_args: dict):
+        # Одна страница листинга: ([(ключ, ETag)], аргументы следующей страницы или None)
+        response = self._call("list_objects_v2", prefix, Prefix=prefix, **page_args)
+        entries = [(obj["Key"], obj.get("ETag")) for obj in response.get("Contents", [])]
+        if not response.get("IsTruncated"):
+            return entries, None
+        return entries, {"ContinuationToken": response["NextContinuationToken"]}
+
+    def list_entries(self, prefix: str, start_after: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+        # [(ключ, ETag)]; list_objects_v2 отдаёт не больше 1000 ключей — идём по страницам.
+        # start_after — только ключи после данного (по алфавиту)
+        entries = []
+        page_args = {"StartAfter": start_after} if start_after else {}
+        while page_args is not None:
+            page, page_args = self.list_page(prefix, page_args)
+            entries.extend(page)
+        return entries
+
+    def list_keys(self, prefix: str, start_after: Optional[str] = None) -> List[str]:
+        return [key for key, _ in self.list_entries(prefix, start_after)]
+
+    # === Жизненный цикл (у многоуровневого хранилища — холодный старт и выгрузка) ===
+    def start(self):
+        pass
+
+    def stop(self) -> int:
+        return 0
+
+    def evict(self, key: str):
+        # Объект изменён другим узлом; у S3 без локального уровня сбрасывать нечего
+        pass
+
+    def stats(self) -> dict:
+        return {"tier": "s3"}
+
+    # === Async API ===
+    async def run(self, fn: Callable, *args, **kwargs):
+        # Любой блокирующий код с S3 — в пул ввода-вывода. Контекст (разбивка
+        # времени текущего запроса для Server-Timing) переносим в поток
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, lambda: context.run(fn, *args, **kwargs))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.run(self.get_bytes, key)
+
+    async def put(self, key: str, body, **extra) -> Optional[str]:
+        return await self.run(self.put_bytes, key, body, **extra)
+
+    async def get_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        return await self.run(self.get_bytes_versioned, key)
+
+    async def list(self, prefix: str, start_after: Optional[str] = None) -> List[str]:
+        return await self.run(self.list_keys, prefix, start_after)
+
+    async def list_versioned(self, prefix: str) -> List[Tuple[str, Optional[str]]]:
+        return await self.run(self.list_entries, prefix)
+
+    async def list_pages(self, prefix: str):
+        # Листинг по страницам: следующая запрашивается, только когда дочитали текущую
+        page_args = {}
+        while page_args is not None:
+            page, page_args = await self.run(self.list_page, prefix, page_args)
+            yield page
+
+    async def get_many(
+        self, keys: List[str], concurrency: int = 32
+    ) -> List[Tuple[str, Union[bytes, None, Exception]]]:
+        # Параллельное чтение не больше concurrency ключей одновременно.
+        # Ошибка одного ключа не роняет остальные: вместо данных — исключение.
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(key):
+            async with semaphore:
+                try:
+                    return key, await self.get(key)
+                except Exception as e:
+                    return key, e
+
+        return await asyncio.gather(*(fetch(key) for key in keys))
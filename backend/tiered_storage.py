@@ -0,0 +1,535 @@
+# tiered_storage.py
+# Двухуровневое хранилище с тем же интерфейсом, что у S3Storage: горячий уровень —
+# локальная SQLite (один файл на узел, общий для воркеров), холодный — S3.
+# На горячем уровне живут только ключи HOT_PREFIXES (инвентари, журнал
+# инвентаря, профили, конфиг цен); NFT и всё остальное идут прямо в S3.
+#
+#   write_mode="through" — запись сначала в S3 (условия If-Match/If-None-Match
+#       проверяет S3), затем в SQLite. Чтение — из SQLite, промах дочитывается из
+#       S3; запись старше ttl перепроверяется условным GET (304 — без тела).
+#       Безопасно для нескольких узлов.
+#   write_mode="back" — SQLite — источник правды узла: условия проверяются в
+#       транзакции SQLite, в S3 изменения уходят фоновым потоком. На холодном
+#       старте (пустой файл) горячие префиксы целиком перечитываются из S3;
+#       незаписанные в S3 строки переживают перезапуск. Только для одного узла
+#       (все воркеры пишут в один файл).
+#
+# Размер файла в режиме through ограничен (max_rows, max_bytes): сверх лимита
+# вытесняются сохранённые в S3 строки, дольше всех не читавшиеся из S3 и не
+# проверявшиеся (LRU по validated). В режиме back SQLite — источник правды и
+# хранит весь горячий набор; его размер ограничен самими данными (сегменты
+# журнала, вошедшие в снимок, удаляются вместе с S3 — см. delete_keys).
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+try:
+    from .storage import S3Storage, is_conflict
+except ImportError:  # запуск из папки backend/
+    from storage import S3Storage, is_conflict
+
+HOT_PREFIXES = ("inventories/", "inventory_log/", "profiles/", "config/")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT NOT NULL,
+    s3_etag TEXT,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    validated REAL NOT NULL DEFAULT 0,
+    content_type TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_dirty ON objects (dirty) WHERE dirty = 1;
+CREATE INDEX IF NOT EXISTS objects_validated ON objects (validated) WHERE dirty = 0;
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def body_etag(body: bytes) -> str:
+    # Как у S3 для обычного PUT: MD5 тела в кавычках
+    return '"%s"' % hashlib.md5(body).hexdigest()
+
+
+def precondition_failed(key: str) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": "PreconditionFailed", "Message": f"Условие записи {key} не выполнено"}}, "PutObject"
+    )
+
+
+def prefix_bounds(prefix: str) -> Tuple[str, str]:
+    # Ключи с префиксом — диапазон [prefix, prefix с увеличенным последним символом)
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class LocalStore:
+    # Ключ → (тело, etag) в SQLite. Одно соединение на процесс под блокировкой;
+    # WAL позволяет другим воркерам читать во время записи
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(objects)")}
+        if "content_type" not in columns:  # файл, созданный до появления колонки
+            self._conn.execute("ALTER TABLE objects ADD COLUMN content_type TEXT")
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: str):
+        # (тело, etag, проверено в) или None
+        with self._lock:
+            return self._conn.execute(
+                "SELECT body, etag, validated FROM objects WHERE key = ?", (key,)
+            ).fetchone()
+
+    def put_clean(self, key: str, body: bytes, etag: str, only_missing: bool = False):
+        # Копия того, что лежит в S3 (etag совпадает с S3). Несохранённые в S3 строки не трогаем
+        verb = "INSERT OR IGNORE" if only_missing else "INSERT"
+        with self._lock:
+            self._conn.execute(
+                f"{verb} INTO objects (key, body, etag, s3_etag, dirty, version, validated) VALUES (?, ?, ?, ?, 0, 0, ?)"
+                + ("" if only_missing else
+                   " ON CONFLICT(key) DO UPDATE SET body = excluded.body, etag = excluded.etag,"
+                   " s3_etag = excluded.s3_etag, validated = excluded.validated, version = version + 1"
+                   " WHERE dirty = 0"),
+                (key, body, etag, etag, time.time()),
+            )
+
+    def put_dirty(
+        self,
+        key: str,
+        body: bytes,
+        if_match: Optional[str],
+        if_none_match: Optional[str],
+        content_type: Optional[str] = None,
+    ) -> str:
+        # Условная запись в транзакции: условие и запись атомарны и между процессами.
+        # content_type уйдёт в S3 вместе с телом при выгрузке
+        etag = body_etag(body)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+                if (if_none_match == "*" and row is not None) or (
+                    if_match is not None and (row is None or row[0] != if_match)
+                ):
+                    raise precondition_failed(key)
+                self._conn.execute(
+                    "INSERT INTO objects (key, body, etag, dirty, version, validated, content_type)"
+                    " VALUES (?, ?, ?, 1, 0, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET body = excluded.body, etag = excluded.etag,"
+                    " dirty = 1, version = version + 1, validated = excluded.validated,"
+                    " content_type = excluded.content_type",
+                    (key, body, etag, time.time(), content_type),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return etag
+
+    def touch(self, key: str):
+        with self._lock:
+            self._conn.execute("UPDATE objects SET validated = ? WHERE key = ?", (time.time(), key))
+
+    def evict(self, key: str, etag: Optional[str] = None):
+        # Только сохранённые в S3 строки; etag — удалить, лишь если копия именно этой версии
+        with self._lock:
+            if etag is None:
+                self._conn.execute("DELETE FROM objects WHERE key = ? AND dirty = 0", (key,))
+            else:
+                self._conn.execute("DELETE FROM objects WHERE key = ? AND dirty = 0 AND etag = ?", (key, etag))
+
+    def delete(self, keys: List[str]):
+        # Объекты удалены и из S3: убираем строки в любом состоянии
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                self._conn.execute(f"DELETE FROM objects WHERE key IN ({','.join('?' * len(batch))})", batch)
+
+    def used_bytes(self) -> int:
+        # Занятые страницы файла (без свободных после удаления) — без обхода таблицы
+        with self._lock:
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return (pages - free) * size
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+    def trim(self, max_rows: int = 0, max_bytes: int = 0) -> int:
+        # Вытесняем сохранённые в S3 строки, дольше всех не проверявшиеся, пока не уложимся в лимиты
+        evicted = 0
+        for _ in range(8):
+            rows = self.count()
+            excess = rows - max_rows if max_rows else 0
+            if max_bytes and rows:
+                used = self.used_bytes()
+                if used > max_bytes:
+                    # Сколько строк освободит лишние байты при среднем размере строки
+                    excess = max(excess, rows * (used - max_bytes) // used + 1)
+            if excess <= 0:
+                break
+            with self._lock:
+                deleted = self._conn.execute(
+                    "DELETE FROM objects WHERE key IN"
+                    " (SELECT key FROM objects WHERE dirty = 0 ORDER BY validated LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            evicted += deleted
+            if deleted < excess:
+                break  # остались только несохранённые строки
+        return evicted
+
+    def evict_prefix(self, prefix: str):
+        low, high = prefix_bounds(prefix)
+        with self._lock:
+            self._conn.execute("DELETE FROM objects WHERE key >= ? AND key < ? AND dirty = 0", (low, high))
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> List[Tuple[str, str]]:
+        low, high = prefix_bounds(prefix)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, etag FROM objects WHERE key >= ? AND key < ? AND key > ? ORDER BY key",
+                (low, high, start_after or ""),
+            ).fetchall()
+
+    def etags(self, keys: List[str]) -> dict:
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, etag, dirty FROM objects WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {key: (etag, dirty) for key, etag, dirty in rows}
+
+    def dirty(self, limit: int = 256) -> List[Tuple[str, bytes, int, Optional[str]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, body, version, content_type FROM objects WHERE dirty = 1 LIMIT ?", (limit,)
+            ).fetchall()
+
+    def mark_uploaded(self, key: str, version: int, s3_etag: Optional[str]):
+        # Строку успели изменить во время загрузки — она остаётся грязной
+        with self._lock:
+            self._conn.execute(
+                "UPDATE objects SET dirty = 0, s3_etag = ? WHERE key = ? AND version = ?", (s3_etag, key, version)
+            )
+
+    def count_dirty(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM objects WHERE dirty = 1").fetchone()[0]
+
+    def get_meta(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def delete_meta(self, name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM meta WHERE name = ?", (name,))
+
+
+class TieredStorage(S3Storage):
+    def __init__(
+        self,
+        local: LocalStore,
+        client,
+        bucket: Optional[str],
+        write_mode: str = "through",
+        ttl: float = 60.0,
+        upload_interval: float = 1.0,
+        hot_prefixes=HOT_PREFIXES,
+        max_workers: int = 64,
+        metrics=None,
+        max_rows: int = 0,
+        max_bytes: int = 0,
+        trim_every: int = 256,
+    ):
+        if write_mode not in ("through", "back"):
+            raise ValueError(f"Неизвестный режим записи: {write_mode}")
+        super().__init__(client, bucket, max_workers=max_workers, metrics=metrics)
+        self.local = local
+        self.write_mode = write_mode
+        self.ttl = ttl  # through: сколько доверяем локальной копии без проверки в S3
+        self.upload_interval = upload_interval
+        self.hot_prefixes = tuple(hot_prefixes)
+        # through: лимиты горячего уровня (0 — без лимита), проверяются раз в trim_every копий
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.trim_every = trim_every
+        self._copies = 0
+        # back: пока горячий уровень не перечитан из S3 (start), работаем как through
+        self.hydrated = local.get_meta("hydrated") is not None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._uploader: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.rehydrated = 0
+        self.uploads = 0
+        self.upload_errors = 0
+        self.evicted = 0
+
+    def is_hot(self, key: str) -> bool:
+        return key.startswith(self.hot_prefixes)
+
+    @property
+    def authoritative(self) -> bool:
+        # SQLite — источник правды: условия и промахи решаются локально, без S3
+        return self.write_mode == "back" and self.hydrated
+
+    def _keep(self, key: str, body: bytes, etag: str):
+        # Копия объекта из S3 в горячий уровень; время от времени — вытеснение сверх лимитов
+        self.local.put_clean(key, body, etag)
+        if self.write_mode != "through" or not (self.max_rows or self.max_bytes):
+            return
+        self._copies += 1
+        if self._copies % self.trim_every == 0:
+            self.evicted += self.local.trim(self.max_rows, self.max_bytes)
+
+    # === Чтение ===
+    def _read(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        row = self.local.get(key)
+        if self.authoritative:
+            # Горячий уровень полный (перечитан на холодном старте): промах — объекта нет
+            if row is not None:
+                self.hits += 1
+                return row[0], row[1]
+            self.misses += 1
+            return None, None
+        if row is not None:
+            body, etag, validated = row
+            if time.time() - validated < self.ttl:
+                self.hits += 1
+                return body, etag
+            # Копия могла устареть (запись с другого узла): условный GET без тела при 304
+            self.revalidations += 1
+            changed, data, new_etag = super().get_if_changed(key, etag)
+            if not changed:
+                self.local.touch(key)
+                return body, etag
+        else:
+            self.misses += 1
+            data, new_etag = super().get_bytes_versioned(key)
+        if data is None:
+            self.local.evict(key)
+            return None, None
+        self._keep(key, data, new_etag)
+        return data, new_etag
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        if not self.is_hot(key):
+            return super().get_bytes(key)
+        return self._read(key)[0]
+
+    def get_bytes_versioned(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        if not self.is_hot(key):
+            return super().get_bytes_versioned(key)
+        return self._read(key)
+
+    def get_if_changed(self, key: str, etag: Optional[str]) -> Tuple[bool, Optional[bytes], Optional[str]]:
+        if not self.is_hot(key) or not self.authoritative:
+            # through: периодическая проверка (цены продажи) должна видеть записи других узлов
+            changed, data, new_etag = super().get_if_changed(key, etag)
+            if changed and data is not None and self.is_hot(key):
+                self._keep(key, data, new_etag)
+            return changed, data, new_etag
+        data, current = self._read(key)
+        if data is not None and current == etag:
+            return False, None, etag
+        return True, data, current
+
+    # === Запись ===
+    def put_bytes(self, key: str, body, **extra) -> Optional[str]:
+        if not self.is_hot(key):
+            return super().put_bytes(key, body, **extra)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if self.authoritative:
+            # В S3 уйдёт с ближайшей выгрузкой: изменения за upload_interval сливаются в одну запись
+            return self.local.put_dirty(
+                key, body, extra.get("IfMatch"), extra.get("IfNoneMatch"), extra.get("ContentType")
+            )
+        try:
+            etag = super().put_bytes(key, body, **extra)
+        except ClientError as e:
+            if is_conflict(e):
+                self.local.evict(key)  # локальная копия устарела: перечитаем из S3
+            raise
+        self._keep(key, body, etag or body_etag(body))
+        return etag
+
+    def delete_keys(self, keys: List[str]) -> int:
+        # Удаление (сегменты журнала после свёртки) — и в S3, и в горячем уровне,
+        # в том числе ещё не выгруженные строки режима back
+        deleted = super().delete_keys(keys)
+        hot = [key for key in keys if self.is_hot(key)]
+        if hot:
+            self.local.delete(hot)
+        return deleted
+
+    # === Листинг ===
+    def list_page(self, prefix: str, page_args: dict):
+        if not self.is_hot(prefix):
+            return super().list_page(prefix, page_args)
+        if self.authoritative:
+            # Весь префикс одной страницей, из SQLite
+            return self.local.list(prefix, page_args.get("StartAfter")), None
+        entries, next_args = super().list_page(prefix, page_args)
+        # Копии, чей ETag разошёлся с S3, записал другой узел — сбрасываем
+        known = self.local.etags([key for key, _ in entries])
+        for key, etag in entries:
+            local = known.get(key)
+            if local is not None and local[0] != etag and not local[1]:
+                self.local.evict(key, local[0])
+        return entries, next_args
+
+    def evict(self, key: str):
+        # Сигнал об изменении с другого узла; в режиме back копия — источник правды
+        if self.write_mode == "through":
+            if key.endswith("/"):
+                self.local.evict_prefix(key)
+            else:
+                self.local.evict(key)
+
+    # === Холодный старт и фоновая выгрузка в S3 ===
+    def rehydrate(self, prefixes=None) -> int:
+        # Копируем горячие префиксы из S3: новые объекты и сохранённые копии с другим ETag
+        # (файл мог остаться от работы в режиме through). Несохранённые строки не трогаем,
+        # сохранённые копии удалённых из S3 объектов убираем
+        copied = 0
+        for prefix in prefixes or self.hot_prefixes:
+            entries = []
+            page_args = {}
+            while page_args is not None:
+                page, page_args = S3Storage.list_page(self, prefix, page_args)
+                entries.extend(page)
+            listed = dict(entries)
+            present = self.local.etags(list(listed))
+            stale = [
+                key for key, etag in entries
+                if key not in present or (not present[key][1] and present[key][0] != etag)
+            ]
+            for key, (data, etag) in zip(stale, self._executor.map(super().get_bytes_versioned, stale)):
+                if data is not None:
+                    self.local.put_clean(key, data, etag)
+                    copied += 1
+            for key, _ in self.local.list(prefix):
+                if key not in listed:
+                    self.local.evict(key)
+        self.rehydrated += copied
+        return copied
+
+    def start(self):
+        # Строки, не выгруженные в прошлый запуск (в т.ч. в режиме back), — в S3 при любом режиме
+        pending = self.upload_dirty(until_clean=True) if self.local.count_dirty() else 0
+        if pending:
+            print(f"🧊 Горячий уровень: выгружено в S3 {pending} объектов прошлого запуска")
+        if self.write_mode != "back":
+            # В through файл не получает чужих записей: следующий запуск в back перечитает S3
+            if self.hydrated:
+                self.local.delete_meta("hydrated")
+                self.hydrated = False
+            return
+        if not self.hydrated:
+            started = time.perf_counter()
+            copied = self.rehydrate()
+            self.local.set_meta("hydrated", str(time.time()))
+            self.hydrated = True
+            print(f"🧊 Горячий уровень перечитан из S3: {copied} объектов за {time.perf_counter() - started:.1f} с")
+        self._stopped.clear()
+        self._uploader = threading.Thread(target=self._upload_loop, name="tier-upload", daemon=True)
+        self._uploader.start()
+
+    def stop(self) -> int:
+        # Остановка выгружает в S3 всё несохранённое
+        if self._uploader is None:
+            return 0
+        self._stopped.set()
+        self._wake.set()
+        self._uploader.join(timeout=30)
+        self._uploader = None
+        return self.upload_dirty(until_clean=True)
+
+    def _upload_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.upload_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break  # последнюю выгрузку делает stop()
+            try:
+                self.upload_dirty()
+            except Exception as e:
+                print(f"❌ Ошибка выгрузки горячего уровня в S3: {e}")
+
+    def upload_dirty(self, until_clean: bool = False) -> int:
+        uploaded = 0
+        while True:
+            rows = self.local.dirty()
+            if not rows:
+                return uploaded
+
+            def upload(row):
+                key, body, version, content_type = row
+                extra = {"ContentType": content_type} if content_type else {}
+                try:
+                    etag = S3Storage.put_bytes(self, key, body, **extra)
+                except Exception as e:
+                    self.upload_errors += 1
+                    print(f"❌ Ошибка выгрузки {key} в S3: {e}")
+                    return False
+                self.local.mark_uploaded(key, version, etag)
+                return True
+
+            done = sum(self._executor.map(upload, rows))
+            uploaded += done
+            self.uploads += done
+            if not until_clean or done == 0:
+                return uploaded
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "tier": "sqlite+s3",
+            "write_mode": self.write_mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "revalidations": self.revalidations,
+            "rehydrated": self.rehydrated,
+            "uploads": self.uploads,
+            "upload_errors": self.upload_errors,
+            "evicted": self.evicted,
+            "dirty": self.local.count_dirty(),
+        }
+
+
+def make_storage(client, bucket: Optional[str], local_path: Optional[str] = None, write_mode: str = "through",
+                 ttl: float = 60.0, max_workers: int = 64, metrics=None, max_rows: int = 0,
+                 max_bytes: int = 0) -> S3Storage:
+    # Без пути к файлу SQLite — только S3, как раньше
+    if not local_path:
+        return S3Storage(client, bucket, max_workers=max_workers, metrics=metrics)
+    return TieredStorage(LocalStore(local_path), client, bucket, write_mode=write_mode, ttl=ttl,
+                         max_workers=max_workers, metrics=metrics, max_rows=max_rows, max_bytes=max_bytes)
@@ -0,0 +1,184 @@
+# write_back.py
+# Отложенная запись в S3: изменения помечают ключ «грязным», а фоновый поток
+# пишет в S3 только последнее состояние — по таймеру или по числу изменений.
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Union
+
+Body = Union[str, bytes]
+
+
+class _Pending:
+    __slots__ = ("first_dirty", "updates", "body", "writer")
+
+    def __init__(self, first_dirty: float, body: Callable[[], Body], writer=None):
+        self.first_dirty = first_dirty
+        self.updates = 0
+        self.body = body
+        self.writer = writer
+
+
+class WriteBackBuffer:
+    def __init__(
+        self,
+        writer: Callable[[str, Body], None],
+        delay: float = 2.0,
+        max_updates: int = 20,
+        flush_workers: int = 8,
+        lock_stripes: int = 256,
+    ):
+        # writer(key, body) — фактическая запись в хранилище.
+        # delay <= 0 — запись сразу (write-through), как без буфера.
+        # flush_workers — сколько ключей пишем параллельно при массовом сбросе.
+        # lock_stripes — записи одного ключа идут по очереди; блокировки — фиксированный
+        # набор полос по хэшу ключа (как KeyLocks), память не растёт с числом ключей.
+        self._writer = writer
+        self.delay = delay
+        self.max_updates = max_updates
+        self.flush_workers = flush_workers
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Метрики
+        self.updates = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self._total_flush_lag = 0.0
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        return self._key_locks[zlib.crc32(key.encode("utf-8")) % len(self._key_locks)]
+
+    def mark_dirty(self, key: str, body: Callable[[], Body], writer: Optional[Callable] = None) -> bool:
+        # body() сериализует актуальное состояние в момент записи.
+        # writer(key, data) — своя запись для ключа (например, условная), иначе общий writer.
+        # True — ключ пора записать сразу (write-through или набралось max_updates):
+        # вызывающий код делает flush(key) сам, в своём потоке ввода-вывода.
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending(time.monotonic(), body)
+            pending.body = body
+            pending.writer = writer
+            pending.updates += 1
+            self.updates += 1
+            return self.delay <= 0 or pending.updates >= self.max_updates
+
+    def is_dirty(self, key: str) -> bool:
+        return key in self._pending
+
+    def is_dirty_prefix(self, prefix: str) -> bool:
+        with self._lock:
+            return any(key.startswith(prefix) for key in self._pending)
+
+    def flush(self, key: str) -> bool:
+        with self._key_lock(key):
+            with self._lock:
+                pending = self._pending.pop(key, None)
+            if pending is None:
+                return False
+
+            try:
+                data = pending.body()
+                (pending.writer or self._writer)(key, data)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                    # Не затираем более свежие изменения, пришедшие во время записи
+                    newer = self._pending.get(key)
+                    if newer is None:
+                        self._pending[key] = pending
+                    else:
+                        newer.first_dirty = pending.first_dirty
+                        newer.updates += pending.updates
+                raise
+
+            lag = time.monotonic() - pending.first_dirty
+            with self._lock:
+                self.flushes += 1
+                self.bytes_written += len(data)
+                self.last_flush_lag = lag
+                self.max_flush_lag = max(self.max_flush_lag, lag)
+                self._total_flush_lag += lag
+            return True
+
+    def flush_due(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            due = [k for k, p in self._pending.items() if now - p.first_dirty >= self.delay]
+        return self._flush_keys(due)
+
+    def flush_prefix(self, prefix: str, raise_errors: bool = True) -> int:
+        # Перед листингом бакета: то, что лежит в буфере, должно попасть в S3.
+        # raise_errors=False — ошибки только печатаются, неудачные ключи остаются в буфере
+        with self._lock:
+            keys = [k for k in self._pending if k.startswith(prefix)]
+        return self._flush_keys(keys, raise_errors=raise_errors)
+
+    def flush_all(self) -> int:
+        with self._lock:
+            keys = list(self._pending)
+        return self._flush_keys(keys)
+
+    def _flush_keys(self, keys, raise_errors: bool = False) -> int:
+        def flush_one(key):
+            try:
+                return self.flush(key)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"❌ Ошибка записи {key}: {e}")
+                return False
+
+        if len(keys) <= 1 or self.flush_workers <= 1:
+            return sum(flush_one(key) for key in keys)
+        with ThreadPoolExecutor(max_workers=min(self.flush_workers, len(keys))) as pool:
+            return sum(pool.map(flush_one, keys))
+
+    def clear(self):
+        # Сброс без записи (для тестов)
+        with self._lock:
+            self._pending.clear()
+
+    def start(self):
+        if self.delay <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        interval = min(self.delay / 2, 0.5)
+
+        def run():
+            while not self._stop.wait(interval):
+                self.flush_due()
+
+        self._thread = threading.Thread(target=run, name="write-back", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Остановить фоновый поток и дописать всё, что осталось
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dirty_keys": len(self._pending),
+                "updates": self.updates,
+                "flushes": self.flushes,
+                "bytes_written": self.bytes_written,
+                "errors": self.errors,
+                # Сколько записей в S3 приходится на одно логическое изменение
+                "write_amplification": round(self.flushes / self.updates, 4) if self.updates else 0.0,
+                "last_flush_lag": round(self.last_flush_lag, 4),
+                "max_flush_lag": round(self.max_flush_lag, 4),
+                "avg_flush_lag": round(self._total_flush_lag / self.flushes, 4) if self.flushes else 0.0,
+            }
@@ -0,0 +1,84 @@
+# Бенчмарк GET /nft и GET /profiles на тысячах объектов в LatencyS3:
+# последовательное чтение (параллельность 1, как раньше) против параллельного.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_fanout.py --nfts 3000 --profiles 2000 --latency 0.01
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+
+def seed(s3, nfts, profiles):
+    bucket = main_module.BUCKET_NAME
+    for token_id in range(1, nfts + 1):
+        s3._storage[(bucket, f"NFT/{token_id}.json")] = json.dumps({
+            "tokenId": token_id, "itemType": "Pickaxe", "rarity": 3, "bonus": {"value": 12},
+            "image": "https://example.com/pickaxe.jpg", "uri": f"https://example.com/{token_id}.json",
+            "owner": f"0x{token_id % 97:040x}",
+        }).encode("utf-8")
+    for i in range(profiles):
+        address = f"0x{i:040x}"
+        s3._storage[(bucket, f"{main_module.PROFILE_PREFIX}{address}.json")] = json.dumps(
+            {"address": address, "nickname": f"p{i}", "local_gems": i}
+        ).encode("utf-8")
+
+
+def drop_caches(s3):
+    # После первого уровня /nft отдаётся из каталога в памяти (или из его контрольной
+    # точки), а /profiles — из кэша листинга; сбрасываем всё, чтобы каждый уровень
+    # снова читал объекты из S3 и уровни можно было сравнивать
+    main_module.write_back.flush_all()
+    main_module.nft_catalog.reset()
+    s3._storage.pop((main_module.BUCKET_NAME, main_module.NFT_CATALOG_KEY), None)
+    main_module.profile_listing_cache.clear()
+
+
+async def timed_get(client, path):
+    start = time.perf_counter()
+    r = await client.get(path)
+    r.raise_for_status()
+    return time.perf_counter() - start, len(r.json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельное чтение /nft и /profiles")
+    parser.add_argument("--nfts", type=int, default=3000)
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.01, help="задержка S3 на вызов, с")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 64])
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=args.latency)
+    main_module.s3 = s3
+    seed(s3, args.nfts, args.profiles)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            print(f"{'параллельность':>15} {'/nft, с':>10} {'/profiles, с':>14} {'вызовов S3':>12}")
+            for level in args.levels:
+                main_module.S3_FETCH_CONCURRENCY = level
+                main_module.nft_catalog.fetch_concurrency = level
+                drop_caches(s3)
+                before = s3.total_calls()
+                nft_time, nft_count = await timed_get(client, "/nft")
+                profile_time, profile_count = await timed_get(client, "/profiles")
+                assert nft_count == args.nfts and profile_count == args.profiles
+                calls = s3.total_calls() - before
+                print(f"{level:>15} {nft_time:>10.2f} {profile_time:>14.2f} {calls:>12}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
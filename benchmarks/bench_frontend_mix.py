@@ -0,0 +1,305 @@
+# Нагрузочный прогон со смесью запросов реального фронтенда поверх LatencyS3:
+#   player      — GameScreen: GET /profile, GET /inventory, GET /sell-prices и серия
+#                 PATCH /profile с local_gems (фронтенд шлёт его на каждое изменение)
+#   marketplace — MarketplacePage: GET /nft, затем по каждому листингу
+#                 GET /metadata-proxy/ и POST /predict-price
+#   admin       — AdminPage/useAdminData: GET /profiles и GET /sell-prices
+# Сессии выбираются по весам из генератора с фиксированным seed, так что два
+# прогона с одинаковыми параметрами шлют одну и ту же последовательность.
+# Отчёт: пропускная способность, p50/p95/p99 по маршрутам и сценариям, вызовы
+# S3 на запрос (из Server-Timing и общий счётчик стенда). --output сохраняет
+# JSON, --compare сравнивает с сохранённым прогоном другого коммита.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_frontend_mix.py --sessions 600 --concurrency 50 --output mix.json
+#   python benchmarks/bench_frontend_mix.py --compare mix.json        # после изменений
+#   python benchmarks/bench_frontend_mix.py --server                 # через uvicorn, а не ASGI
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Разбивка времени по запросу нужна для подсчёта вызовов S3 на запрос
+os.environ.setdefault("SERVER_TIMING", "1")
+
+import httpx
+
+import backend.main as main_module
+from bench_s3_load import free_port, percentile, start_server
+from s3_standin import LatencyS3
+
+ITEM_TYPES = ["Boots", "Gloves", "Lamp", "Pickaxe", "Vest"]
+RARITIES = ["Common", "Rare", "Epic", "Legendary"]
+
+
+def make_nft(token_id):
+    return {"tokenId": token_id, "itemType": ITEM_TYPES[token_id % 5], "rarity": token_id % 4,
+            "bonus": {"flatPowerBonus": token_id % 36}, "image": f"https://meta.example/{token_id}.png",
+            "uri": f"https://meta.example/{token_id}.json", "owner": f"0x{token_id % 500:040x}"}
+
+
+def seed_bucket(s3, players, nfts):
+    bucket = main_module.BUCKET_NAME
+    for address in players:
+        s3._storage[(bucket, f"{main_module.PROFILE_PREFIX}{address}.json")] = json.dumps(
+            {"address": address, "nickname": "bench", "local_gems": 0, "created_at": "2025-01-01"}
+        ).encode("utf-8")
+        s3._storage[(bucket, f"{main_module.INVENTORY_PREFIX}{address}.json")] = json.dumps(
+            [{"id": f"{address}-{i}", "type": ITEM_TYPES[i % 5], "rarity": RARITIES[i % 4], "image": "x",
+              "attributes": {"bonus": i}} for i in range(20)]
+        ).encode("utf-8")
+    catalog = [make_nft(t) for t in range(nfts)]
+    for nft in catalog:
+        s3._storage[(bucket, f"{main_module.NFT_PREFIX}{nft['tokenId']}.json")] = json.dumps(nft).encode("utf-8")
+    etags = {key: s3.etag(data) for (_, key), data in s3._storage.items() if key.startswith(main_module.NFT_PREFIX)}
+    s3._storage[(bucket, main_module.NFT_CATALOG_KEY)] = json.dumps(
+        {"version": 1, "nfts": catalog, "etags": etags}
+    ).encode("utf-8")
+
+
+def metadata_upstream(latency):
+    # IPFS-шлюз: задержка на ответ и Cache-Control, как у настоящих шлюзов
+    async def handler(request):
+        await asyncio.sleep(latency)
+        token_id = int(request.url.path.strip("/").split(".")[0])
+        return httpx.Response(200, json=make_nft(token_id), headers={"Cache-Control": "max-age=300"})
+    return httpx.MockTransport(handler)
+
+
+def s3_calls_from_timing(header):
+    # Server-Timing: s3;dur=12.30;desc="4", app;dur=20.00 → 4; None — заголовка нет (старый коммит)
+    if header is None:
+        return None
+    for part in header.split(","):
+        fields = part.strip().split(";")
+        if fields[0] == "s3":
+            for field in fields[1:]:
+                if field.startswith("desc="):
+                    return int(field[5:].strip('"'))
+    return 0
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.s3_calls = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sessions = defaultdict(list)
+
+    async def call(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        r = await client.request(method, url, **kwargs)
+        self.latencies[route].append(time.perf_counter() - start)
+        calls = s3_calls_from_timing(r.headers.get("server-timing"))
+        if calls is not None:
+            self.s3_calls[route].append(calls)
+        if r.status_code >= 400:
+            self.errors[route] += 1
+        return r
+
+
+async def player_session(client, rec, rng, args):
+    address = f"0x{rng.randrange(args.players):040x}"
+    await rec.call(client, "GET /profile/{address}", "GET", f"/profile/{address}")
+    await rec.call(client, "GET /inventory/{address}", "GET", f"/inventory/{address}")
+    await rec.call(client, "GET /sell-prices", "GET", "/sell-prices")
+    gems = rng.randrange(1000)
+    for _ in range(args.patches):
+        gems += rng.randrange(1, 5)
+        await rec.call(client, "PATCH /profile/{address}", "PATCH", f"/profile/{address}", json={"local_gems": gems})
+
+
+async def marketplace_session(client, rec, rng, args):
+    r = await rec.call(client, "GET /nft", "GET", "/nft")
+    listings = r.json() if r.status_code == 200 else []
+    for nft in rng.sample(listings, min(args.fanout, len(listings))):
+        await rec.call(client, "GET /metadata-proxy/", "GET", "/metadata-proxy/", params={"url": nft["uri"]})
+        await rec.call(client, "POST /predict-price", "POST", "/predict-price", json={
+            "itemType": nft["itemType"], "rarity": RARITIES[nft["rarity"] % 4],
+            "bonusValue": nft["bonus"]["flatPowerBonus"], "price": rng.choice([None, 10, 50, 200]),
+        })
+
+
+async def admin_session(client, rec, rng, args):
+    await rec.call(client, "GET /profiles", "GET", "/profiles")
+    await rec.call(client, "GET /sell-prices", "GET", "/sell-prices")
+
+
+SCENARIOS = {"player": player_session, "marketplace": marketplace_session, "admin": admin_session}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def wait_ready(client):
+    # /ready есть не во всех коммитах: 404 — считаем, что готово сразу
+    while True:
+        r = await client.get("/ready")
+        if r.status_code != 503:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def run_load(client_kwargs, args, mix):
+    rec = Recorder()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    counter = iter(range(args.sessions))
+
+    async def user(client):
+        for n in counter:
+            rng = random.Random(f"{args.seed}-{n}")
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            await SCENARIOS[name](client, rec, rng, args)
+            rec.sessions[name].append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120, **client_kwargs) as client:
+        await wait_ready(client)
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return rec, elapsed
+
+
+def summarize(latencies):
+    ms = [x * 1000 for x in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(sum(ms) / len(ms), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def build_report(rec, elapsed, s3, args, mix):
+    routes = {}
+    for route, latencies in sorted(rec.latencies.items()):
+        routes[route] = {**summarize(latencies), "errors": rec.errors[route]}
+        calls = rec.s3_calls.get(route)
+        routes[route]["s3_calls_per_request"] = round(sum(calls) / len(calls), 3) if calls else None
+    total = sum(len(v) for v in rec.latencies.values())
+    all_latencies = [x for v in rec.latencies.values() for x in v]
+    return {
+        "commit": git_commit(),
+        "config": {key: getattr(args, key) for key in (
+            "sessions", "concurrency", "latency", "metadata_latency", "players", "nfts", "patches", "fanout", "seed", "server"
+        )} | {"mix": mix},
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "errors": sum(rec.errors.values()),
+        "throughput_rps": round(total / elapsed, 1),
+        "latency": summarize(all_latencies),
+        "s3": {
+            # Всё, что дошло до стенда, включая фоновую запись, — на один запрос
+            "calls": dict(s3.calls),
+            "calls_per_request": round(s3.total_calls() / total, 3),
+            "bytes_put": s3.bytes_put,
+        },
+        "routes": routes,
+        "scenarios": {name: summarize(latencies) for name, latencies in sorted(rec.sessions.items())},
+    }
+
+
+def print_report(report, baseline=None):
+    def diff(new, old):
+        if old is None or new is None:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)" if old else ""
+
+    base_routes = (baseline or {}).get("routes", {})
+    print(f"коммит: {report['commit']}, запросов: {report['requests']}, ошибок: {report['errors']}, "
+          f"время: {report['elapsed_s']} с")
+    old = baseline or {}
+    print(f"RPS: {report['throughput_rps']}{diff(report['throughput_rps'], old.get('throughput_rps'))}, "
+          f"вызовов S3 на запрос: {report['s3']['calls_per_request']}"
+          f"{diff(report['s3']['calls_per_request'], old.get('s3', {}).get('calls_per_request'))}")
+    print(f"{'маршрут':<28} {'число':>6} {'p50, мс':>16} {'p95, мс':>16} {'p99, мс':>16} {'S3/запрос':>10}")
+    for route, stats in report["routes"].items():
+        base = base_routes.get(route, {})
+        s3_calls = "—" if stats["s3_calls_per_request"] is None else f"{stats['s3_calls_per_request']:.2f}"
+        print(f"{route:<28} {stats['count']:>6} "
+              + " ".join(f"{str(stats[q]) + diff(stats[q], base.get(q)):>16}" for q in ("p50_ms", "p95_ms", "p99_ms"))
+              + f" {s3_calls:>10}")
+    for name, stats in report["scenarios"].items():
+        print(f"{'сессия ' + name:<28} {stats['count']:>6} "
+              + " ".join(f"{stats[q]:>16}" for q in ("p50_ms", "p95_ms", "p99_ms")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Смесь запросов фронтенда поверх LatencyS3")
+    parser.add_argument("--sessions", type=int, default=600, help="всего сессий (сценариев)")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных пользователей")
+    parser.add_argument("--mix", default="player=80,marketplace=15,admin=5")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на вызов, с")
+    parser.add_argument("--metadata-latency", type=float, default=0.05, help="задержка шлюза метаданных, с")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--nfts", type=int, default=2000)
+    parser.add_argument("--patches", type=int, default=5, help="PATCH local_gems за сессию игрока")
+    parser.add_argument("--fanout", type=int, default=8, help="листингов на сессию маркетплейса")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server", action="store_true", help="через uvicorn вместо ASGI-транспорта")
+    parser.add_argument("--output", help="сохранить отчёт в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    s3 = LatencyS3(latency=0)
+    main_module.s3 = s3
+    seed_bucket(s3, [f"0x{i:040x}" for i in range(args.players)], args.nfts)
+    s3.latency = args.latency
+    main_module.metadata_proxy.transport = metadata_upstream(args.metadata_latency)
+
+    if args.server:
+        port = free_port()
+        server, thread = start_server(port)
+        try:
+            rec, elapsed = asyncio.run(run_load({"base_url": f"http://127.0.0.1:{port}"}, args, mix))
+        finally:
+            server.should_exit = True
+            thread.join()
+    else:
+        async def in_process():
+            # ASGI-транспорт не запускает lifespan — проходим его сами, как uvicorn
+            async with main_module.lifespan(main_module.app):
+                transport = httpx.ASGITransport(app=main_module.app)
+                return await run_load({"transport": transport, "base_url": "http://bench"}, args, mix)
+        rec, elapsed = asyncio.run(in_process())
+
+    report = build_report(rec, elapsed, s3, args, mix)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Бенчмарк пакетных изменений инвентаря: быстрая продажа и генерация предметов
+# по одному (POST /inventory, DELETE /inventory/{id}) против одного
+# POST /inventory/{address}/batch. Запись в S3 сразу (WRITE_BACK_DELAY=0).
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_inventory_batch.py --items 10 100 500 --latency 0.02 --rtt 0.01
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+
+def make_item(item_id):
+    return {"id": item_id, "type": "Gloves", "rarity": "Rare", "image": "https://example.com/g.png",
+            "attributes": {"bonus": 7}}
+
+
+async def one_by_one(client, address, ids, rtt):
+    for item_id in ids:
+        await asyncio.sleep(rtt)
+        (await client.post(f"/inventory/{address}", json=make_item(item_id))).raise_for_status()
+    for item_id in ids:
+        await asyncio.sleep(rtt)
+        (await client.delete(f"/inventory/{address}/{item_id}")).raise_for_status()
+    return 2 * len(ids)
+
+
+async def batched(client, address, ids, rtt):
+    await asyncio.sleep(rtt)
+    r = await client.post(f"/inventory/{address}/batch", json={"add": [make_item(i) for i in ids]})
+    r.raise_for_status()
+    await asyncio.sleep(rtt)
+    r = await client.post(f"/inventory/{address}/batch", json={"remove": ids})
+    r.raise_for_status()
+    return 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /inventory/{address}/batch против запросов по одному")
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на вызов, с")
+    parser.add_argument("--rtt", type=float, default=0.01, help="задержка браузер ↔ бэкенд, с")
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=args.latency)
+    main_module.s3 = s3
+    main_module.write_back.delay = 0
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            print(f"S3 {args.latency * 1000:.0f} мс, RTT {args.rtt * 1000:.0f} мс; добавить N предметов и удалить их")
+            print(f"{'N':>5} {'режим':>10} {'время, с':>9} {'предметов/с':>12} {'HTTP':>6} {'PUT в S3':>9}")
+            for n in args.items:
+                for name, scenario in (("по одному", one_by_one), ("пакет", batched)):
+                    address = f"0x{n:038x}{len(name):02x}"
+                    await client.get(f"/inventory/{address}")
+                    ids = [f"{name}-{i}" for i in range(n)]
+                    puts_before = s3.calls["put_object"]
+                    start = time.perf_counter()
+                    requests = await scenario(client, address, ids, args.rtt)
+                    elapsed = time.perf_counter() - start
+                    puts = s3.calls["put_object"] - puts_before
+                    print(f"{n:>5} {name:>10} {elapsed:>9.2f} {2 * n / elapsed:>12.0f} {requests:>6} {puts:>9}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Бенчмарк изменений инвентаря: POST /inventory и DELETE /inventory/{id}
+# для игроков с 10 / 1 000 / 50 000 предметов. Запись в S3 сразу
+# (WRITE_BACK_DELAY=0), чтобы видеть байты, уходящие в S3 на каждое изменение.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_inventory_ops.py --sizes 10 1000 50000 --ops 200
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+
+def make_item(item_id):
+    return {"id": item_id, "type": "Pickaxe", "rarity": "Epic", "image": "https://example.com/p.png",
+            "attributes": {"bonus": 12, "durability": 100}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость одного изменения инвентаря")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 50000])
+    parser.add_argument("--ops", type=int, default=200, help="добавлений и столько же удалений на размер")
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=0)
+    main_module.s3 = s3
+    main_module.write_back.delay = 0
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            print(f"{'предметов':>10} {'POST, мс':>10} {'DELETE, мс':>11} {'байт в S3 на изменение':>24} {'PUT на изменение':>17}")
+            for size in args.sizes:
+                address = f"0x{size:040x}"
+                s3._storage[(main_module.BUCKET_NAME, f"{main_module.INVENTORY_PREFIX}{address}.json")] = json.dumps(
+                    [make_item(f"seed-{i}") for i in range(size)]
+                ).encode("utf-8")
+                r = await client.get(f"/inventory/{address}")
+                assert len(r.json()) == size
+
+                bytes_before, puts_before = s3.bytes_put, s3.calls["put_object"]
+                start = time.perf_counter()
+                for i in range(args.ops):
+                    r = await client.post(f"/inventory/{address}", json=make_item(f"new-{i}"))
+                    r.raise_for_status()
+                post_ms = (time.perf_counter() - start) / args.ops * 1000
+
+                start = time.perf_counter()
+                for i in range(args.ops):
+                    r = await client.delete(f"/inventory/{address}/new-{i}")
+                    r.raise_for_status()
+                delete_ms = (time.perf_counter() - start) / args.ops * 1000
+
+                mutations = 2 * args.ops
+                per_op = (s3.bytes_put - bytes_before) / mutations
+                puts = (s3.calls["put_object"] - puts_before) / mutations
+                print(f"{size:>10} {post_ms:>10.2f} {delete_ms:>11.2f} {per_op:>24.0f} {puts:>17.2f}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Бенчмарк сериализации ответов: GET /inventory для больших инвентарей,
+# GET /profiles (повторный листинг) и полный GET /nft — в установившемся
+# режиме и сразу после изменения (когда готовое тело приходится собирать заново).
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_json_responses.py --inventory 1000 50000 --profiles 2000 --nfts 100000
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+
+def make_item(item_id):
+    return {"id": item_id, "type": "Pickaxe", "rarity": "Epic", "image": "https://example.com/p.png",
+            "attributes": {"bonus": 12, "durability": 100, "name": "Кирка"}}
+
+
+def make_nft(token_id):
+    return {"tokenId": token_id, "itemType": "Pickaxe", "rarity": token_id % 4, "bonus": {"flatPowerBonus": token_id % 35},
+            "image": f"https://example.com/{token_id}.png", "uri": f"ipfs://{token_id}", "owner": f"0x{token_id % 500:040x}"}
+
+
+async def timed(client, url, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        r = await client.get(url)
+        r.raise_for_status()
+    return (time.perf_counter() - start) / repeat * 1000, len(r.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость сериализации ответов чтения")
+    parser.add_argument("--inventory", type=int, nargs="+", default=[1000, 50000])
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--nfts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка S3 на вызов для /profiles, с")
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=0)
+    main_module.s3 = s3
+    bucket = main_module.BUCKET_NAME
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            print(f"{'запрос':<32} {'повтор, мс':>11} {'после изменения, мс':>20} {'байт':>11}")
+            for size in args.inventory:
+                address = f"0x{size:040x}"
+                s3._storage[(bucket, f"{main_module.INVENTORY_PREFIX}{address}.json")] = json.dumps(
+                    [make_item(f"seed-{i}") for i in range(size)]
+                ).encode("utf-8")
+                await client.get(f"/inventory/{address}")
+                steady, size_bytes = await timed(client, f"/inventory/{address}", args.repeat)
+                changed = 0.0
+                for i in range(args.repeat):
+                    (await client.post(f"/inventory/{address}", json=make_item(f"new-{i}"))).raise_for_status()
+                    changed += (await timed(client, f"/inventory/{address}", 1))[0]
+                print(f"{'GET /inventory, ' + str(size) + ' предметов':<32} {steady:>11.2f} {changed / args.repeat:>20.2f} {size_bytes:>11}")
+
+            for i in range(args.profiles):
+                address = f"0x{i:040x}"
+                s3._storage[(bucket, f"{main_module.PROFILE_PREFIX}{address}.json")] = json.dumps(
+                    {"address": address, "nickname": f"player {i}", "local_gems": i, "created_at": "2025-01-01"}
+                ).encode("utf-8")
+            s3.latency = args.latency
+            await client.get("/profiles")
+            gets_before = s3.calls["get_object"]
+            steady, size_bytes = await timed(client, "/profiles", 3)
+            gets = (s3.calls["get_object"] - gets_before) / 3
+            s3.latency = 0
+            print(f"{'GET /profiles, ' + str(args.profiles) + ' профилей':<32} {steady:>11.2f} {'—':>20} {size_bytes:>11}"
+                  f"   GET в S3 на запрос: {gets:.0f}")
+
+            nfts = [make_nft(t) for t in range(args.nfts)]
+            for nft in nfts:
+                s3._storage[(bucket, f"{main_module.NFT_PREFIX}{nft['tokenId']}.json")] = json.dumps(nft).encode("utf-8")
+            etags = {f"{main_module.NFT_PREFIX}{nft['tokenId']}.json": s3.etag(
+                s3._storage[(bucket, f"{main_module.NFT_PREFIX}{nft['tokenId']}.json")]) for nft in nfts}
+            s3._storage[(bucket, main_module.NFT_CATALOG_KEY)] = json.dumps(
+                {"version": 1, "nfts": nfts, "etags": etags}
+            ).encode("utf-8")
+            main_module.nft_catalog.reset()
+            await client.get("/nft")
+            steady, size_bytes = await timed(client, "/nft", args.repeat)
+            changed = 0.0
+            repeat = max(1, args.repeat // 4)
+            for i in range(repeat):
+                (await client.post("/nft/save", json=make_nft(args.nfts + i))).raise_for_status()
+                changed += (await timed(client, "/nft", 1))[0]
+            print(f"{'GET /nft, ' + str(args.nfts) + ' NFT':<32} {steady:>11.2f} {changed / repeat:>20.2f} {size_bytes:>11}")
+
+    # Контрольную точку каталога и профили не сбрасываем в S3 по ходу замера
+    main_module.write_back.delay = 3600
+    main_module.write_back.max_updates = 10 ** 9
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Бенчмарк отрисовки маркетплейса: как сейчас во фронтенде
+# (на каждый листинг GET /metadata-proxy/ + POST /predict-price подряд)
+# против одного POST /marketplace/view.
+#
+# Половина токенов есть в каталоге NFT, остальные — только по URI
+# на локальном HTTP-сервере метаданных с задержкой --meta-latency.
+# --rtt — задержка сети браузер ↔ бэкенд на каждый HTTP-запрос.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_marketplace_view.py --sizes 50 500 --rtt 0.02
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+ITEM_TYPES = ["Boots", "Gloves", "Lamp", "Pickaxe", "Vest"]
+RARITY_NAMES = {1: "Common", 2: "Rare", 3: "Epic", 4: "Legendary"}
+
+
+def token_metadata(token_id):
+    return {
+        "tokenId": token_id, "itemType": ITEM_TYPES[token_id % 5], "rarity": token_id % 4 + 1,
+        "bonus": {"value": token_id % 30}, "image": f"https://example.com/{token_id}.png",
+    }
+
+
+def start_metadata_server(latency):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            token_id = int(self.path.strip("/").split(".")[0])
+            body = json.dumps(token_metadata(token_id)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+async def per_listing(client, listings, rtt):
+    # Поведение MarketplacePage.jsx: два запроса на листинг, последовательно
+    items = []
+    for listing in listings:
+        await asyncio.sleep(rtt)
+        r = await client.get("/metadata-proxy/", params={"url": listing["uri"]})
+        metadata = r.json()
+        await asyncio.sleep(rtt)
+        ml = await client.post("/predict-price", json={
+            "itemType": metadata["itemType"], "rarity": RARITY_NAMES[metadata["rarity"]],
+            "bonusValue": metadata["bonus"]["value"], "price": listing["price"],
+        })
+        items.append(ml.json()["recommended_price"])
+    return items, 2 * len(listings)
+
+
+async def combined(client, listings, rtt):
+    await asyncio.sleep(rtt)
+    r = await client.post("/marketplace/view", json={"listings": listings})
+    r.raise_for_status()
+    return [item["recommended_price"] for item in r.json()["listings"]], 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /marketplace/view против запросов на каждый листинг")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--rtt", type=float, default=0.02, help="задержка браузер ↔ бэкенд, с")
+    parser.add_argument("--meta-latency", type=float, default=0.02, help="задержка сервера метаданных, с")
+    args = parser.parse_args()
+
+    main_module.s3 = LatencyS3(latency=0)
+    httpd, meta_url = start_metadata_server(args.meta_latency)
+
+    async def run():
+        for token_id in range(1, max(args.sizes) + 1, 2):
+            main_module.nft_catalog._records[token_id] = dict(token_metadata(token_id), owner="0xA")
+        main_module.nft_catalog.loaded = True
+
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            # Пул соединений прокси создаётся один раз на процесс — не замеряем
+            await client.get("/metadata-proxy/", params={"url": f"{meta_url}/0.json"})
+            print(f"RTT {args.rtt * 1000:.0f} мс, задержка метаданных {args.meta_latency * 1000:.0f} мс")
+            print(f"{'листингов':>10} {'по одному, с':>13} {'запросов':>9} {'/marketplace/view, с':>21} {'запросов':>9}")
+            for size in args.sizes:
+                listings = [
+                    {"tokenId": i, "uri": f"{meta_url}/{i}.json", "price": 100 + i}
+                    for i in range(1, size + 1)
+                ]
+                timings = {}
+                for name, scenario in (("old", per_listing), ("new", combined)):
+                    # Холодные кэши: каждый сценарий заново читает метаданные и считает цены
+                    main_module.metadata_proxy.cache.clear()
+                    main_module.prediction_cache.clear()
+                    start = time.perf_counter()
+                    prices, requests = await scenario(client, listings, args.rtt)
+                    timings[name] = (time.perf_counter() - start, requests, prices)
+                assert timings["old"][2] == timings["new"][2]
+                old, new = timings["old"], timings["new"]
+                print(f"{size:>10} {old[0]:>13.2f} {old[1]:>9} {new[0]:>21.3f} {new[1]:>9}")
+
+    asyncio.run(run())
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Бенчмарк запросов маркетплейса по каталогу NFT: полный GET /nft
+# с фильтрацией на клиенте против GET /nft?фильтры с курсорной пагинацией.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_nft_query.py --nfts 100000 --repeat 20
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+ITEM_TYPES = ["Boots", "Gloves", "Lamp", "Pickaxe", "Vest"]
+
+QUERIES = [
+    ("первая страница", {"limit": 50}),
+    ("владелец", {"owner": "0x0000000000000000000000000000000000000007", "limit": 50}),
+    ("тип + редкость", {"itemType": "Lamp", "rarity": 4, "sort": "-bonus", "limit": 50}),
+    ("диапазон бонуса", {"min_bonus": 20, "max_bonus": 25, "sort": "bonus", "limit": 50}),
+    ("редкий фильтр", {"itemType": "Vest", "rarity": 1, "min_bonus": 34, "sort": "-tokenId", "limit": 50}),
+]
+
+
+def seed(s3, nfts):
+    # Объекты NFT/ + контрольная точка каталога, чтобы старт не читал 100k объектов
+    bucket = main_module.BUCKET_NAME
+    records = []
+    for token_id in range(1, nfts + 1):
+        record = {
+            "tokenId": token_id, "itemType": ITEM_TYPES[token_id % 5], "rarity": token_id % 4 + 1,
+            "bonus": {"value": (token_id * 31) % 36}, "image": "https://example.com/item.jpg",
+            "uri": f"https://example.com/{token_id}.json", "owner": f"0x{token_id % 997:040x}",
+        }
+        records.append(record)
+        s3._storage[(bucket, f"NFT/{token_id}.json")] = b"{}"
+    etags = {f"NFT/{record['tokenId']}.json": s3.etag(b"{}") for record in records}
+    s3._storage[(bucket, main_module.NFT_CATALOG_KEY)] = json.dumps(
+        {"version": 1, "nfts": records, "etags": etags}
+    ).encode("utf-8")
+
+
+def client_side(body, params):
+    # Что делал фронтенд: весь список, фильтр и сортировка у себя
+    nfts = json.loads(body)
+    owner = params.get("owner")
+    sort = params.get("sort", "tokenId")
+    items = [
+        n for n in nfts
+        if (owner is None or n["owner"].lower() == owner)
+        and ("itemType" not in params or n["itemType"] == params["itemType"])
+        and ("rarity" not in params or n["rarity"] == params["rarity"])
+        and ("min_bonus" not in params or n["bonus"]["value"] >= params["min_bonus"])
+        and ("max_bonus" not in params or n["bonus"]["value"] <= params["max_bonus"])
+    ]
+    field = sort.lstrip("-")
+    key = (lambda n: n["bonus"]["value"]) if field == "bonus" else (lambda n: n[field])
+    items.sort(key=lambda n: (key(n), n["tokenId"]), reverse=sort.startswith("-"))
+    return items[:params["limit"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фильтры и пагинация GET /nft")
+    parser.add_argument("--nfts", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=0)
+    main_module.s3 = s3
+    seed(s3, args.nfts)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            start = time.perf_counter()
+            await main_module.nft_catalog.ensure_loaded()
+            print(f"каталог: {args.nfts} NFT, загрузка и индексы {time.perf_counter() - start:.2f} с")
+
+            r = await client.get("/nft")
+            full_body = r.content
+            print(f"полный GET /nft: {len(full_body) / 1e6:.1f} МБ")
+            print(f"{'запрос':>18} {'весь список, мс':>16} {'с фильтрами, мс':>16} {'байт':>8}")
+            for name, params in QUERIES:
+                start = time.perf_counter()
+                for _ in range(max(1, args.repeat // 10)):
+                    r = await client.get("/nft")
+                    expected = client_side(r.content, params)
+                full_ms = (time.perf_counter() - start) / max(1, args.repeat // 10) * 1000
+
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    r = await client.get("/nft", params=params)
+                    r.raise_for_status()
+                query_ms = (time.perf_counter() - start) / args.repeat * 1000
+
+                assert r.json()["items"] == expected, name
+                print(f"{name:>18} {full_ms:>16.1f} {query_ms:>16.2f} {len(r.content):>8}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Бенчмарк: N одиночных POST /predict-price против одного POST /predict-price/batch
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_predict_batch.py --sizes 10 100 500
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+from backend.main import app
+
+ITEM_TYPES = ["Boots", "Gloves", "Lamp", "Pickaxe", "Vest"]
+RARITIES = ["Common", "Rare", "Epic", "Legendary"]
+
+
+def make_payloads(n, seed=42):
+    rnd = random.Random(seed)
+    return [
+        {
+            "itemType": rnd.choice(ITEM_TYPES),
+            "rarity": rnd.choice(RARITIES),
+            "bonusValue": rnd.randint(1, 35),
+            "price": float(rnd.randint(10, 5000)),
+        }
+        for _ in range(n)
+    ]
+
+
+def bench_single(client, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        r = client.post("/predict-price", json=payload)
+        r.raise_for_status()
+    return time.perf_counter() - start
+
+
+def bench_batch(client, payloads):
+    start = time.perf_counter()
+    r = client.post("/predict-price/batch", json=payloads)
+    r.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Одиночные запросы /predict-price против пакетного")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Без lifespan: оценке цены S3 не нужен
+    client = TestClient(app)
+    bench_batch(client, make_payloads(5))  # прогрев
+
+    print(f"{'N':>6} {'single, s':>12} {'batch, s':>12} {'speedup':>9}")
+    for n in args.sizes:
+        payloads = make_payloads(n)
+        single = min(bench_single(client, payloads) for _ in range(args.repeat))
+        batch = min(bench_batch(client, payloads) for _ in range(args.repeat))
+        print(f"{n:>6} {single:>12.4f} {batch:>12.4f} {single / batch:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Нагрузочный бенчмарк API поверх LatencyS3: запросы в секунду и задержки.
+# Поднимает uvicorn в фоне (или вызывает приложение напрямую через ASGI,
+# --inprocess) и гоняет смесь запросов GameScreen: холодные GET /inventory
+# и /profile (промах кэша → S3) и PATCH /profile.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_s3_load.py --requests 3000 --concurrency 100 --latency 0.02
+#   python benchmarks/bench_s3_load.py --inprocess   # без сокетов: только сервер + S3
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+import uvicorn
+
+import backend.main as main_module
+from s3_standin import LatencyS3
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(s3, addresses):
+    bucket = main_module.BUCKET_NAME
+    for address in addresses:
+        s3._storage[(bucket, f"{main_module.PROFILE_PREFIX}{address}.json")] = json.dumps(
+            {"address": address, "nickname": "bench", "local_gems": 0}
+        ).encode("utf-8")
+        s3._storage[(bucket, f"{main_module.INVENTORY_PREFIX}{address}.json")] = json.dumps(
+            [{"id": f"{address}-{i}", "type": "Lamp", "rarity": "Rare", "image": "x", "attributes": {}} for i in range(10)]
+        ).encode("utf-8")
+
+
+def start_server(port):
+    config = uvicorn.Config(main_module.app, host="127.0.0.1", port=port, log_level="warning", timeout_keep_alive=120)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn не запустился")
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def run_load(client_kwargs, addresses, total, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for n in counter:
+            address = addresses[n % len(addresses)]
+            kind = n % 3
+            start = time.perf_counter()
+            if kind == 0:
+                r = await client.get(f"/inventory/{address}")
+            elif kind == 1:
+                r = await client.get(f"/profile/{address}")
+            else:
+                r = await client.patch(f"/profile/{address}", json={"local_gems": n})
+            latencies.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120, **client_kwargs) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк API поверх LatencyS3")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на вызов, с")
+    parser.add_argument("--addresses", type=int, default=1000)
+    parser.add_argument("--inprocess", action="store_true", help="ASGI-транспорт вместо uvicorn")
+    args = parser.parse_args()
+
+    s3 = LatencyS3(latency=args.latency)
+    main_module.s3 = s3
+    addresses = [f"0x{i:040x}" for i in range(args.addresses)]
+    seed(s3, addresses)
+
+    if args.inprocess:
+        client_kwargs = {"transport": httpx.ASGITransport(app=main_module.app), "base_url": "http://bench"}
+        latencies, errors, elapsed = asyncio.run(
+            run_load(client_kwargs, addresses, args.requests, args.concurrency)
+        )
+    else:
+        port = free_port()
+        server, thread = start_server(port)
+        try:
+            client_kwargs = {"base_url": f"http://127.0.0.1:{port}"}
+            latencies, errors, elapsed = asyncio.run(
+                run_load(client_kwargs, addresses, args.requests, args.concurrency)
+            )
+        finally:
+            server.should_exit = True
+            thread.join()
+
+    ms = [x * 1000 for x in latencies]
+    print(f"запросов: {len(ms)}, ошибок: {errors}, конкурентность: {args.concurrency}, задержка S3: {args.latency * 1000:.0f} мс")
+    print(f"RPS: {len(ms) / elapsed:.0f}")
+    print(f"p50: {percentile(ms, 50):.1f} мс, p95: {percentile(ms, 95):.1f} мс, p99: {percentile(ms, 99):.1f} мс")
+    print(f"вызовов S3: {dict(s3.calls)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Бенчмарк холодного старта воркера: время импорта backend.main, время до
+# начала приёма запросов (lifespan отработал), до первого ответа /predict-price
+# и до /ready — для каждого режима MODEL_WARMUP. Каждый замер — в новом процессе.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_startup.py --runs 5 --modes sync background lazy
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CHILD = r"""
+import asyncio, json, os, sys, time
+started = time.perf_counter()
+import backend.main as main_module
+imported = time.perf_counter() - started
+
+# Стенд S3 тянет test_api (и boto3) — это время в замер не входит
+standin_started = time.perf_counter()
+sys.path.insert(0, os.path.join(os.getcwd(), "benchmarks"))
+from s3_standin import LatencyS3
+import httpx
+offset = time.perf_counter() - standin_started
+main_module.s3 = LatencyS3(latency=float(sys.argv[1]))
+
+def since_start():
+    return time.perf_counter() - started - offset
+
+async def run():
+    result = {"import": imported}
+    async with main_module.lifespan(main_module.app):
+        result["serving"] = since_start()
+        transport = httpx.ASGITransport(app=main_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            r = await client.post("/predict-price", json={"itemType": "Vest", "rarity": "Rare", "bonusValue": 4})
+            r.raise_for_status()
+            result["first_predict"] = since_start()
+            while True:
+                r = await client.get("/ready")
+                if r.status_code != 503:
+                    break
+                await asyncio.sleep(0.005)
+            result["ready"] = since_start() if r.status_code == 200 else None
+    print(json.dumps(result))
+
+asyncio.run(run())
+"""
+
+
+def measure(mode, latency):
+    env = {**os.environ, "MODEL_WARMUP": mode, "S3_BUCKET_NAME": os.getenv("S3_BUCKET_NAME", "bench"),
+           "SELL_PRICES_REFRESH_INTERVAL": "0"}
+    out = subprocess.run([sys.executable, "-c", CHILD, str(latency)], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Холодный старт воркера")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["sync", "background", "lazy"])
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на вызов, с")
+    args = parser.parse_args()
+
+    print(f"{'MODEL_WARMUP':<12} {'импорт, мс':>11} {'приём запросов, мс':>19} {'первый /predict-price, мс':>26} {'/ready, мс':>11}")
+    for mode in args.modes:
+        runs = [measure(mode, args.latency) for _ in range(args.runs)]
+
+        def median(field):
+            values = [r[field] for r in runs if r.get(field) is not None]
+            return f"{statistics.median(values) * 1000:.0f}" if values else "—"
+
+        print(f"{mode:<12} {median('import'):>11} {median('serving'):>19} {median('first_predict'):>26} {median('ready'):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Бенчмарк уровней хранилища: S3 напрямую (S3Storage), SQLite + S3 с записью
+# сквозь (through) и SQLite + S3 с фоновой выгрузкой (back). Для каждого —
+# время на операцию и вызовы S3 на операцию: холодное и повторное чтение профиля,
+# условная запись (как у профиля и сегментов журнала), листинг префикса журнала.
+# Для back отдельно — перечитывание горячих префиксов на холодном старте.
+#
+# Запуск из корня проекта:
+#   python benchmarks/bench_storage_tiers.py --objects 500 --latency 0.02
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.storage import S3Storage
+from backend.tiered_storage import LocalStore, TieredStorage
+from s3_standin import LatencyS3
+
+BUCKET = "bench"
+
+
+def seed(s3, objects):
+    for i in range(objects):
+        address = f"0x{i:040x}"
+        s3._storage[(BUCKET, f"profiles/{address}.json")] = json.dumps(
+            {"address": address, "nickname": "bench", "local_gems": i}
+        ).encode("utf-8")
+        s3._storage[(BUCKET, f"inventory_log/{address}/{1:012d}.json")] = b'[{"op": "add"}]'
+
+
+def timed(s3, fn, keys):
+    calls = s3.total_calls()
+    start = time.perf_counter()
+    for key in keys:
+        fn(key)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(keys) * 1000, (s3.total_calls() - calls) / len(keys)
+
+
+def run_tier(name, make, objects, sample):
+    s3 = LatencyS3(latency=0)
+    seed(s3, objects)
+    storage = make(s3)
+    s3.latency = ARGS.latency
+    hydrate = None
+    if isinstance(storage, TieredStorage) and storage.write_mode == "back":
+        start = time.perf_counter()
+        storage.start()
+        hydrate = time.perf_counter() - start
+
+    keys = [f"profiles/0x{i:040x}.json" for i in range(sample)]
+    results = {
+        "холодное чтение": timed(s3, storage.get_bytes_versioned, keys),
+        "повторное чтение": timed(s3, storage.get_bytes_versioned, keys),
+    }
+
+    def conditional_write(key):
+        _, etag = storage.get_bytes_versioned(key)
+        storage.put_conditional(key, b'{"local_gems": 1}', etag, lambda data, etag: b'{"local_gems": 1}')
+
+    results["условная запись"] = timed(s3, conditional_write, keys)
+    results["новый сегмент журнала"] = timed(
+        s3, lambda key: storage.put_bytes(key.replace("profiles/", "inventory_log/x/"), b"[]", IfNoneMatch="*"), keys
+    )
+    results["листинг журнала"] = timed(
+        s3, lambda key: storage.list_keys(key.replace("profiles/", "inventory_log/").replace(".json", "/")), keys
+    )
+    uploaded = storage.stop()
+    for operation, (ms, calls) in results.items():
+        print(f"{name:<10} {operation:<24} {ms:>10.3f} {calls:>10.2f}")
+    if hydrate is not None:
+        print(f"{name:<10} {'холодный старт':<24} {hydrate * 1000:>10.1f}    ({objects * 2} объектов, выгружено при остановке: {uploaded})")
+
+
+def main():
+    global ARGS
+    parser = argparse.ArgumentParser(description="Сравнение уровней хранилища")
+    parser.add_argument("--objects", type=int, default=500, help="профилей (и журналов) в бакете")
+    parser.add_argument("--sample", type=int, default=100, help="операций каждого вида")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на вызов, с")
+    ARGS = parser.parse_args()
+
+    print(f"{'уровень':<10} {'операция':<24} {'мс/оп':>10} {'S3/оп':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tiers = [
+            ("s3", lambda s3: S3Storage(lambda: s3, BUCKET)),
+            ("through", lambda s3: TieredStorage(LocalStore(os.path.join(tmp, "through.db")), lambda: s3, BUCKET)),
+            ("back", lambda s3: TieredStorage(LocalStore(os.path.join(tmp, "back.db")), lambda: s3, BUCKET,
+                                              write_mode="back")),
+        ]
+        for name, make in tiers:
+            run_tier(name, make, ARGS.objects, ARGS.sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# Локальная замена S3 для бенчмарков: DummyS3 из test/test_api.py
+# с искусственной задержкой на каждый вызов и подсчётом операций.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "test")))
+
+from test_api import DummyS3  # noqa: E402
+
+
+class LatencyS3(DummyS3):
+    def __init__(self, latency: float = 0.02):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes_put = 0
+        self._calls_lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._calls_lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call("put_object")
+        response = super().put_object(Bucket, Key, Body, **kwargs)
+        with self._calls_lock:
+            self.bytes_put += len(self._storage[(Bucket, Key)])
+        return response
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("get_object")
+        return super().get_object(Bucket, Key, **kwargs)
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        self._call("list_objects_v2")
+        return super().list_objects_v2(Bucket, Prefix, **kwargs)
+
+    def delete_objects(self, Bucket, Delete):
+        self._call("delete_objects")
+        return super().delete_objects(Bucket, Delete)
+
+    def total_calls(self) -> int:
+        with self._calls_lock:
+            return sum(self.calls.values())
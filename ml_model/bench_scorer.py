@@ -0,0 +1,60 @@
+# Бенчмарк задержки: sklearn-пайплайн (pandas + joblib) против NumPy-скорера
+#
+# Запуск из корня проекта:
+#   python ml_model/bench_scorer.py
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.price_scorer import ArrayPriceModel, SklearnPriceModel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "nft_price_regressor.pkl")
+ARRAY_MODEL_PATH = os.path.join(BASE_DIR, "nft_price_regressor.npz")
+
+ROW = {"itemType": "Pickaxe", "rarity": "Epic", "bonusValue": 12}
+
+
+def per_call_us(fn, repeat):
+    fn()  # прогрев
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def cold_start_ms(snippet):
+    # Импорт + загрузка модели в чистом процессе
+    code = (
+        "import time, sys; t = time.perf_counter(); "
+        f"sys.path.insert(0, {os.path.join(BASE_DIR, '..')!r}); {snippet}; "
+        "print((time.perf_counter() - t) * 1000)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    sklearn_model = SklearnPriceModel.load(MODEL_PATH)
+    array_model = ArrayPriceModel.load(ARRAY_MODEL_PATH)
+    batch = [ROW] * 500
+
+    print(f"{'':<22} {'sklearn':>12} {'numpy':>12}")
+    single = (per_call_us(lambda: sklearn_model.predict([ROW]), 200),
+              per_call_us(lambda: array_model.predict([ROW]), 2000))
+    print(f"{'1 строка, мкс':<22} {single[0]:>12.1f} {single[1]:>12.1f}")
+    many = (per_call_us(lambda: sklearn_model.predict(batch), 20),
+            per_call_us(lambda: array_model.predict(batch), 50))
+    print(f"{'500 строк, мкс':<22} {many[0]:>12.1f} {many[1]:>12.1f}")
+    cold = (
+        cold_start_ms(f"from backend.price_scorer import SklearnPriceModel as M; M.load({MODEL_PATH!r})"),
+        cold_start_ms(f"from backend.price_scorer import ArrayPriceModel as M; M.load({ARRAY_MODEL_PATH!r})"),
+    )
+    print(f"{'холодный старт, мс':<22} {cold[0]:>12.1f} {cold[1]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Экспорт nft_price_regressor.pkl в компактный набор NumPy-массивов (.npz),
+# который backend/price_scorer.py считает без pandas и sklearn.
+#
+# Запуск из корня проекта после переобучения модели:
+#   python ml_model/export_model.py
+import argparse
+import os
+import sys
+
+import joblib
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import OneHotEncoder
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from backend.price_scorer import file_sha256
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(BASE_DIR, "nft_price_regressor.pkl")
+DEFAULT_OUTPUT_PATH = os.path.join(BASE_DIR, "nft_price_regressor.npz")
+
+
+def export_pipeline(pipeline) -> dict:
+    preprocessor = pipeline.named_steps["preprocessor"]
+    regressor = pipeline.named_steps["regressor"]
+    if not isinstance(preprocessor, ColumnTransformer) or not isinstance(regressor, RandomForestRegressor):
+        raise ValueError("Поддерживается только ColumnTransformer + RandomForestRegressor")
+
+    # === Кодирование категорий ===
+    name, encoder, categorical_columns = preprocessor.transformers_[0]
+    if not isinstance(encoder, OneHotEncoder) or encoder.drop is not None:
+        raise ValueError(f"Неподдерживаемый трансформер {name}")
+    all_columns = list(preprocessor.feature_names_in_)
+    passthrough_columns = [c for c in all_columns if c not in categorical_columns]
+
+    arrays = {
+        "categorical_columns": np.array(categorical_columns),
+        "passthrough_columns": np.array(passthrough_columns),
+        "n_features": np.array(len(preprocessor.get_feature_names_out())),
+    }
+    for i, categories in enumerate(encoder.categories_):
+        arrays[f"categories_{i}"] = np.array([str(c) for c in categories])
+
+    # === Деревья: плоские массивы с глобальными индексами узлов ===
+    roots, feature, threshold, left, right, value = [], [], [], [], [], []
+    offset = 0
+    for estimator in regressor.estimators_:
+        tree = estimator.tree_
+        local = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        # Лист ссылается сам на себя
+        left.append(np.where(is_leaf, local, tree.children_left) + offset)
+        right.append(np.where(is_leaf, local, tree.children_right) + offset)
+        value.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+
+    arrays.update({
+        "roots": np.array(roots, dtype=np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "value": np.concatenate(value).astype(np.float64),
+        "max_depth": np.array(max(e.tree_.max_depth for e in regressor.estimators_)),
+    })
+    return arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт модели цены NFT в .npz")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    args = parser.parse_args()
+
+    arrays = export_pipeline(joblib.load(args.model))
+    # Хэш исходного .pkl: backend не возьмёт устаревший экспорт
+    arrays["source_sha256"] = np.array(file_sha256(args.model))
+    np.savez_compressed(args.output, **arrays)
+
+    size_kb = os.path.getsize(args.output) / 1024
+    print(f"✅ Экспортировано {len(arrays['roots'])} деревьев, {len(arrays['value'])} узлов → {args.output} ({size_kb:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,4 +37,31 @@ def test_predict_price_with_price():
     assert data["status"] == "ok"
     assert "recommended_price" in data
     assert "deviation" in data
-    assert "price_status" in data
\ No newline at end of file
+    assert "price_status" in data
+
+def test_array_scorer_matches_sklearn_on_full_grid():
+    import joblib
+    import numpy as np
+    from backend.main import (
+        ARRAY_MODEL_PATH,
+        MODEL_PATH,
+        KNOWN_ITEM_TYPES,
+        KNOWN_RARITIES,
+        MAX_KNOWN_BONUS,
+    )
+    from backend.price_scorer import ArrayPriceModel, file_sha256
+
+    scorer = ArrayPriceModel.load(ARRAY_MODEL_PATH)
+    assert scorer.source_sha256 == file_sha256(MODEL_PATH), "запусти ml_model/export_model.py"
+
+    # Полная сетка признаков + неизвестные категории и бонусы за пределами обучения
+    rows = [
+        {"itemType": item_type, "rarity": rarity, "bonusValue": bonus}
+        for item_type in KNOWN_ITEM_TYPES + ["Sword"]
+        for rarity in KNOWN_RARITIES + ["rare"]
+        for bonus in range(-1, MAX_KNOWN_BONUS + 10)
+    ]
+    expected = joblib.load(MODEL_PATH).predict(pd.DataFrame(rows))
+    assert np.array_equal(scorer.predict(rows), expected)
+    # Общий путь обхода деревьев (без таблицы ступенек) тоже совпадает
+    assert np.array_equal(scorer._predict_trees(scorer.encode(rows)), expected)
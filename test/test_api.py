@@ -2,10 +2,13 @@ import warnings
 import sys
 import os
 import io
+import fcntl
+from collections.abc import MutableMapping
 import pytest
 import botocore
 from fastapi.testclient import TestClient
 import boto3
+import httpx
 
 
 warnings.filterwarnings(
@@ -26,7 +29,6 @@ from backend.main import (
     app,
     user_inventory,
     user_profiles,
-    sell_prices,
     BUCKET_NAME,
     INVENTORY_PREFIX,
     PROFILE_PREFIX,
@@ -37,6 +39,8 @@ from backend.main import (
 @pytest.fixture(scope="module")
 def client():
     with TestClient(app) as c:
+        # Модель прогревается в фоне (MODEL_WARMUP=background): тестам нужна загруженная
+        main_module.warmup_done.wait(timeout=60)
         yield c
 
 # === Dummy S3-клиент «в памяти» ===
@@ -46,7 +50,12 @@ class DummyS3:
         # Добавляем атрибут exceptions, чтобы имитировать boto3.client('s3').exceptions
         self.exceptions = botocore.exceptions
 
-    def put_object(self, Bucket, Key, Body, **kwargs):
+    @staticmethod
+    def etag(data):
+        import hashlib
+        return '"%s"' % hashlib.md5(data).hexdigest()
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
         if isinstance(Body, str):
             data = Body.encode("utf-8")
         elif isinstance(Body, bytes):
@@ -55,22 +64,98 @@ class DummyS3:
             data = Body.read()
         else:
             data = str(Body).encode("utf-8")
+        # Условная запись, как в S3: If-Match по ETag, If-None-Match: * — только новый объект
+        current = self._storage.get((Bucket, Key))
+        if (IfNoneMatch == "*" and current is not None) or (
+            IfMatch is not None and (current is None or self.etag(current) != IfMatch)
+        ):
+            raise self.exceptions.ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": "Precondition Failed"}}, "PutObject"
+            )
         self._storage[(Bucket, Key)] = data
+        return {"ETag": self.etag(data)}
 
-    def get_object(self, Bucket, Key):
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
         if (Bucket, Key) not in self._storage:
             raise self.exceptions.ClientError(
                 {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject"
             )
         body_bytes = self._storage[(Bucket, Key)]
-        return {"Body": io.BytesIO(body_bytes)}
+        if IfNoneMatch is not None and IfNoneMatch == self.etag(body_bytes):
+            raise self.exceptions.ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        return {"Body": io.BytesIO(body_bytes), "ETag": self.etag(body_bytes)}
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None, MaxKeys=1000, StartAfter=None):
+        # Как в настоящем S3: ключи по алфавиту, не больше MaxKeys на страницу
+        keys = sorted(k for (b, k) in list(self._storage) if b == Bucket and k.startswith(Prefix))
+        if StartAfter is not None:
+            keys = [k for k in keys if k > StartAfter]
+        if ContinuationToken is not None:
+            keys = [k for k in keys if k > ContinuationToken]
+        page = keys[:MaxKeys]
+        response = {
+            "Contents": [{"Key": k, "ETag": self.etag(self._storage[(Bucket, k)])} for k in page],
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self._storage.pop((Bucket, obj["Key"]), None)
+        return {}
+
+# === S3 в каталоге на диске: общий бакет для нескольких процессов ===
+class DirStorage(MutableMapping):
+    # (bucket, key) -> bytes, один файл на объект; запись атомарная (через os.replace)
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, bucket_key):
+        return os.path.join(self.directory, *bucket_key)
+
+    def __getitem__(self, bucket_key):
+        try:
+            with open(self._path(bucket_key), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            raise KeyError(bucket_key)
+
+    def __setitem__(self, bucket_key, data):
+        path = self._path(bucket_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
 
-    def list_objects_v2(self, Bucket, Prefix):
-        contents = []
-        for (b, k), _ in self._storage.items():
-            if b == Bucket and k.startswith(Prefix):
-                contents.append({"Key": k})
-        return {"Contents": contents}
+    def __delitem__(self, bucket_key):
+        os.remove(self._path(bucket_key))
+
+    def __iter__(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if ".tmp-" in name or name == ".lock":
+                    continue
+                bucket, _, key = os.path.relpath(os.path.join(root, name), self.directory).partition(os.sep)
+                yield bucket, key.replace(os.sep, "/")
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class DirS3(DummyS3):
+    def __init__(self, directory):
+        super().__init__()
+        self._storage = DirStorage(directory)
+        self._lock_path = os.path.join(directory, ".lock")
+
+    def put_object(self, *args, **kwargs):
+        # Проверка условия и запись — атомарно для всех процессов
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return super().put_object(*args, **kwargs)
 
 # === FIXTURE: автоматически подменяем boto3.client и main_module.s3 на DummyS3, сбрасываем состояние ===
 @pytest.fixture(autouse=True)
@@ -85,29 +170,23 @@ def mock_s3_client(monkeypatch):
     # Очищаем глобальные «хранилища» перед каждым тестом
     user_inventory.clear()
     user_profiles.clear()
-    sell_prices.clear()
+    main_module.sell_price_config.reset()
+    main_module.profile_listing_cache.clear()
+    main_module.inventory_loads.clear()
+    main_module.profile_loads.clear()
+    main_module.write_back.clear()
+    main_module.nft_catalog.reset()
 
     return dummy
 
-# === FIXTURE: подменяем requests.get для /metadata-proxy/ ===
+# === FIXTURE: подменяем HTTP-транспорт прокси для /metadata-proxy/ ===
 @pytest.fixture(autouse=True)
-def mock_requests_get(monkeypatch):
-    class DummyResponse:
-        def __init__(self, data, status_code=200):
-            self._data = data
-            self.status_code = status_code
+def mock_metadata_transport(monkeypatch):
+    def handler(request):
+        return httpx.Response(200, json={"dummy": "data"})
 
-        def raise_for_status(self):
-            if not (200 <= self.status_code < 300):
-                raise Exception(f"HTTP {self.status_code}")
-
-        def json(self):
-            return self._data
-
-    def fake_get(url, *args, **kwargs):
-        return DummyResponse({"dummy": "data"}, 200)
-
-    monkeypatch.setattr("requests.get", fake_get)
+    monkeypatch.setattr(main_module.metadata_proxy, "transport", httpx.MockTransport(handler))
+    main_module.metadata_proxy.clear()
 
 # Остальные тесты остаются без изменений
 def test_root(client):
@@ -215,6 +294,50 @@ def test_sell_prices_crud(client):
     assert data3["epic"] == 75
     assert data3["legendary"] == 150
 
+def test_sell_prices_versioned_refresh_and_etag(client, mock_s3_client, monkeypatch):
+    import json
+    config = main_module.sell_price_config
+
+    r1 = client.get("/sell-prices")
+    etag = r1.headers["etag"]
+    assert client.get("/sell-prices", headers={"If-None-Match": etag}).status_code == 304
+
+    r2 = client.post("/sell-prices", json={"rare": 25, "mythic": 1})
+    assert r2.json()["version"] == 1 and "mythic" not in r2.json()["updated"]
+    r3 = client.get("/sell-prices", headers={"If-None-Match": etag})
+    assert r3.status_code == 200 and r3.json()["rare"] == 25
+    assert r3.headers["etag"] != etag and r3.headers["x-config-version"] == "1"
+
+    # Чтение цен не обращается к S3
+    def no_s3(*args, **kwargs):
+        raise AssertionError("GET /sell-prices не должен читать S3")
+    with monkeypatch.context() as m:
+        m.setattr(mock_s3_client, "get_object", no_s3)
+        assert client.get("/sell-prices").json()["rare"] == 25
+
+    # Другой воркер записал новую версию: условный GET её подхватывает, повторный — 304 от S3
+    external = {"common": 5, "rare": 25, "epic": 99, "legendary": 100}
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=SELL_PRICES_KEY, Body=json.dumps({"version": 5, "prices": external}))
+    assert client.get("/sell-prices").json()["epic"] == 50
+    assert config.refresh() is True
+    assert config.refresh() is False and config.not_modified >= 1
+    assert client.get("/sell-prices").json()["epic"] == 99
+
+    # Запись поверх устаревшей версии: наши поля накладываются на чужие
+    mock_s3_client.put_object(
+        Bucket=BUCKET_NAME, Key=SELL_PRICES_KEY, Body=json.dumps({"version": 6, "prices": dict(external, legendary=500)})
+    )
+    r4 = client.post("/sell-prices", json={"rare": 30})
+    assert r4.json()["version"] == 7
+    assert r4.json()["updated"] == {"common": 5, "rare": 30, "epic": 99, "legendary": 500}
+    stored = json.loads(mock_s3_client._storage[(BUCKET_NAME, SELL_PRICES_KEY)])
+    assert stored == {"version": 7, "prices": r4.json()["updated"]}
+
+    # Старый формат (просто словарь) читается как версия 0
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=SELL_PRICES_KEY, Body=json.dumps({"common": 1, "rare": 2}))
+    assert config.refresh() is True and config.current.version == 0
+    assert client.get("/sell-prices").json() == {"common": 1, "rare": 2}
+
 def test_nft_create_and_save_and_retrieve(client):
     # 1) POST /nft/create-json
     wrap_payload = {
@@ -287,4 +410,1560 @@ def test_predict_price_with_price(client):
     assert r.status_code == 200
     data = r.json()
     assert data["status"] == "ok"
-    assert "recommended_price" in data
\ No newline at end of file
+    assert "recommended_price" in data
+
+def test_predict_price_batch_matches_single(client):
+    payloads = [
+        {"itemType": "Sword", "rarity": "rare", "bonusValue": 10, "price": 50.0},
+        {"itemType": "Boots", "rarity": "Common", "bonusValue": 1},
+        {"itemType": "Gloves", "rarity": "Legendary", "bonusValue": 20, "price": 5000.0},
+    ]
+    r = client.post("/predict-price/batch", json=payloads)
+    assert r.status_code == 200
+    data = r.json()
+    assert data["status"] == "ok"
+    assert len(data["results"]) == len(payloads)
+
+    # Пакетный результат совпадает с одиночными запросами
+    for payload, batch_result in zip(payloads, data["results"]):
+        single = client.post("/predict-price", json=payload).json()
+        assert batch_result == single
+
+def test_predict_price_batch_limits(client):
+    r1 = client.post("/predict-price/batch", json=[])
+    assert r1.status_code == 200
+    assert r1.json()["results"] == []
+
+    too_many = [{"itemType": "Boots", "rarity": "Common", "bonusValue": 1}] * (main_module.MAX_PREDICT_BATCH + 1)
+    r2 = client.post("/predict-price/batch", json=too_many)
+    assert r2.status_code == 413
+
+def test_prediction_cache_hits_and_reload(client):
+    main_module.prediction_cache.clear()
+    payload = {"itemType": "Lamp", "rarity": "Epic", "bonusValue": 5}
+
+    r1 = client.post("/predict-price", json=payload)
+    r2 = client.post("/predict-price", json=payload)
+    assert r1.json() == r2.json()
+
+    stats = client.get("/predict-price/cache").json()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["size"] == 1
+
+    # Перезагрузка модели сбрасывает кэш
+    main_module.load_price_model()
+    stats = client.get("/predict-price/cache").json()
+    assert stats["size"] == 0
+    assert stats["hits"] == 0 and stats["misses"] == 0
+
+def test_prediction_cache_prewarm(client):
+    main_module.prediction_cache.clear()
+    main_module.prewarm_prediction_cache()
+    expected = (
+        len(main_module.KNOWN_ITEM_TYPES)
+        * len(main_module.KNOWN_RARITIES)
+        * (main_module.MAX_KNOWN_BONUS + 1)
+    )
+    assert len(main_module.prediction_cache) == expected
+
+    r = client.post("/predict-price", json={"itemType": "Boots", "rarity": "Common", "bonusValue": 1})
+    assert r.status_code == 200
+    assert main_module.prediction_cache.stats()["hits"] == 1
+
+def test_predict_price_reports_model_version(client):
+    active = main_module.model_registry.active
+    r = client.post("/predict-price", json={"itemType": "Vest", "rarity": "Rare", "bonusValue": 4})
+    assert r.json()["model_version"] == active.version
+
+    status = client.get("/predict-price/model").json()
+    assert status["active"]["version"] == active.version
+
+def test_model_registry_background_swap_and_rollback():
+    from backend.model_registry import ModelRegistry, ModelVersion
+
+    class ConstModel:
+        def __init__(self, price):
+            self.price = price
+
+        def predict(self, rows):
+            return [self.price] * len(rows)
+
+    versions = iter([ModelVersion("v1", ConstModel(10), "a"), ModelVersion("v2", ConstModel(20), "b")])
+    swaps = []
+    registry = ModelRegistry(lambda: next(versions), on_swap=lambda v: swaps.append(v.version))
+
+    registry.load()
+    assert registry.active.version == "v1"
+
+    # Фоновая загрузка: до завершения активна старая версия, затем атомарная подмена
+    assert registry.load_in_background()
+    registry.wait(timeout=5)
+    assert registry.active.version == "v2"
+    assert registry.previous.version == "v1"
+
+    assert registry.rollback().version == "v1"
+    assert registry.active.model.predict([{}]) == [10]
+    assert swaps == ["v1", "v2", "v1"]
+
+def test_model_reload_and_rollback_endpoints(client):
+    main_module.load_price_model()
+    version = main_module.model_registry.active.version
+
+    r1 = client.post("/predict-price/model/reload")
+    assert r1.status_code == 200
+    main_module.model_registry.wait(timeout=30)
+    # Та же версия на диске — подмены нет
+    assert main_module.model_registry.active.version == version
+
+    r2 = client.post("/predict-price/model/rollback")
+    assert r2.status_code == 200
+    assert r2.json()["active"]["version"] == version
+
+def test_write_back_coalesces_profile_patches(client, mock_s3_client, monkeypatch):
+    monkeypatch.setattr(main_module.write_back, "delay", 60.0)
+    monkeypatch.setattr(main_module.write_back, "max_updates", 1000)
+    key = (BUCKET_NAME, f"{PROFILE_PREFIX}0xgems.json")
+
+    puts = []
+    original_put = mock_s3_client.put_object
+    def counting_put(Bucket, Key, Body, **kwargs):
+        puts.append(Key)
+        return original_put(Bucket, Key, Body, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "put_object", counting_put)
+
+    client.post("/profile/", json={"address": "0xGEMS", "nickname": "Miner"})
+    for gems in range(1, 51):
+        r = client.patch("/profile/0xGEMS", json={"local_gems": gems})
+        assert r.status_code == 200
+
+    # Всё в памяти, в S3 ещё ничего не записано
+    assert puts == []
+    assert client.get("/profile/0xGEMS").json()["local_gems"] == 50
+
+    # Один flush — одна запись с последним состоянием
+    assert main_module.write_back.flush_all() == 1
+    assert puts == [key[1]]
+    assert '"local_gems":50' in mock_s3_client._storage[key].decode("utf-8")
+
+def test_write_back_flushes_by_count_and_on_stop(mock_s3_client):
+    from backend.write_back import WriteBackBuffer
+
+    writes = []
+    def writer(key, body):
+        writes.append((key, body))
+        mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=body)
+
+    buffer = WriteBackBuffer(writer, delay=60.0, max_updates=3)
+    for i in range(7):
+        if buffer.mark_dirty("inventories/a.json", lambda i=i: f"[{i}]"):
+            buffer.flush("inventories/a.json")
+    assert not buffer.mark_dirty("inventories/b.json", lambda: "[]")
+
+    # 7 изменений при max_updates=3 → две записи по счётчику, остаток в буфере
+    assert [body for _, body in writes] == ["[2]", "[5]"]
+    assert buffer.is_dirty("inventories/a.json")
+
+    # Остановка (как в lifespan shutdown) дописывает всё
+    assert buffer.stop() == 2
+    assert mock_s3_client._storage[(BUCKET_NAME, "inventories/a.json")] == b"[6]"
+
+    stats = buffer.stats()
+    assert stats["updates"] == 8
+    assert stats["flushes"] == 4
+    assert stats["write_amplification"] == 0.5
+    assert stats["dirty_keys"] == 0
+
+    # Блокировки ключей — фиксированный набор полос, не по одной на каждый записанный ключ
+    stripes = len(buffer._key_locks)
+    for i in range(stripes * 4):
+        buffer.mark_dirty(f"inventory_log/a/{i:012d}.json", lambda: "[]")
+    assert buffer.flush_all() == stripes * 4
+    assert len(buffer._key_locks) == stripes
+
+def test_write_back_background_flush_by_time(mock_s3_client):
+    import time
+    from backend.write_back import WriteBackBuffer
+
+    buffer = WriteBackBuffer(
+        lambda key, body: mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=body),
+        delay=0.05,
+    )
+    buffer.start()
+    try:
+        buffer.mark_dirty("profiles/x.json", lambda: "{}")
+        deadline = time.time() + 5
+        while buffer.is_dirty("profiles/x.json") and time.time() < deadline:
+            time.sleep(0.01)
+        assert (BUCKET_NAME, "profiles/x.json") in mock_s3_client._storage
+        assert buffer.stats()["max_flush_lag"] >= 0.05
+    finally:
+        buffer.stop()
+
+def test_profiles_listing_sees_buffered_writes(client, monkeypatch):
+    monkeypatch.setattr(main_module.write_back, "delay", 60.0)
+    client.post("/profile/", json={"address": "0xLIST", "nickname": "Pending"})
+    assert main_module.write_back.is_dirty(f"{PROFILE_PREFIX}0xlist.json")
+
+    profiles = client.get("/profiles").json()
+    assert any(p["address"] == "0xLIST" for p in profiles)
+
+def test_profiles_listing_survives_failed_buffered_write(client, mock_s3_client, monkeypatch):
+    monkeypatch.setattr(main_module.write_back, "delay", 60.0)
+    client.post("/profile/", json={"address": "0xOK", "nickname": "Saved"})
+    main_module.write_back.flush_all()
+    client.post("/profile/", json={"address": "0xFAIL", "nickname": "Pending"})
+
+    original_put = mock_s3_client.put_object
+    def failing_put(Bucket, Key, Body, **kwargs):
+        if Key == f"{PROFILE_PREFIX}0xfail.json":
+            raise RuntimeError("S3 недоступен")
+        return original_put(Bucket, Key, Body, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "put_object", failing_put)
+
+    r = client.get("/profiles")
+    assert r.status_code == 200
+    assert [p["address"] for p in r.json()] == ["0xOK"]
+    # Неудачная запись осталась в буфере и уйдёт при следующем сбросе
+    assert main_module.write_back.is_dirty(f"{PROFILE_PREFIX}0xfail.json")
+
+def test_read_endpoints_serve_preserialized_bodies(client, mock_s3_client, monkeypatch):
+    import json
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+
+    # Инвентарь: тело сериализуется один раз и сбрасывается при изменении
+    address = "0xserialized"
+    item = {"id": "s1", "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {"n": 1}}
+    client.post(f"/inventory/{address}", json=item)
+    inventory = user_inventory[address]
+    body = inventory.to_json()
+    assert client.get(f"/inventory/{address}").content == body
+    assert inventory.to_json() is body
+    client.post(f"/inventory/{address}", json=dict(item, id="s2"))
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == ["s1", "s2"]
+
+    client.post("/profile/", json={"address": address, "nickname": "raw"})
+    assert client.get(f"/profile/{address}").json()["nickname"] == "raw"
+    client.patch(f"/profile/{address}", json={"nickname": "raw2"})
+    assert client.get(f"/profile/{address}").json()["nickname"] == "raw2"
+
+    # /profiles: неизменённые по ETag объекты берутся из кэша без GET
+    for i in range(5):
+        client.post("/profile/", json={"address": f"0xlist{i}", "nickname": f"n{i}", "local_gems": i})
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{PROFILE_PREFIX}0xextra.json", Body=json.dumps(
+        {"address": "0xextra", "nickname": "x", "unknown_field": 1}
+    ))
+    gets = []
+    original_get = mock_s3_client.get_object
+    def counting_get(*args, **kwargs):
+        gets.append(kwargs.get("Key"))
+        return original_get(*args, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "get_object", counting_get)
+
+    first = client.get("/profiles").json()
+    assert len(first) == 7 and len(gets) == 7
+    assert all("unknown_field" not in p for p in first)
+    gets.clear()
+    assert client.get("/profiles").json() == first and gets == []
+    client.patch("/profile/0xlist3", json={"local_gems": 30})
+    gets.clear()
+    second = client.get("/profiles").json()
+    assert gets == [f"{PROFILE_PREFIX}0xlist3.json"]
+    assert [p["local_gems"] for p in second if p["address"] == "0xlist3"] == [30]
+
+    # NFT не из каталога: байты из S3 как есть
+    raw = b'{"tokenId":9001,"itemType":"Lamp"}'
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key="NFT/9001.json", Body=raw)
+    r = client.get("/nft/9001")
+    assert r.content == raw and r.headers["content-type"] == "application/json"
+
+def test_user_cache_lru_ttl_and_pinning(monkeypatch):
+    import time
+    from backend.bounded_cache import BoundedCache
+
+    pinned = set()
+    cache = BoundedCache(max_entries=2, ttl=0.05, is_pinned=lambda key: key in pinned)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1  # "a" теперь самый свежий
+    cache["c"] = 3
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+    # Несохранённую запись не вытесняем, даже сверх лимита и по TTL
+    pinned.add("a")
+    cache["d"] = 4
+    cache["e"] = 5
+    assert "a" in cache
+    time.sleep(0.06)
+    assert cache.get("a") == 1
+    assert cache.get("e") is None
+    assert cache.stats()["expirations"] >= 1
+
+    by_bytes = BoundedCache(max_entries=100, max_bytes=10, sizer=len)
+    by_bytes["x"] = "12345"
+    by_bytes["y"] = "12345"
+    by_bytes["z"] = "1"
+    assert "x" not in by_bytes and by_bytes.bytes == 6
+
+def test_evicted_inventory_reloads_from_s3(client, monkeypatch):
+    from backend.bounded_cache import BoundedCache
+
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    small = BoundedCache(max_entries=1)
+    monkeypatch.setattr(main_module, "user_inventory", small)
+
+    item = {"id": "i1", "type": "Lamp", "rarity": "Rare", "image": "x", "attributes": {}}
+    assert client.post("/inventory/0xA1", json=item).status_code == 200
+    assert client.get("/inventory/0xB2").json() == []  # вытесняет 0xa1
+    assert "0xa1" not in small
+
+    # Промах → перечитываем из S3 без потери данных
+    assert [i["id"] for i in client.get("/inventory/0xA1").json()] == ["i1"]
+    stats = client.get("/cache/stats").json()["inventory"]
+    assert stats["evictions"] >= 2 and stats["misses"] >= 3
+
+def test_user_cache_memory_is_bounded(mock_s3_client, monkeypatch):
+    import asyncio
+    import gc
+    import tracemalloc
+    from backend.bounded_cache import BoundedCache
+    from backend.storage import S3Storage
+
+    population = 100_000
+    for i in range(population):
+        address = f"0x{i:040x}"
+        mock_s3_client._storage[(BUCKET_NAME, f"{PROFILE_PREFIX}{address}.json")] = (
+            f'{{"address": "{address}", "nickname": "p{i}", "local_gems": {i}}}'.encode("utf-8")
+        )
+
+    # Без пула потоков: тест про память кэша, а не про ввод-вывод
+    class InlineStorage(S3Storage):
+        async def run(self, fn, *args, **kwargs):
+            return fn(*args, **kwargs)
+
+    monkeypatch.setattr(main_module, "storage", InlineStorage(lambda: mock_s3_client, BUCKET_NAME))
+
+    cache = BoundedCache(
+        max_entries=1000,
+        max_bytes=512 * 1024,
+        sizer=lambda profile: main_module.PROFILE_SIZE,
+    )
+    monkeypatch.setattr(main_module, "user_profiles", cache)
+
+    async def read_profiles(start, stop):
+        for i in range(start, stop):
+            profile = await main_module.get_user_profile(f"0x{i:040x}")
+            assert profile.local_gems == i
+
+    def touch(start, stop):
+        asyncio.run(read_profiles(start, stop))
+
+    touch(0, 5_000)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        touch(5_000, population)
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    # 95k новых адресов (~60 МБ профилей без лимита), а память почти не растёт
+    assert len(cache) <= 1000
+    assert cache.bytes <= 512 * 1024
+    assert cache.stats()["evictions"] == population - len(cache)
+    assert growth < 2 * 1024 * 1024
+
+def test_storage_runs_s3_calls_concurrently(mock_s3_client, monkeypatch):
+    import asyncio
+    import time
+
+    for i in range(20):
+        mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{PROFILE_PREFIX}{i}.json", Body="{}")
+
+    original_get = mock_s3_client.get_object
+    def slow_get(Bucket, Key):
+        time.sleep(0.05)
+        return original_get(Bucket, Key)
+    monkeypatch.setattr(mock_s3_client, "get_object", slow_get)
+
+    async def read_all():
+        keys = [f"{PROFILE_PREFIX}{i}.json" for i in range(20)] + ["missing.json"]
+        return await asyncio.gather(*(main_module.storage.get(key) for key in keys))
+
+    start = time.perf_counter()
+    results = asyncio.run(read_all())
+    elapsed = time.perf_counter() - start
+
+    assert results[:20] == [b"{}"] * 20
+    assert results[20] is None
+    # 21 вызов по 50 мс параллельно, а не последовательно (~1 с)
+    assert elapsed < 0.5
+
+def test_nft_listing_paginates_and_isolates_errors(client, mock_s3_client):
+    total = 2500
+    for token_id in range(total):
+        mock_s3_client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=f"NFT/{token_id}.json",
+            Body=f'{{"tokenId": {token_id}, "owner": "0xA"}}',
+        )
+    # Битый объект не должен ронять весь список
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key="NFT/broken.json", Body="{not json")
+
+    r = client.get("/nft")
+    assert r.status_code == 200
+    token_ids = sorted(nft["tokenId"] for nft in r.json())
+    assert token_ids == list(range(total))
+
+def test_profiles_listing_fetches_in_parallel(client, mock_s3_client, monkeypatch):
+    import time
+
+    for i in range(40):
+        mock_s3_client.put_object(
+            Bucket=BUCKET_NAME, Key=f"{PROFILE_PREFIX}0x{i}.json", Body=f'{{"address": "0x{i}"}}'
+        )
+    original_get = mock_s3_client.get_object
+    def slow_get(Bucket, Key):
+        time.sleep(0.05)
+        return original_get(Bucket, Key)
+    monkeypatch.setattr(mock_s3_client, "get_object", slow_get)
+
+    start = time.perf_counter()
+    r = client.get("/profiles")
+    elapsed = time.perf_counter() - start
+
+    assert r.status_code == 200
+    assert len(r.json()) == 40
+    # Последовательно было бы 40 × 50 мс = 2 с
+    assert elapsed < 1.0
+
+def test_nft_catalog_serves_listing_without_bucket_scan(client, mock_s3_client, monkeypatch):
+    for token_id in (1, 2, 3):
+        nft = {
+            "tokenId": token_id, "itemType": "Lamp", "rarity": 2, "bonus": {"value": token_id},
+            "image": "x", "uri": f"ipfs://{token_id}", "owner": "0xA",
+        }
+        assert client.post("/nft/save", json=nft).status_code == 200
+
+    calls = []
+    for name in ("get_object", "list_objects_v2"):
+        original = getattr(mock_s3_client, name)
+        def counted(*args, _original=original, _name=name, **kwargs):
+            calls.append(_name)
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(mock_s3_client, name, counted)
+
+    r1 = client.get("/nft")
+    assert r1.status_code == 200
+    assert [nft["tokenId"] for nft in r1.json()] == [1, 2, 3]
+    assert calls == []  # ни одного обращения к S3
+
+    # Ревалидация по ETag
+    etag = r1.headers["etag"]
+    r2 = client.get("/nft", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+
+    # Смена владельца → новая версия и новый ETag
+    client.post("/nft/save", json={
+        "tokenId": 2, "itemType": "Lamp", "rarity": 2, "bonus": {"value": 2},
+        "image": "x", "uri": "ipfs://2", "owner": "0xB",
+    })
+    r3 = client.get("/nft", headers={"If-None-Match": etag})
+    assert r3.status_code == 200
+    assert r3.headers["etag"] != etag
+    assert r3.json()[1]["owner"] == "0xB"
+
+def test_nft_catalog_checkpoint_and_rebuild(client, mock_s3_client):
+    nft = {
+        "tokenId": 5, "itemType": "Vest", "rarity": 1, "bonus": {"value": 1},
+        "image": "x", "uri": "ipfs://5", "owner": "0xA",
+    }
+    client.post("/nft/save", json=nft)
+    main_module.write_back.flush_all()
+    assert (BUCKET_NAME, main_module.NFT_CATALOG_KEY) in mock_s3_client._storage
+
+    # Новый процесс: каталог поднимается из контрольной точки
+    main_module.nft_catalog.reset()
+    assert [n["tokenId"] for n in client.get("/nft").json()] == [5]
+
+    # Объект, добавленный в бакет в обход API, виден после перестроения
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key="NFT/6.json", Body='{"tokenId": 6, "owner": "0xC"}')
+    r = client.post("/nft/catalog/rebuild")
+    assert r.status_code == 200
+    assert r.json()["count"] == 2
+    assert [n["tokenId"] for n in client.get("/nft").json()] == [5, 6]
+    assert client.get("/nft/6").json()["owner"] == "0xC"
+
+    # ETag одной записи одинаков из каталога и напрямую из S3 (каталог не загружен)
+    etag = client.get("/nft/5").headers["etag"]
+    assert etag == mock_s3_client.etag(mock_s3_client._storage[(BUCKET_NAME, "NFT/5.json")])
+    main_module.nft_catalog.reset()
+    assert client.get("/nft/5", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/nft/catalog/rebuild")
+    assert client.get("/nft/5", headers={"If-None-Match": etag}).status_code == 304
+
+def test_nft_catalog_checkpoint_revalidates_by_etag(client, mock_s3_client, monkeypatch):
+    import json
+
+    def nft(token_id, owner):
+        return {"tokenId": token_id, "itemType": "Vest", "rarity": 1, "bonus": {"value": 1},
+                "image": "x", "uri": f"ipfs://{token_id}", "owner": owner}
+
+    monkeypatch.setattr(main_module.nft_catalog, "checkpoint_every", 3)
+    for token_id in (1, 2, 3):
+        client.post("/nft/save", json=nft(token_id, "0xA"))
+    main_module.write_back.flush_all()
+    checkpoint_key = (BUCKET_NAME, main_module.NFT_CATALOG_KEY)
+    checkpoint = json.loads(mock_s3_client._storage[checkpoint_key])
+    assert sorted(checkpoint["etags"]) == ["NFT/1.json", "NFT/2.json", "NFT/3.json"]
+
+    # Меньше checkpoint_every изменений — контрольная точка не переписывается
+    client.post("/nft/save", json=nft(2, "0xB"))
+    main_module.write_back.flush_all()
+    assert json.loads(mock_s3_client._storage[checkpoint_key]) == checkpoint
+
+    # Новый процесс с устаревшей контрольной точкой: перечитывается только изменённый объект
+    reads = []
+    original_get = mock_s3_client.get_object
+    def counted_get(Bucket, Key, **kwargs):
+        reads.append(Key)
+        return original_get(Bucket, Key, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "get_object", counted_get)
+    main_module.nft_catalog.reset()
+    assert [n["owner"] for n in client.get("/nft").json()] == ["0xA", "0xB", "0xA"]
+    assert reads == [main_module.NFT_CATALOG_KEY, "NFT/2.json"]
+    main_module.write_back.flush_all()
+    owners = {n["tokenId"]: n["owner"] for n in json.loads(mock_s3_client._storage[checkpoint_key])["nfts"]}
+    assert owners == {1: "0xA", 2: "0xB", 3: "0xA"}
+
+    # Контрольная точка другого воркера с большей версией не затирается
+    newer = dict(json.loads(mock_s3_client._storage[checkpoint_key]), version=10 ** 6)
+    mock_s3_client._storage[checkpoint_key] = json.dumps(newer).encode("utf-8")
+    for token_id in (4, 5, 6):
+        client.post("/nft/save", json=nft(token_id, "0xA"))
+    main_module.write_back.flush_all()
+    assert json.loads(mock_s3_client._storage[checkpoint_key]) == newer
+
+def test_nft_query_filters_sorts_and_paginates(client):
+    item_types = ["Lamp", "Vest", "Boots"]
+    for token_id in range(1, 31):
+        client.post("/nft/save", json={
+            "tokenId": token_id, "itemType": item_types[token_id % 3], "rarity": token_id % 4 + 1,
+            "bonus": {"value": (token_id * 7) % 31}, "image": "x", "uri": f"ipfs://{token_id}",
+            "owner": "0xA" if token_id % 2 else "0xB",
+        })
+    all_nfts = client.get("/nft").json()
+    assert isinstance(all_nfts, list) and len(all_nfts) == 30  # без параметров — прежний ответ
+
+    def collect(**params):
+        items, cursor = [], None
+        while True:
+            query = dict(params, limit=4, **({"cursor": cursor} if cursor else {}))
+            r = client.get("/nft", params=query)
+            assert r.status_code == 200
+            items += r.json()["items"]
+            cursor = r.json()["next_cursor"]
+            if cursor is None:
+                return items
+
+    # Владелец без учёта регистра + тип + диапазон бонуса, сортировка по бонусу по убыванию
+    got = collect(owner="0xa", itemType="Lamp", min_bonus=5, max_bonus=25, sort="-bonus")
+    expected = sorted(
+        (n for n in all_nfts if n["owner"] == "0xA" and n["itemType"] == "Lamp" and 5 <= n["bonus"]["value"] <= 25),
+        key=lambda n: (n["bonus"]["value"], n["tokenId"]), reverse=True,
+    )
+    assert got == expected and got
+
+    # Только диапазон — обход отсортированного индекса без кандидатов
+    got = collect(min_bonus=10, sort="rarity")
+    expected = sorted(
+        (n for n in all_nfts if n["bonus"]["value"] >= 10), key=lambda n: (n["rarity"], n["tokenId"])
+    )
+    assert got == expected
+
+    # Смена владельца обновляет индексы
+    moved = dict(all_nfts[0], owner="0xC")
+    client.post("/nft/save", json=moved)
+    assert [n["tokenId"] for n in collect(owner="0xC")] == [moved["tokenId"]]
+    assert moved["tokenId"] not in [n["tokenId"] for n in collect(owner="0xA")]
+
+    assert client.get("/nft", params={"sort": "price"}).status_code == 400
+    assert client.get("/nft", params={"cursor": "???"}).status_code == 400
+    # Курсор правильной формы, но с чужими типами — тоже 400, а не 500
+    import base64
+    import json
+    for position in ([None, None], [1], ["1", 2], [1, 2.5], {"a": 1}, [True, 2]):
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        assert client.get("/nft", params={"cursor": cursor}).status_code == 400
+        assert client.get("/nft", params={"cursor": cursor, "sort": "-bonus"}).status_code == 400
+    assert client.get("/nft", params={"limit": 0}).status_code == 422
+
+# === Локальный HTTP-сервер метаданных для прокси ===
+class MetadataServer:
+    def __init__(self, delay=0.0):
+        import http.server
+        import threading
+
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                import time
+
+                server.requests.append((self.path, self.headers.get("If-None-Match")))
+                time.sleep(delay)
+                if self.path.startswith("/big"):
+                    body = b'{"data": "' + b"x" * 4096 + b'"}'
+                    headers = {}
+                elif self.path.startswith("/revalidate"):
+                    if self.headers.get("If-None-Match") == '"v1"':
+                        self.send_response(304)
+                        self.send_header("ETag", '"v1"')
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    body = b'{"name": "gem"}'
+                    headers = {"ETag": '"v1"', "Cache-Control": "max-age=0"}
+                elif self.path.startswith("/slow-body"):
+                    # Заголовки сразу, тело по байту: каждая пауза меньше таймаута чтения
+                    body = b'{"data": "' + b"x" * 40 + b'"}'
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    try:
+                        for i in range(len(body)):
+                            self.wfile.write(body[i:i + 1])
+                            self.wfile.flush()
+                            time.sleep(0.05)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    return
+                elif self.path.startswith("/missing"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                else:
+                    body = ('{"path": "%s"}' % self.path).encode("utf-8")
+                    headers = {"Cache-Control": "max-age=60"}
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def metadata_server(monkeypatch):
+    monkeypatch.setattr(main_module.metadata_proxy, "transport", None)
+    main_module.metadata_proxy.clear()
+    server = MetadataServer(delay=0.05)
+    yield server
+    server.close()
+
+def test_metadata_proxy_caches_and_revalidates(client, metadata_server):
+    url = f"{metadata_server.url}/token/1.json"
+    for _ in range(3):
+        r = client.get("/metadata-proxy/", params={"url": url})
+        assert r.status_code == 200
+        assert r.json() == {"path": "/token/1.json"}
+    assert len(metadata_server.requests) == 1  # max-age=60 → дальше из кэша
+
+    # max-age=0 + ETag → повторные запросы условные, сервер отвечает 304
+    url = f"{metadata_server.url}/revalidate"
+    for _ in range(3):
+        assert client.get("/metadata-proxy/", params={"url": url}).json() == {"name": "gem"}
+    conditional = [inm for path, inm in metadata_server.requests if path == "/revalidate"]
+    assert conditional == [None, '"v1"', '"v1"']
+    assert main_module.metadata_proxy.stats()["not_modified"] == 2
+
+def test_metadata_proxy_batch_coalesces_and_limits(client, metadata_server, monkeypatch):
+    import time
+
+    monkeypatch.setattr(main_module.metadata_proxy, "max_response_bytes", 1024)
+    urls = [f"{metadata_server.url}/token/{i % 10}.json" for i in range(50)]
+    urls += [f"{metadata_server.url}/big", f"{metadata_server.url}/missing", "ipfs://abc"]
+    # Первый запрос создаёт пул соединений (SSL-контекст и т.п.) — не замеряем
+    client.get("/metadata-proxy/", params={"url": f"{metadata_server.url}/warmup"})
+
+    start = time.perf_counter()
+    r = client.post("/metadata-proxy/batch", json={"urls": urls})
+    elapsed = time.perf_counter() - start
+
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [res["url"] for res in results] == urls
+    assert all(res["status"] == "ok" for res in results[:50])
+    assert results[7]["data"] == {"path": "/token/7.json"}
+    assert [res["status"] for res in results[50:]] == ["error"] * 3
+    # 10 разных URL → 10 загрузок, одновременные запросы одного URL склеены
+    assert len([p for p, _ in metadata_server.requests if p.startswith("/token/")]) == 10
+    assert main_module.metadata_proxy.stats()["coalesced"] > 0
+    # Параллельно, а не 12 × 50 мс подряд
+    assert elapsed < 0.5
+
+    too_many = {"urls": [f"{metadata_server.url}/{i}" for i in range(main_module.MAX_METADATA_BATCH + 1)]}
+    assert client.post("/metadata-proxy/batch", json=too_many).status_code == 413
+
+def test_metadata_proxy_timeout(client, metadata_server, monkeypatch):
+    monkeypatch.setattr(main_module.metadata_proxy, "timeout", 0.01)
+    main_module.metadata_proxy.clear()
+    r = client.get("/metadata-proxy/", params={"url": f"{metadata_server.url}/token/1.json"})
+    assert r.status_code == 504
+
+    # Медленное тело: таймаут — на всю загрузку, а не на каждое чтение
+    import time
+    monkeypatch.setattr(main_module.metadata_proxy, "timeout", 0.3)
+    main_module.metadata_proxy.clear()
+    start = time.perf_counter()
+    r = client.get("/metadata-proxy/", params={"url": f"{metadata_server.url}/slow-body"})
+    assert r.status_code == 504
+    assert time.perf_counter() - start < 1.0
+
+def test_marketplace_view_enriches_listings_in_one_call(client, monkeypatch):
+    client.post("/nft/save", json={
+        "tokenId": 1, "itemType": "Lamp", "rarity": 3, "bonus": {"value": 12},
+        "image": "lamp.png", "uri": "ipfs://1", "owner": "0xA",
+    })
+
+    def handler(request):
+        if request.url.path == "/2.json":
+            return httpx.Response(200, json={"itemType": "Vest", "rarity": 2, "bonus": {"value": 5}, "image": "vest.png"})
+        return httpx.Response(404)
+    monkeypatch.setattr(main_module.metadata_proxy, "transport", httpx.MockTransport(handler))
+    main_module.metadata_proxy.clear()
+
+    model_calls = []
+    active = main_module.model_registry.active
+    original_predict = active.model.predict
+    def counted_predict(rows):
+        model_calls.append(len(rows))
+        return original_predict(rows)
+    monkeypatch.setattr(active.model, "predict", counted_predict)
+    main_module.prediction_cache.clear()
+
+    r = client.post("/marketplace/view", json={"listings": [
+        {"tokenId": 1, "price": 10000},
+        {"tokenId": 2, "uri": "http://meta.test/2.json", "price": 50, "owner": "0xB"},
+        {"tokenId": 3, "uri": "http://meta.test/3.json"},
+    ]})
+    assert r.status_code == 200
+    lamp, vest, missing = r.json()["listings"]
+
+    assert lamp["status"] == "ok" and lamp["itemType"] == "Lamp" and lamp["owner"] == "0xA"
+    expected = client.post("/predict-price", json={
+        "itemType": "Lamp", "rarity": "Epic", "bonusValue": 12, "price": 10000
+    }).json()
+    assert lamp["recommended_price"] == expected["recommended_price"]
+    assert lamp["price_status"] == expected["price_status"]
+
+    assert vest["status"] == "ok" and vest["image"] == "vest.png" and vest["owner"] == "0xB"
+    assert missing["status"] == "error"
+    # Оценка цены — один вызов модели на оба найденных листинга
+    assert model_calls[0] == 2
+
+def test_marketplace_view_isolates_malformed_listing(client, monkeypatch):
+    def handler(request):
+        if request.url.path == "/bad.json":
+            return httpx.Response(200, json={"itemType": "Vest", "rarity": 2, "bonus": {"value": "abc"}})
+        return httpx.Response(200, json={"itemType": "Lamp", "rarity": "2", "bonus": {"value": 5}})
+    monkeypatch.setattr(main_module.metadata_proxy, "transport", httpx.MockTransport(handler))
+    main_module.metadata_proxy.clear()
+
+    r = client.post("/marketplace/view", json={"listings": [
+        {"tokenId": 10, "uri": "http://meta.test/good.json", "price": 50},
+        {"tokenId": 11, "uri": "http://meta.test/bad.json", "price": 50},
+    ]})
+    assert r.status_code == 200
+    good, bad = r.json()["listings"]
+    assert bad["status"] == "error" and bad["tokenId"] == 11
+    assert good["status"] == "ok"
+    # Строковая редкость "2" — Rare, как в rarityMap фронтенда
+    expected = client.post("/predict-price", json={
+        "itemType": "Lamp", "rarity": "Rare", "bonusValue": 5, "price": 50
+    }).json()
+    assert good["recommended_price"] == expected["recommended_price"]
+    assert main_module.listing_rarity("epic") == "Epic"
+    assert main_module.listing_rarity(7) == main_module.listing_rarity(True) == "Common"
+
+def test_inventory_mutations_append_to_log_and_compact(client, mock_s3_client, monkeypatch):
+    import json
+
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    monkeypatch.setattr(main_module, "INVENTORY_COMPACT_SEGMENTS", 4)
+    address = "0xlog"
+    # Старый формат снимка — просто список предметов
+    legacy = [{"id": f"old{i}", "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}} for i in range(500)]
+    mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{INVENTORY_PREFIX}{address}.json", Body=json.dumps(legacy))
+    snapshot_size = len(mock_s3_client._storage[(BUCKET_NAME, f"{INVENTORY_PREFIX}{address}.json")])
+
+    written = []
+    original_put = mock_s3_client.put_object
+    def counted_put(Bucket, Key, Body, **kwargs):
+        written.append((Key, len(Body)))
+        return original_put(Bucket, Key, Body, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "put_object", counted_put)
+
+    item = {"id": "new1", "type": "Vest", "rarity": "Rare", "image": "x", "attributes": {"bonus": 3}}
+    assert client.post(f"/inventory/{address}", json=item).status_code == 200
+    # Изменение — один маленький сегмент журнала, а не весь инвентарь
+    assert [key for key, _ in written] == [f"inventory_log/{address}/000000000001.json"]
+    assert written[0][1] < 200 < snapshot_size
+
+    assert client.delete(f"/inventory/{address}/old0").status_code == 200
+    assert client.delete(f"/inventory/{address}/old0").status_code == 404
+    for i in range(1, 3):
+        client.delete(f"/inventory/{address}/old{i}")
+    # Четвёртый сегмент → свёртка в снимок
+    snapshot = json.loads(mock_s3_client._storage[(BUCKET_NAME, f"{INVENTORY_PREFIX}{address}.json")])
+    assert snapshot["seq"] == 4 and len(snapshot["items"]) == 498
+
+    # Ещё изменения после снимка, затем «новый процесс»: снимок + хвост журнала
+    client.delete(f"/inventory/{address}/old3")
+    client.post(f"/inventory/{address}", json=dict(item, id="new2"))
+    expected = [i["id"] for i in client.get(f"/inventory/{address}").json()]
+
+    reads = []
+    original_get = mock_s3_client.get_object
+    def counted_get(Bucket, Key):
+        reads.append(Key)
+        return original_get(Bucket, Key)
+    monkeypatch.setattr(mock_s3_client, "get_object", counted_get)
+    user_inventory.clear()
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == expected
+    assert "old3" not in expected and expected[-2:] == ["new1", "new2"]
+    # Сегменты, вошедшие в снимок, не читаются
+    assert reads == [
+        f"{INVENTORY_PREFIX}{address}.json",
+        f"inventory_log/{address}/000000000005.json",
+        f"inventory_log/{address}/000000000006.json",
+    ]
+
+def test_compaction_prunes_log_segments_of_previous_snapshot(client, mock_s3_client, monkeypatch):
+    import json
+
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    monkeypatch.setattr(main_module, "INVENTORY_COMPACT_SEGMENTS", 4)
+    address = "0xprune"
+
+    def log_numbers():
+        prefix = f"inventory_log/{address}/"
+        return sorted(int(k[len(prefix):-5]) for (_, k) in mock_s3_client._storage if k.startswith(prefix))
+
+    for i in range(30):
+        client.post(f"/inventory/{address}", json={"id": f"i{i}", "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}})
+    snapshot = json.loads(mock_s3_client._storage[(BUCKET_NAME, f"{INVENTORY_PREFIX}{address}.json")])
+    assert snapshot["seq"] == 28
+    # Остались сегменты последнего снимка и хвост после него, журнал не растёт
+    assert log_numbers() == list(range(25, 31))
+
+    expected = [i["id"] for i in client.get(f"/inventory/{address}").json()]
+    user_inventory.clear()
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == expected == [f"i{i}" for i in range(30)]
+
+    # Хвост, прочитанный после старого снимка, уже удалён — загрузка перечитывает снимок
+    stale = json.dumps({"seq": 20, "items": []})
+    fresh = mock_s3_client._storage[(BUCKET_NAME, f"{INVENTORY_PREFIX}{address}.json")]
+    snapshots = iter([stale.encode("utf-8"), fresh])
+    original_get = mock_s3_client.get_object
+    def racing_get(Bucket, Key, **kwargs):
+        if Key.startswith(INVENTORY_PREFIX):
+            return {"Body": io.BytesIO(next(snapshots)), "ETag": '"old"'}
+        return original_get(Bucket, Key, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "get_object", racing_get)
+    user_inventory.clear()
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == expected
+
+def test_inventory_batch_is_atomic_and_writes_once(client, mock_s3_client, monkeypatch):
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    address = "0xBATCH"
+
+    def item(item_id):
+        return {"id": item_id, "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}}
+
+    for i in range(3):
+        client.post(f"/inventory/{address}", json=item(f"i{i}"))
+
+    puts = []
+    original_put = mock_s3_client.put_object
+    def counted_put(Bucket, Key, Body, **kwargs):
+        puts.append(Key)
+        return original_put(Bucket, Key, Body, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "put_object", counted_put)
+
+    # Ошибка в одном элементе → весь пакет отклонён, ничего не записано
+    r = client.post(f"/inventory/{address}/batch", json={
+        "remove": ["i0", "missing"], "add": [item("n1"), item("n1"), item("i1")],
+    })
+    assert r.status_code == 400
+    statuses = [(res["id"], res["status"]) for res in r.json()["detail"]["results"]]
+    assert statuses == [("i0", "ok"), ("missing", "error"), ("n1", "ok"), ("n1", "error"), ("i1", "error")]
+    assert puts == []
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == ["i0", "i1", "i2"]
+
+    # Удаление и повторное добавление того же id в одном пакете допустимо
+    r = client.post(f"/inventory/{address}/batch", json={
+        "remove": ["i0", "i1"], "add": [item("i1"), item("n1"), item("n2")],
+    })
+    assert r.status_code == 200
+    assert r.json()["added"] == 3 and r.json()["removed"] == 2
+    assert len(puts) == 1  # одна запись в S3 на весь пакет
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == ["i2", "i1", "n1", "n2"]
+
+    user_inventory.clear()
+    assert [i["id"] for i in client.get(f"/inventory/{address}").json()] == ["i2", "i1", "n1", "n2"]
+
+    too_many = {"remove": [f"x{i}" for i in range(main_module.MAX_INVENTORY_BATCH + 1)]}
+    assert client.post(f"/inventory/{address}/batch", json=too_many).status_code == 413
+
+def test_concurrent_writers_do_not_lose_updates(client, mock_s3_client, monkeypatch):
+    import asyncio
+    import json
+    import threading
+    import time
+    from backend.inventory_log import Inventory
+
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    address = "0xcontended"
+    client.post("/profile/", json={"address": address, "nickname": "start", "local_gems": 0})
+    client.get(f"/inventory/{address}")
+
+    def item(item_id):
+        return {"id": item_id, "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}}
+
+    # Задержка записи, чтобы воркеры чаще пересекались
+    original_put = mock_s3_client.put_object
+    def slow_put(*args, **kwargs):
+        time.sleep(0.002)
+        return original_put(*args, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "put_object", slow_put)
+
+    # «Другой воркер»: свой экземпляр инвентаря и своё чтение-изменение-запись профиля
+    def other_worker():
+        inventory = Inventory()
+        for i in range(40):
+            segment = inventory.add(main_module.Item(**item(f"b{i}")))
+            main_module.inventory_writer(address, inventory, segment)(None, segment.serialize())
+
+            key = main_module.profile_key(address)
+            data, etag = main_module.storage.get_bytes_versioned(key)
+            def rebase(remote, etag):
+                return json.dumps(dict(json.loads(remote), created_at=f"b{i}"))
+            main_module.storage.put_conditional(key, rebase(data, etag), etag, rebase)
+
+    async def this_worker():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            adds = [ac.post(f"/inventory/{address}", json=item(f"a{i}")) for i in range(40)]
+            patches = [ac.patch(f"/profile/{address}", json={"local_gems": i}) for i in range(1, 41)]
+            responses = await asyncio.gather(*adds, *patches)
+        assert all(r.status_code == 200 for r in responses)
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    asyncio.run(this_worker())
+    thread.join()
+
+    # Всё, что записали оба воркера, есть в S3
+    user_inventory.clear()
+    user_profiles.clear()
+    ids = {i["id"] for i in client.get(f"/inventory/{address}").json()}
+    assert ids == {f"a{i}" for i in range(40)} | {f"b{i}" for i in range(40)}
+    profile = client.get(f"/profile/{address}").json()
+    assert profile["local_gems"] == 40
+    assert profile["created_at"] == "b39"
+    assert profile["nickname"] == "start"
+
+
+# === Несколько воркеров: общий бакет и канал инвалидации ===
+WORKER_SCRIPT = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import uvicorn
+from test_api import DirS3
+import backend.main as main_module
+main_module.s3 = DirS3(sys.argv[2])
+uvicorn.run(main_module.app, host="127.0.0.1", port=int(sys.argv[3]), log_level="warning")
+"""
+
+def eventually(check, timeout=10.0):
+    import time
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = check()
+            if result:
+                return result
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            return check()
+        time.sleep(0.05)
+
+def test_workers_stay_coherent_through_invalidation_bus(tmp_path):
+    import socket
+    import subprocess
+
+    bucket_dir = tmp_path / "s3"
+    bucket_dir.mkdir()
+    env = dict(
+        os.environ,
+        S3_BUCKET_NAME=BUCKET_NAME,
+        SHARED_STATE_BUS=f"unix://{tmp_path / 'bus'}",
+        WRITE_BACK_DELAY="0",
+        PRICE_CACHE_PREWARM="0",
+    )
+    workers, ports = [], []
+    try:
+        for _ in range(2):
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+            workers.append(subprocess.Popen(
+                [sys.executable, "-c", WORKER_SCRIPT, os.path.dirname(__file__), str(bucket_dir), str(port)],
+                env=env,
+            ))
+            ports.append(port)
+        a, b = (httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10) for port in ports)
+        for worker in (a, b):
+            assert eventually(lambda: worker.get("/").status_code == 200, timeout=90)
+        address = "0xshared"
+
+        # Профиль: B закэшировал, A изменил — B видит новое значение
+        a.post("/profile/", json={"address": address, "nickname": "one"})
+        assert b.get(f"/profile/{address}").json()["nickname"] == "one"
+        a.patch(f"/profile/{address}", json={"nickname": "two"})
+        assert eventually(lambda: b.get(f"/profile/{address}").json()["nickname"] == "two")
+
+        # Инвентарь: изменения в обе стороны
+        assert b.get(f"/inventory/{address}").json() == []
+        item = {"id": "shared-1", "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}}
+        assert a.post(f"/inventory/{address}", json=item).status_code == 200
+        assert eventually(lambda: [i["id"] for i in b.get(f"/inventory/{address}").json()] == ["shared-1"])
+        assert b.delete(f"/inventory/{address}/shared-1").status_code == 200
+        assert eventually(lambda: a.get(f"/inventory/{address}").json() == [])
+
+        # Цены продажи и каталог NFT
+        b.post("/sell-prices", json={"rare": 33})
+        assert eventually(lambda: a.get("/sell-prices").json()["rare"] == 33)
+        nft = {"tokenId": 501, "itemType": "Lamp", "rarity": 1, "bonus": {"flatPowerBonus": 2},
+               "image": "x", "uri": "ipfs://501", "owner": "0xshared"}
+        assert b.get("/nft").json() == []
+        a.post("/nft/save", json=nft)
+        assert eventually(lambda: [n["tokenId"] for n in b.get("/nft").json()] == [501])
+
+        stats = b.get("/cache/stats").json()["invalidation"]
+        assert stats["bus"] == "unix" and stats["received"] >= 3 and stats["published"] >= 2
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait(timeout=30)
+
+# === Потоковые ответы NDJSON ===
+async def stream_asgi(path, query="", headers=(), on_chunk=None):
+    # Прямой вызов ASGI-приложения: куски тела не накапливаются, как в TestClient
+    import asyncio
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    result = {"status": None, "content_type": None, "lines": 0, "bytes": 0}
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["content_type"] = dict(message["headers"]).get(b"content-type", b"").decode()
+        elif message["type"] == "http.response.body" and message.get("body"):
+            body = message["body"]
+            result["lines"] += body.count(b"\n")
+            result["bytes"] += len(body)
+            if on_chunk is not None:
+                await on_chunk(body, result)
+
+    await app(scope, receive, send)
+    return result
+
+def test_ndjson_streaming_memory_and_backpressure(client, mock_s3_client, monkeypatch):
+    import asyncio
+    import json
+    import tracemalloc
+
+    count = 50_000
+    # Прогрев: ленивые импорты первого потокового ответа не должны попасть в замер
+    mock_s3_client._storage[(BUCKET_NAME, f"{PROFILE_PREFIX}0x.json")] = b'{"address": "0x"}'
+    assert asyncio.run(stream_asgi("/profiles", query="stream=1"))["lines"] == 1
+    del mock_s3_client._storage[(BUCKET_NAME, f"{PROFILE_PREFIX}0x.json")]
+    for i in range(count):
+        address = f"0x{i:08x}"
+        mock_s3_client._storage[(BUCKET_NAME, f"{PROFILE_PREFIX}{address}.json")] = json.dumps(
+            {"address": address, "nickname": f"player {i}", "local_gems": i}
+        ).encode()
+    nfts = [{"tokenId": t, "itemType": "Lamp", "rarity": t % 4, "bonus": {"flatPowerBonus": t % 35},
+             "image": "x", "uri": f"ipfs://{t}", "owner": "0xowner"} for t in range(count)]
+    for nft in nfts:
+        mock_s3_client._storage[(BUCKET_NAME, f"NFT/{nft['tokenId']}.json")] = b"{}"
+    # Контрольная точка с ETag объектов совпадает с бакетом — объекты NFT не перечитываются
+    etags = {f"NFT/{nft['tokenId']}.json": DummyS3.etag(b"{}") for nft in nfts}
+    mock_s3_client._storage[(BUCKET_NAME, main_module.NFT_CATALOG_KEY)] = json.dumps(
+        {"version": 1, "nfts": nfts, "etags": etags}
+    ).encode()
+    del etags
+    del nfts
+    assert client.get("/nft/catalog").json()["count"] == 0
+    client.get("/nft", params={"limit": 1})
+
+    # Обычный ответ — готовый список целиком; поток должен обходиться намного меньшим
+    window = main_module.S3_FETCH_CONCURRENCY
+    reads = [0]  # счётчик, а не список: сам замер не должен расти с числом объектов
+    original_get = mock_s3_client.get_object
+    def counting_get(Bucket, Key, **kwargs):
+        if Key.startswith(PROFILE_PREFIX):
+            reads[0] += 1
+        return original_get(Bucket, Key, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "get_object", counting_get)
+
+    # Медленный клиент: чтение из S3 не убегает вперёд больше чем на окно конвейера
+    async def slow_consumer(body, result):
+        if result["lines"] < 3000:
+            await asyncio.sleep(0.02)
+        assert reads[0] <= result["lines"] + window
+
+    tracemalloc.start()
+    try:
+        profiles = asyncio.run(stream_asgi("/profiles", headers=[("accept", "application/x-ndjson")], on_chunk=slow_consumer))
+        _, profiles_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        nft = asyncio.run(stream_asgi("/nft", query="stream=1"))
+        _, nft_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert profiles["status"] == 200 and profiles["content_type"] == "application/x-ndjson"
+    assert profiles["lines"] == count and reads[0] == count
+    assert nft["status"] == 200 and nft["lines"] == count
+    # Целиком ответы заняли бы 4+ и 6+ МБ. В пике потока профилей ~1.2 МБ — копии
+    # списка ключей в DummyS3.list_objects_v2 на каждую страницу листинга
+    assert profiles["bytes"] > 4_000_000 and nft["bytes"] > 6_000_000
+    assert profiles_peak < 2_500_000, profiles_peak
+    assert nft_peak < 1_000_000, nft_peak
+    assert len(main_module.profile_listing_cache) == 0
+
+    # Фильтры и ошибки — как у обычного /nft
+    lines = client.get("/nft", params={"stream": "1", "rarity": 2, "sort": "-tokenId"}).text.splitlines()
+    assert len(lines) == count // 4 and json.loads(lines[0])["tokenId"] == count - 2
+    assert client.get("/nft", params={"stream": "1", "sort": "price"}).status_code == 400
+
+# === Условные GET: опрос клиентами ===
+def test_polling_clients_get_304_until_data_changes(client, mock_s3_client, monkeypatch):
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    main_module.conditional_gets.clear()
+    address = "0xpoller"
+    item = {"id": "p0", "type": "Lamp", "rarity": "Common", "image": "x", "attributes": {}}
+    client.post("/profile/", json={"address": address, "nickname": "poll", "local_gems": 0})
+    client.post(f"/inventory/{address}", json=item)
+    for t in range(3):
+        client.post("/nft/save", json={"tokenId": 700 + t, "itemType": "Lamp", "rarity": 1, "bonus": {"value": t},
+                                       "image": "x", "uri": "u", "owner": address})
+
+    urls = [f"/inventory/{address}", f"/profile/{address}", "/nft", "/nft/701", f"/nft?owner={address}&sort=-bonus"]
+    etags, bodies = {}, {}
+    polls, full = 0, 0
+    # Как GameScreen: опрос каждые «тик»; каждые 25 тиков что-то меняется
+    for tick in range(100):
+        if tick and tick % 25 == 0:
+            client.patch(f"/profile/{address}", json={"local_gems": tick})
+            client.post(f"/inventory/{address}", json=dict(item, id=f"p{tick}"))
+            client.post("/nft/save", json={"tokenId": 701, "itemType": "Lamp", "rarity": 2, "bonus": {"value": tick},
+                                           "image": "x", "uri": "u", "owner": address})
+        for url in urls:
+            headers = {"If-None-Match": etags[url]} if url in etags else {}
+            r = client.get(url, headers=headers)
+            polls += 1
+            assert r.headers["etag"] and r.headers["cache-control"] == "no-cache"
+            if r.status_code == 304:
+                assert r.content == b"" and r.headers["etag"] == etags[url]
+                continue
+            assert r.status_code == 200
+            full += 1
+            etags[url], bodies[url] = r.headers["etag"], r.json()
+
+    # Полные ответы — только первый опрос и опросы после каждого из трёх изменений
+    assert full == len(urls) * 4
+    assert 1 - full / polls >= 0.95
+    assert bodies[f"/profile/{address}"]["local_gems"] == 75
+    assert len(bodies[f"/inventory/{address}"]) == 4
+    assert bodies["/nft/701"]["bonus"] == {"value": 75}
+    assert bodies[f"/nft?owner={address}&sort=-bonus"]["items"][0]["tokenId"] == 701
+
+    stats = client.get("/cache/stats").json()["conditional"]
+    for route in ("inventory", "profile", "nft", "nft_token", "nft_query"):
+        assert stats[route]["full"] == 4 and stats[route]["hit_rate"] == 0.96
+
+    # ETag зависит только от содержимого: другой процесс с теми же данными выдаст тот же
+    etag = etags[f"/inventory/{address}"]
+    user_inventory.clear()
+    assert client.get(f"/inventory/{address}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/inventory/{address}", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+
+# === Шторм входов: одна загрузка на адрес ===
+def test_login_storm_loads_each_address_once(client, mock_s3_client, monkeypatch):
+    import asyncio
+    import json
+    import time
+    from collections import Counter
+
+    monkeypatch.setattr(main_module.write_back, "delay", 0)
+    players = 60
+    existing = [f"0xold{i}" for i in range(players // 2)]
+    new = [f"0xnew{i}" for i in range(players // 2)]
+    for address in existing:
+        mock_s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{PROFILE_PREFIX}{address}.json",
+                                  Body=json.dumps({"address": address, "nickname": "old", "local_gems": 1}))
+
+    calls = Counter()
+    original_get, original_list = mock_s3_client.get_object, mock_s3_client.list_objects_v2
+    def counting_get(Bucket, Key, **kwargs):
+        calls["get " + Key.split("/")[0]] += 1
+        time.sleep(0.005)  # задержка S3: запросы одного игрока успевают пересечься
+        return original_get(Bucket, Key, **kwargs)
+    def counting_list(Bucket, Prefix, **kwargs):
+        calls["list " + Prefix.split("/")[0]] += 1
+        return original_list(Bucket, Prefix, **kwargs)
+    monkeypatch.setattr(mock_s3_client, "get_object", counting_get)
+    monkeypatch.setattr(mock_s3_client, "list_objects_v2", counting_list)
+
+    async def login(ac, address):
+        # Как GameScreen при входе: профиль, инвентарь и начисление гемов — одновременно, и ещё опрос
+        return await asyncio.gather(
+            ac.get(f"/profile/{address}"),
+            ac.get(f"/inventory/{address}"),
+            ac.patch(f"/profile/{address}", json={"local_gems": 5}),
+            ac.get(f"/profile/{address}"),
+            ac.get(f"/inventory/{address}"),
+            ac.get(f"/profile/{address}"),
+        )
+
+    async def storm():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            results = await asyncio.gather(*(login(ac, a) for a in existing + new))
+            # Вне эндпойнтов (без блокировки адреса) одновременные промахи тоже сливаются в одну загрузку
+            user_profiles.invalidate(existing[0])
+            loaded = await asyncio.gather(*(main_module.get_user_profile(existing[0]) for _ in range(20)))
+            return results, loaded
+
+    results, loaded = asyncio.run(storm())
+    for address, responses in zip(existing + new, results):
+        expected = 200 if address in existing else 404
+        assert [r.status_code for r in responses[:1] + responses[2:4] + responses[5:]] == [expected] * 4
+        assert responses[1].status_code == 200 and responses[4].status_code == 200
+    assert len({id(p) for p in loaded}) == 1 and loaded[0].local_gems == 5
+
+    # По одному чтению профиля и снимка инвентаря и одному листингу журнала на игрока;
+    # отсутствующие профили не перечитываются (запомненный NoSuchKey)
+    assert calls["get profiles"] == players + 1
+    assert calls["get inventories"] == players
+    assert calls["list inventory_log"] == players
+    stats = client.get("/cache/stats").json()["loads"]["profiles"]
+    assert stats["negative_hits"] == 3 * len(new) and stats["coalesced"] == 19
+
+    # Профиль создан — запомненный промах забыт
+    client.post("/profile/", json={"address": new[0], "nickname": "fresh"})
+    assert client.get(f"/profile/{new[0]}").json()["nickname"] == "fresh"
+
+
+def test_import_is_lazy_and_ready_waits_for_warmup(client, monkeypatch):
+    import subprocess
+    import threading
+
+    # Импорт модуля не грузит модель и не тянет boto3/numpy/pandas/joblib
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    probe = (
+        "import sys, backend.main as m; "
+        "print(m.model_registry.active is None, m.s3 is None, "
+        "sorted(n for n in ('boto3', 'numpy', 'pandas', 'joblib', 'sklearn') if n in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", probe], cwd=root, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "True True []"
+
+    assert client.get("/health").json() == {"status": "ok"}
+    assert client.get("/ready").status_code == 200
+
+    # Холодный старт: модель ещё грузится — /ready отвечает 503, первый запрос цены ждёт загрузку
+    registry = main_module.model_registry
+    gate = threading.Event()
+    original_loader = registry._loader
+    loads = []
+
+    def slow_loader():
+        gate.wait(timeout=30)
+        loads.append(1)
+        return original_loader()
+
+    monkeypatch.setattr(registry, "_loader", slow_loader)
+    monkeypatch.setattr(registry, "active", None)
+    main_module.warmup_done.clear()
+    warmup = threading.Thread(target=main_module.warm_up_price_model)
+    warmup.start()
+
+    r = client.get("/ready")
+    assert r.status_code == 503
+    assert r.json()["status"] == "starting" and r.json()["model"] is None
+
+    responses = []
+    request = threading.Thread(target=lambda: responses.append(
+        client.post("/predict-price", json={"itemType": "Vest", "rarity": "Rare", "bonusValue": 4})
+    ))
+    request.start()
+    gate.set()
+    warmup.join(timeout=60)
+    request.join(timeout=60)
+
+    assert responses[0].status_code == 200
+    assert loads == [1]  # прогрев и запрос разделили одну загрузку
+    r = client.get("/ready")
+    assert r.status_code == 200
+    assert r.json()["model"] == registry.active.version
+
+
+def test_metrics_endpoint_and_server_timing(client, monkeypatch):
+    from backend.metrics import MetricsMiddleware
+
+    def scrape():
+        r = client.get("/metrics")
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/plain")
+        samples = {}
+        for line in r.text.splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def delta(before, after, name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    before = scrape()
+    address = "0xmetrics"
+    item = {"id": "m1", "type": "Lamp", "rarity": "Rare", "image": "l.png", "attributes": {}}
+    assert client.post(f"/inventory/{address}", json=item).status_code == 200
+    assert client.get(f"/inventory/{address}").status_code == 200
+    assert client.get(f"/profile/{address}").status_code == 404
+    r = client.post("/predict-price", json={"itemType": "Lamp", "rarity": "Rare", "bonusValue": 1000})
+    assert r.status_code == 200
+    main_module.write_back.flush_all()
+    after = scrape()
+
+    # Задержка — по шаблону маршрута, а не по пути
+    route = 'gamegems_http_request_duration_seconds_count{method="GET",route="/inventory/{address}",status="200"}'
+    assert delta(before, after, route) == 1
+    assert delta(before, after, 'gamegems_http_request_duration_seconds_bucket{method="GET",route="/inventory/{address}",status="200",le="+Inf"}') == 1
+    assert not any(address in name for name in after)
+
+    # S3: операции и байты по префиксу ключа
+    assert delta(before, after, 'gamegems_s3_operations_total{operation="get_object",prefix="profiles/",outcome="not_found"}') == 1
+    assert delta(before, after, 'gamegems_s3_operations_total{operation="put_object",prefix="inventory_log/",outcome="ok"}') == 1
+    assert delta(before, after, 'gamegems_s3_bytes_total{direction="write",prefix="inventory_log/"}') > 0
+
+    # Модель и кэши
+    assert delta(before, after, 'gamegems_model_inference_rows_total{backend="ArrayPriceModel"}') == 1
+    assert delta(before, after, 'gamegems_model_inference_seconds_count{backend="ArrayPriceModel"}') == 1
+    assert delta(before, after, 'gamegems_cache_misses_total{cache="predictions"}') == 1
+    assert 'gamegems_cache_hit_ratio{cache="inventory"}' in after
+
+    # Заголовок Server-Timing: s3 и model — внутри общего времени запроса
+    layer = app.middleware_stack
+    while not isinstance(layer, MetricsMiddleware):
+        layer = layer.app
+    monkeypatch.setattr(layer, "server_timing", True)
+    timing = client.get("/profile/0xtiming").headers["server-timing"]
+    assert timing.startswith("s3;dur=") and 'desc="1"' in timing and "app;dur=" in timing
+    timing = client.post("/predict-price", json={"itemType": "Lamp", "rarity": "Rare", "bonusValue": 1001}).headers["server-timing"]
+    assert "model;dur=" in timing
+    monkeypatch.setattr(layer, "server_timing", False)
+    assert "server-timing" not in client.get("/").headers
+
+
+def test_tiered_storage_hot_tier_write_through_and_back(tmp_path):
+    from collections import Counter
+    from backend.tiered_storage import LocalStore, TieredStorage
+    from backend.storage import is_conflict
+
+    class CountingS3(DummyS3):
+        def __init__(self):
+            super().__init__()
+            self.calls = Counter()
+
+        def get_object(self, *args, **kwargs):
+            self.calls["get"] += 1
+            return super().get_object(*args, **kwargs)
+
+        def put_object(self, *args, **kwargs):
+            self.calls["put"] += 1
+            return super().put_object(*args, **kwargs)
+
+        def list_objects_v2(self, *args, **kwargs):
+            self.calls["list"] += 1
+            return super().list_objects_v2(*args, **kwargs)
+
+    s3 = CountingS3()
+    key = "profiles/0xtier.json"
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'{"local_gems": 1}')
+    s3.put_object(Bucket=BUCKET_NAME, Key="NFT/1.json", Body=b'{"tokenId": 1}')
+    s3.calls.clear()
+
+    # through: повторное чтение из SQLite, NFT — мимо горячего уровня
+    through = TieredStorage(LocalStore(str(tmp_path / "through.db")), lambda: s3, BUCKET_NAME)
+    data, etag = through.get_bytes_versioned(key)
+    assert through.get_bytes_versioned(key) == (data, etag)
+    through.get_bytes("NFT/1.json")
+    through.get_bytes("NFT/1.json")
+    assert s3.calls["get"] == 3 and through.stats()["hits"] == 1
+
+    # Запись с другого узла: условная запись по устаревшей копии получает конфликт
+    # в S3, копия сбрасывается, rebase видит чужие данные
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'{"local_gems": 2}')
+    merged = through.put_conditional(key, b'{"local_gems": 10}', etag, lambda data, etag: data + b" ")
+    assert s3._storage[(BUCKET_NAME, key)] == b'{"local_gems": 2} '
+    assert through.get_bytes_versioned(key) == (b'{"local_gems": 2} ', merged)
+
+    # Копия старше ttl перепроверяется условным GET
+    through.ttl = 0
+    gets = s3.calls["get"]
+    assert through.get_bytes(key) == b'{"local_gems": 2} '
+    assert s3.calls["get"] == gets + 1 and through.stats()["revalidations"] == 1
+
+    # back: холодный старт перечитывает горячие префиксы, дальше S3 не нужен до выгрузки
+    path = str(tmp_path / "back.db")
+    back = TieredStorage(LocalStore(path), lambda: s3, BUCKET_NAME, write_mode="back", upload_interval=3600)
+    back.start()
+    assert back.stats()["rehydrated"] == 1
+    s3.calls.clear()
+    data, etag = back.get_bytes_versioned(key)
+    assert data == b'{"local_gems": 2} '
+    assert back.get_bytes("profiles/0xmissing.json") is None
+    with pytest.raises(botocore.exceptions.ClientError) as conflict:
+        back.put_bytes(key, b"{}", IfNoneMatch="*")
+    assert is_conflict(conflict.value)
+    new_etag = back.put_bytes(key, b'{"local_gems": 3}', IfMatch=etag)
+    back.put_bytes("inventory_log/0xtier/000000000001.json", b"[]", IfNoneMatch="*")
+    assert back.list_keys("inventory_log/0xtier/") == ["inventory_log/0xtier/000000000001.json"]
+    assert sum(s3.calls.values()) == 0 and back.stats()["dirty"] == 2
+
+    # «Падение» без остановки: несохранённое переживает перезапуск и уходит в S3 при старте
+    back.local.close()
+    restarted = TieredStorage(LocalStore(path), lambda: s3, BUCKET_NAME, write_mode="back", upload_interval=3600)
+    restarted.start()
+    assert restarted.stats()["rehydrated"] == 0 and restarted.stats()["uploads"] == 2
+    assert restarted.get_bytes_versioned(key) == (b'{"local_gems": 3}', new_etag)
+    assert restarted.stop() == 0
+    assert s3._storage[(BUCKET_NAME, key)] == b'{"local_gems": 3}'
+    assert s3._storage[(BUCKET_NAME, "inventory_log/0xtier/000000000001.json")] == b"[]"
+    assert restarted.stats()["dirty"] == 0
+
+def test_tiered_storage_hot_tier_is_bounded(tmp_path):
+    from backend.tiered_storage import LocalStore, TieredStorage
+
+    s3 = DummyS3()
+    keys = [f"inventory_log/0xlru/{n:012d}.json" for n in range(1, 41)]
+    for key in keys:
+        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'[{"op": "add"}]')
+
+    # through: сверх max_rows вытесняются строки, дольше всех не проверявшиеся в S3
+    through = TieredStorage(LocalStore(str(tmp_path / "lru.db")), lambda: s3, BUCKET_NAME, max_rows=10, trim_every=1)
+    for key in keys:
+        through.get_bytes(key)
+    through.get_bytes(keys[35])  # из SQLite, validated не меняется
+    assert through.local.count() == 10
+    assert [key for key, _ in through.local.list("inventory_log/0xlru/")] == keys[30:]
+    assert through.stats()["evicted"] == 30
+
+    # Лимит по байтам: файл SQLite не растёт сверх max_bytes
+    through.max_rows, through.max_bytes = 0, 64 * 1024
+    for i in range(50):
+        through.put_bytes(f"profiles/0x{i:038x}.json", b"x" * 4096)
+    assert through.local.used_bytes() <= through.max_bytes
+    assert through.local.get("profiles/0x%038x.json" % 49) is not None
+
+    # Удалённые после свёртки сегменты уходят и из S3, и из горячего уровня,
+    # в режиме back — вместе с ещё не выгруженными строками
+    through.delete_keys(keys[30:35])
+    assert all((BUCKET_NAME, key) not in s3._storage for key in keys[30:35])
+    assert all(through.local.get(key) is None for key in keys[30:35])
+    back = TieredStorage(LocalStore(str(tmp_path / "back.db")), lambda: s3, BUCKET_NAME, write_mode="back",
+                         upload_interval=3600, max_rows=1, trim_every=1)
+    back.start()
+    back.put_bytes("inventory_log/0xlru/000000000041.json", b"[]", IfNoneMatch="*")
+    # В режиме back ничего не вытесняется: весь горячий набор из S3 плюс новая строка
+    assert back.local.count() == sum(1 for _, key in s3._storage if back.is_hot(key)) + 1
+    back.delete_keys(keys[35:] + ["inventory_log/0xlru/000000000041.json"])
+    assert back.list_keys("inventory_log/0xlru/") == keys[:30]
+    assert back.stop() == 0
+
+def test_tiered_storage_back_rows_keep_content_type_and_upload_in_through(tmp_path):
+    from backend.tiered_storage import LocalStore, TieredStorage
+
+    class TypedS3(DummyS3):
+        def __init__(self):
+            super().__init__()
+            self.content_types = {}
+
+        def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+            self.content_types[Key] = ContentType
+            return super().put_object(Bucket, Key, Body, **kwargs)
+
+    s3 = TypedS3()
+    key = "profiles/0xtyped.json"
+    s3.put_object(Bucket=BUCKET_NAME, Key="profiles/0xgone.json", Body=b"{}")
+    path = str(tmp_path / "tier.db")
+    back = TieredStorage(LocalStore(path), lambda: s3, BUCKET_NAME, write_mode="back", upload_interval=3600)
+    back.start()
+    back.put_bytes(key, b'{"local_gems": 1}', ContentType="application/json")
+    back.local.close()  # «падение» до выгрузки
+
+    # Тот же файл, но режим through: несохранённое всё равно уходит в S3 при старте, с ContentType
+    through = TieredStorage(LocalStore(path), lambda: s3, BUCKET_NAME)
+    through.start()
+    assert s3._storage[(BUCKET_NAME, key)] == b'{"local_gems": 1}'
+    assert s3.content_types[key] == "application/json"
+    assert through.stats()["dirty"] == 0
+
+    # Пока узел работал в through, S3 менялся в обход файла: следующий запуск в back перечитывает S3
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=b'{"local_gems": 2}')
+    del s3._storage[(BUCKET_NAME, "profiles/0xgone.json")]
+    through.local.close()
+    back = TieredStorage(LocalStore(path), lambda: s3, BUCKET_NAME, write_mode="back", upload_interval=3600)
+    back.start()
+    assert back.get_bytes(key) == b'{"local_gems": 2}'
+    assert back.get_bytes("profiles/0xgone.json") is None
+    back.stop()